@@ -1,12 +1,21 @@
 from datetime import datetime
-from collections import deque
 from enum import Enum
 from typing import Dict
 
+import numpy as np
 import traci
+import traci.constants as tc
 import math
 from traci import TraCIException
 
+import simlog
+from metricstore import MetricColumn, MetricStore
+from snapshot import InfraSnapshot
+from subscription import VehicleSet
+
+log = simlog.getLogger(__name__)
+steplog = simlog.getRateLimitedLogger(__name__)
+
 class Config_SUMO:
     # SUMO Configuration File
     sumocfg_path = "New_TestWay/test_cfg.sumocfg"
@@ -17,6 +26,37 @@ class Config_SUMO:
     route_file = "generated_flows_pm.xml"
     scenario_file_rl = "New_TestWay/test.net_mergy.xml"
     route_file_rl = "New_TestWay/generated_flows_pm.xml"
+    # collect detector/vehicle data through TraCI subscriptions (one batched response per step)
+    use_subscription = True
+    # SUMO binary/options ("sumo" for headless runs), None seed keeps each controller's default
+    sumo_binary = "sumo-gui"
+    sumo_options = ("--start", "--quit-on-end")
+    use_gui = True
+    seed = None
+    max_step = 11700
+    # TraCI connection label, one per run when several simulations share a process pool
+    label = "default"
+    # binary decision log (simlog.EventLog), None disables it
+    event_log = None
+    # per-stage timings and TraCI call counts (profiler.py), optional Chrome trace file
+    profile = False
+    profile_trace = None
+    # TraCI trace file (tracereplay.py): record the run to it, or replay it instead of starting SUMO
+    traci_record = None
+    traci_replay = None
+    # multi-agent RL (runrlmulti.py): policy shared by the traffic signals, per TLS overrides {tls_id: model file}
+    rl_model = "dqn_model_episode_100_min32.zip"
+    rl_agent_models = None
+    # stream the section/total results to <export_path>_<table>.parquet|.csv during the run (export.py)
+    export_path = None
+    export_format = None
+    # advance SUMO to the next controller wake-up with one simulationStep call (RunSimulation), at most
+    # fast_forward_max seconds; the results get one row per jump (interval level, subscription.IntervalCollector).
+    # approximate: the loops miss vehicles changing lanes on them, so the controller inputs and decisions of
+    # the actuated modes differ from a step-by-step run (seed 7, 3000 s: accumulated CO2 +2% Static, +10%
+    # Actuated, +32% ActuatedOCC, +25% ActuatedBOCC, the actuated modes decide differently from their first cycle)
+    fast_forward = False
+    fast_forward_max = 10
 
 class Direction(Enum):
     SB = (0, 4)
@@ -74,18 +114,38 @@ def get_input_station_value(direction: Direction) -> str:
     # Direction의 name으로 InputStation을 찾아서 value를 반환
     return InputStation[direction.name].value
 
+def parse_detector_id(id):
+    # Det_<aux><bound><station><detector>, aux '1': exit detector
+    parts = id.split('_')
+    if len(parts) != 2 or not parts[0].startswith("Det"):
+        raise ValueError(f"Invalid detector ID format: {id}")
+    det_info = parts[1]
+    aux = det_info[0]
+    bound = Direction.from_first_value(int(det_info[1]))
+    station_id = det_info[0:6]
+    detector_id = det_info[6:]
+    return aux, bound, station_id, detector_id
+
 # Detector
 class Detector:
-    def __init__(self, id):
+    def __init__(self, id, info=None):
+        # info: topology.DetectorInfo, the id is parsed when there is none
         self.id = id
-        self.aux, self.bound, self.station_id, self.detector_id = self.parse_detector_id(id)
+        if info is None:
+            self.aux, self.bound, self.station_id, self.detector_id = self.parse_detector_id(id)
+        else:
+            self.aux, self.bound, self.station_id, self.detector_id = info.aux, info.bound, info.station_id, info.detector_id
+        self.isExit = self.aux == '1'
         self.flow = 0
         self.density = 0
-        self.volumes = deque()
-        self.speeds = deque()
+        self.volumes = MetricColumn()
+        self.speeds = MetricColumn()
+        self.__bind_columns()
+        self.prevVehicles = tuple()
+
+    def __bind_columns(self):
         self.append_volumes = self.volumes.append
         self.append_speeds = self.speeds.append
-        self.prevVehicles = tuple()
 
     def __str__(self):
         return f"Detector {self.id} at station {self.station_id} volumes {len(self.volumes)} and speeds {len(self.speeds)}"
@@ -93,34 +153,20 @@ class Detector:
     def __repr__(self):
         return f""
     def parse_detector_id(self, id):
-        parts = id.split('_')
-        if len(parts) != 2 or not parts[0].startswith("Det"):
-            raise ValueError(f"Invalid detector ID format: {id}")
-        det_info = parts[1]
-        aux = det_info[0]
-        bound = Direction.from_first_value(int(det_info[1]))
-        station_id = det_info[0:6]
-        detector_id = det_info[6:]
-        return aux, bound, station_id, detector_id
+        return parse_detector_id(id)
 
     #update detection data by interval
     def update(self):
         pass
 
     def getVolume(self):
-        if len(self.volumes) > 0:
-            return self.volumes[-1]
-        else:
-            return -1
+        return self.volumes.last(-1)
 
     def getVehicles(self):
         return self.prevVehicles
 
     def getSpeed(self):
-        if len(self.speeds) > 0:
-            return self.speeds[-1]
-        else:
-            return -1
+        return self.speeds.last(-1)
 
         # 직렬화할 데이터를 정의하는 메서드
     def __getstate__(self):
@@ -128,10 +174,15 @@ class Detector:
         state = self.__dict__.copy()
         del state['flow']
         del state['density']
-        del state['aux']
-        del state['bound']
-        del state['station_id']
-        del state['detector_id']
+        if self.bound is not None:
+            # recomputed from the id
+            del state['aux']
+            del state['bound']
+            del state['station_id']
+            del state['detector_id']
+        state.pop('isExit', None)
+        del state['append_volumes']
+        del state['append_speeds']
         state['__class__'] = Detector
         return state
 
@@ -141,7 +192,13 @@ class Detector:
         self.__dict__.update(state)
         self.flow = 0
         self.density = 0
-        self.aux, self.bound, self.station_id, self.detector_id = self.parse_detector_id(self.id)
+        if 'aux' not in state:
+            self.aux, self.bound, self.station_id, self.detector_id = self.parse_detector_id(self.id)
+        self.isExit = self.aux == '1'
+        # older result files keep the data in deques
+        self.volumes = MetricColumn.from_values(self.volumes)
+        self.speeds = MetricColumn.from_values(self.speeds)
+        self.__bind_columns()
         self.__class__ = DDetector #state.pop('__class__', Detector)
 
 class SDetector(Detector):
@@ -149,31 +206,29 @@ class SDetector(Detector):
         super().__init__(id)
 
 
-    def update(self):
-        vehicle_ids = traci.inductionloop.getLastStepVehicleIDs(self.id)
+    def update(self, collector=None):
+        if collector is None:
+            vehicle_ids = traci.inductionloop.getLastStepVehicleIDs(self.id)
+        else:
+            vehicle_ids, vehicle_number, interval_speed = collector.getLoopData(self.id)
         #check duplicated vehicles
         dupvol = 0
         speedcnt = 0
-        volume = 0
-        speed = 0
         for veh in vehicle_ids:
             if self.prevVehicles is not None and veh in self.prevVehicles:
                 dupvol += 1
             else:
-                speed +=  traci.inductionloop.getIntervalMeanSpeed(self.id)
                 speedcnt += 1
-            # if self.id == 'Det_02000000' or self.id == 'Det_02000001' or self.id == 'Det_12002604':
-            #     print(" --- each %s %s -> u : %d"%(self.id, veh, self.speed))
-
 
+        if collector is None:
+            vehicle_number = traci.inductionloop.getLastStepVehicleNumber(self.id)
+            # interval mean speed is the same for every new vehicle, fetch it once
+            interval_speed = traci.inductionloop.getIntervalMeanSpeed(self.id) if speedcnt > 0 else 0
 
-        volume = traci.inductionloop.getLastStepVehicleNumber(self.id) - dupvol
+        volume = vehicle_number - dupvol
         self.flow = volume * SMUtil.secPerHour / SMUtil.sec
-        speed = 0 if speedcnt == 0 else speed / speedcnt
+        speed = 0 if speedcnt == 0 else interval_speed
         self.density = 0 if speed == 0 else self.flow / (speed * SMUtil.MPStoKPH)
-        # if self.id == 'Det_02000000' or self.id == 'Det_02000001' or self.id == 'Det_12002604':
-        #     print("%s -> v : %d, u : %d, k : %d" % (self.id, self.volume, self.speed, self.density))
-            #print('--- lsvid : ', vehicle_ids, self.prevVehicles, traci.inductionloop.getLastStepVehicleNumber(self.id), dupvol )
         self.prevVehicles = vehicle_ids
         self.append_volumes(volume)
         self.append_speeds(speed)
@@ -190,18 +245,24 @@ class Station:
         self.id = id
         self.dets = [] if detectors is None else detectors
         self.direction = None
+        # input station of its section and the station its vehicles enter by (set from the topology)
+        self.isInput = False
+        self.isEntry = False
 
-        self.volumes = deque()
-        self.speeds = deque()
-        self.speeds_int = deque()
-        self.exitVolumes = deque()
+        self.volumes = MetricColumn()
+        self.speeds = MetricColumn()
+        self.speeds_int = MetricColumn()
+        self.exitVolumes = MetricColumn()
+        self.__bind_columns()
+
+        self.__define_direction()
+
+    def __bind_columns(self):
         self.append_volumes = self.volumes.append
         self.append_exitVolume = self.exitVolumes.append
         self.append_speeds = self.speeds.append
         self.append_speeds_int = self.speeds_int.append
 
-        self.__define_direction()
-
     def __define_direction(self):
         if not hasattr(self, 'direction') or self.direction is None:
             self.direction = None if len(self.dets) == 0 else self.dets[0].bound
@@ -214,95 +275,109 @@ class Station:
         pass
 
     def getVolume(self):
-        if len(self.volumes) > 0:
-            return self.volumes[-1]
-        else:
-            return -1
+        return self.volumes.last(-1)
 
     def getSpeed(self):
-        if len(self.speeds) > 0:
-            return self.speeds[-1]
-        else:
-            return -1
+        return self.speeds.last(-1)
 
     def getSpeedInt(self):
-        if len(self.speeds_int) > 0:
-            return self.speeds_int[-1]
-        else:
-            return -1
+        return self.speeds_int.last(-1)
 
     def getSpeedInts(self):
-        return self.speeds_int
+        return self.speeds_int.view()
 
     def getExitVolume(self):
-        if len(self.exitVolumes) > 0:
-            return self.exitVolumes[-1]
-        else:
-            return -1
+        return self.exitVolumes.last(-1)
 
     def __getstate__(self):
         state = self.__dict__.copy()
         del state['direction']
+        for key in ('append_volumes', 'append_exitVolume', 'append_speeds', 'append_speeds_int'):
+            del state[key]
         state['__class__'] = Station
         return state
 
     def __setstate__(self, state):
         self.__dict__.update(state)
+        # older result files keep the data in deques
+        self.volumes = MetricColumn.from_values(self.volumes)
+        self.speeds = MetricColumn.from_values(self.speeds)
+        self.speeds_int = MetricColumn.from_values(self.speeds_int)
+        self.exitVolumes = MetricColumn.from_values(self.exitVolumes)
+        self.__bind_columns()
         self.__define_direction()
         self.__class__ = DStation #state.pop('__class__', Station)
         #self.direction = None if len(self.dets) == 0 else self.dets[0].bound
 
+def _count_unique(vehicles):
+    # detectors of one station rarely see the same vehicle, most tuples are empty
+    return len(vehicles) if len(vehicles) < 2 else len(set(vehicles))
+
 class SStation(Station):
     def __init__(self, id, detectors=None):
         super().__init__(id, detectors)
-        self.inputVeh = set()
-        self.exitVeh = set()
-
-    def update(self):
+        # vehicles on the input/exit detectors in this step (interned ids with a collector)
+        self.inputVeh = ()
+        self.exitVeh = ()
+        # speed_int is emitted every SMUtil.interval seconds of simulation time (one row may span several seconds)
+        self._intervalEnd = None
+        self._intervalStart = 0
+
+    def update(self, time, collector=None):
         volume = 0
         speed = 0
         exitVolume = 0
-        self.inputVeh = set()
-        self.exitVeh = set()
+        inputVeh = ()
+        exitVeh = ()
 
         for det in self.dets:
-            det.update()
+            det.update(collector)
 
-            if det.aux == '1':
+            if det.isExit:
                 exitVolume += det.getVolume()
-                self.exitVeh.update(det.getVehicles())
+                exitVeh += det.getVehicles()
             else:
                 volume += det.getVolume()
                 speed += det.getSpeed()
-                self.inputVeh.update(det.getVehicles())
+                inputVeh += det.getVehicles()
+        self.inputVeh = inputVeh
+        self.exitVeh = exitVeh
 
         # if self.id == '020018' or self.id == '020018':
         #     print('--station id',self.id, self.inputVeh)
 
         speed = -1 if volume == 0 else speed / volume
-        volume = volume if volume == 0 or volume < len(self.inputVeh) else len(self.inputVeh)
-        exitVolume = exitVolume if exitVolume == 0 or exitVolume < len(self.exitVeh) else len(self.exitVeh)
+        if volume != 0:
+            inputCount = _count_unique(inputVeh)
+            volume = volume if volume < inputCount else inputCount
+        if exitVolume != 0:
+            exitCount = _count_unique(exitVeh)
+            exitVolume = exitVolume if exitVolume < exitCount else exitCount
 
         self.append_volumes(volume)
         self.append_speeds(speed)
         self.append_exitVolume(exitVolume)
 
         # calculate speed_int
-        scnt = len(self.speeds)
-        if scnt != 0 and scnt % SMUtil.interval == 0:
-            last_interval_speeds = list(self.speeds)[-SMUtil.interval:]
-            valid_speeds = [s for s in last_interval_speeds if s != -1]
+        if self._intervalEnd is None:
+            self._intervalEnd = time - SMUtil.sec + SMUtil.interval
+        if time >= self._intervalEnd:
+            while self._intervalEnd <= time:
+                self._intervalEnd += SMUtil.interval
+            last_interval_speeds = self.speeds.view()[self._intervalStart:]
+            self._intervalStart = len(self.speeds)
+            valid_speeds = last_interval_speeds[last_interval_speeds != -1]
 
             # 유효한 속도의 개수
             valid_count = len(valid_speeds)
-            average_speed = sum(valid_speeds) / valid_count if valid_count > 0 else 0
+            average_speed = valid_speeds.mean() if valid_count > 0 else 0
             self.append_speeds_int(average_speed)
         # if self.id == '020018':
         #     print('station id',self.id,', volume: ',self.getVolume(), ' speed: ',len(self.speeds_int), (self.getSpeedInt() * SMUtil.MPStoKPH))
         # #     #print('station id : ', self.id, 'iv: ',self.inputVeh, 'ev: ', self.exitVeh)
 
     def getVehicleData(self):
-        return list(self.inputVeh), list(self.exitVeh)
+        return list(set(self.inputVeh)), list(set(self.exitVeh))
 
     def getInputVehIds(self):
         return self.inputVeh
@@ -318,21 +393,35 @@ class DStation(Station):
         pass
 
 class Section:
-    def __init__(self, id, stations):
+    COLUMNS = (SECTION_RESULT.TIME, SECTION_RESULT.TIMEINT, SECTION_RESULT.SECTION_CO2, SECTION_RESULT.TRAFFIC_QUEUE,
+               SECTION_RESULT.GREEN_TIME, SECTION_RESULT.VOLUME, SECTION_RESULT.SPEED_INT, SECTION_RESULT.WAITING_TIME)
+
+    def __init__(self, id, stations, store=None):
         self.id = id
         self.stations = [] if stations is None else stations
         self.direction = None
         self.default_greentime = 0
+        # signal phase serving the section (set from the topology, Direction default otherwise)
+        self.phase_index = None
+        # traffic light system of the section and its position in Infra.getSections()
+        self.tls_id = None
+        self.index = -1
 
         #append data
-        self.__time = deque()
-        self.__timeint = deque()
-        self.__section_co2 = deque()
-        self.__section_volumes = deque()
-        self.__section_speedint = deque()
-        self.__section_queues = deque()
-        self._section_greentime = deque()
-        self.__section_waitingtime = deque()
+        self._store = MetricStore(self.COLUMNS) if store is None else store
+        self.__bind_store()
+        self.__define_direction()
+
+    def __bind_store(self):
+        column = self._store.column
+        self.__time = column(SECTION_RESULT.TIME)
+        self.__timeint = column(SECTION_RESULT.TIMEINT)
+        self.__section_co2 = column(SECTION_RESULT.SECTION_CO2)
+        self.__section_volumes = column(SECTION_RESULT.VOLUME)
+        self.__section_speedint = column(SECTION_RESULT.SPEED_INT)
+        self.__section_queues = column(SECTION_RESULT.TRAFFIC_QUEUE)
+        self._section_greentime = column(SECTION_RESULT.GREEN_TIME)
+        self.__section_waitingtime = column(SECTION_RESULT.WAITING_TIME)
         self.append_section_time = self.__time.append
         self.append_section_timeint = self.__timeint.append
         self.append_section_co2 = self.__section_co2.append
@@ -342,20 +431,11 @@ class Section:
         self.append_section_greentime = self._section_greentime.append
         self.append_section_waitingtime = self.__section_waitingtime.append
 
-        self.dataDic = dict()
-        self.dataDic[SECTION_RESULT.TIME] = self.__time
-        self.dataDic[SECTION_RESULT.TIMEINT] = self.__timeint
-        self.dataDic[SECTION_RESULT.SECTION_CO2] = self.__section_co2
-        self.dataDic[SECTION_RESULT.TRAFFIC_QUEUE] = self.__section_queues
-        self.dataDic[SECTION_RESULT.GREEN_TIME] = self._section_greentime
-        self.dataDic[SECTION_RESULT.VOLUME] = self.__section_volumes
-        self.dataDic[SECTION_RESULT.SPEED_INT] = self.__section_speedint
-        self.dataDic[SECTION_RESULT.WAITING_TIME] = self.__section_waitingtime
-        self.__define_direction()
-
     def __define_direction(self):
         if not hasattr(self, 'direction') or self.direction is None:
             self.direction = None if len(self.stations) == 0 else self.stations[0].direction
+        if getattr(self, 'phase_index', None) is None and self.direction is not None:
+            self.phase_index = self.direction.value[1]
 
     def addStation(self, station):
         self.stations.append(station)
@@ -365,45 +445,29 @@ class Section:
         if len(self.__section_volumes) == 0:
             return 0, 0, 0, 0
         else:
-            return self.__section_co2[-1], self.__section_volumes[-1], self.__section_queues[-1], self._section_greentime[-1]
+            return self.__section_co2.last(), self.__section_volumes.last(), self.__section_queues.last(), self._section_greentime.last()
 
     def getCurrentQueue(self):
-        if len(self.__section_queues) > 0:
-            return self.__section_queues[-1]
-        else:
-            return 0
+        return self.__section_queues.last()
 
     def getCurrentCO2(self):
-        if len(self.__section_co2) > 0:
-            return self.__section_co2[-1]
-        else:
-            return 0
+        return self.__section_co2.last()
 
     def getCurrentVol(self):
-        if len(self.__section_volumes) > 0:
-            return self.__section_volumes[-1]
-        else:
-            return 0
+        return self.__section_volumes.last()
 
     def getCurrentGreenTime(self):
-        if len(self._section_greentime) > 0:
-            return self._section_greentime[-1]
-        else:
-            return 0
+        return self._section_greentime.last()
 
     def getCurrentWaitingTime(self):
-        if len(self.__section_waitingtime) > 0:
-            return self.__section_waitingtime[-1]
-        else:
-            return 0
+        return self.__section_waitingtime.last()
 
     def getCurrentTime(self):
-        if len(self.__time) > 0:
-            return self.__time[-1]
-        return 0
+        return self.__time.last()
 
     def getDatabyID(self, id: SECTION_RESULT):
-        return self.dataDic[id]
+        # zero-copy view of the filled part of the column
+        return self._store.view(id)
 
     def update(self, time):
         pass
@@ -414,11 +478,21 @@ class Section:
     def __getstate__(self):
         state = self.__dict__.copy()
         del state['direction']  # direction은 계산 가능한 필드이므로 직렬화에서 제외
+        # column references and append functions are rebuilt from _store
+        for key in list(state):
+            if key.startswith('append_section_') or key.startswith('_Section__') or key == '_section_greentime':
+                del state[key]
+        # bound to the collector's vehicle index of the run
+        state.pop('vehicle_set', None)
         state['__class__'] = Section
         return state
 
     def __setstate__(self, state):
         self.__dict__.update(state)
+        if '_store' not in state:
+            # older result files keep the data in deques referenced by dataDic
+            self._store = MetricStore.from_dict(self.__dict__.pop('dataDic'))
+        self.__bind_store()
         # direction은 stations의 첫 번째 항목으로부터 다시 계산하여 설정
         self.__define_direction()
         self.__class__ = DSection#state.pop('__class__', Section)
@@ -430,27 +504,37 @@ class SSection(Section):
         #for data
         self.traffic_queue = 0
         self.current_greentime = -1
+        # vehicles in the section: ids without a collector, a VehicleSet over the collector's index otherwise
         self.section_vehicles = set()
+        self.vehicle_set = None
 
-    def setGreenTime(self, greetime, logic):
+    def setGreenTime(self, greetime, signalPlan):
         self.current_greentime = greetime
-        if logic is not None:
-            self.__setSignalGreenTime(greetime, logic)
+        if signalPlan is not None:
+            self.__setSignalGreenTime(greetime, signalPlan)
 
     def updateGreentime(self):
         if self.current_greentime != -1:
             self.append_section_greentime(self.current_greentime)
         else:
             if len(self._section_greentime) > 0:
-                self.append_section_greentime(self._section_greentime[-1])
+                self.append_section_greentime(self._section_greentime.last())
             else:
                 self.append_section_greentime(self.default_greentime)
 
 
-    def __setSignalGreenTime(self, time, logic):
-        logic.phases[self.direction.value[1]].duration = time
+    def __setSignalGreenTime(self, time, signalPlan):
+        signalPlan.setPhaseDuration(self.phase_index, time)
 
-    def update(self, time):
+    def getVehicleIDs(self):
+        if self.vehicle_set is not None:
+            return self.vehicle_set.getNames()
+        return list(self.section_vehicles)
+
+    def update(self, time, collector=None):
+        if collector is not None and self.vehicle_set is None:
+            self.vehicle_set = VehicleSet(collector.index)
+        vehicle_set = self.vehicle_set
         section_co2_emission = 0
         section_volume = 0
         removal_veh = list()
@@ -459,24 +543,30 @@ class SSection(Section):
         isspeedadded = False
         speedsum = 0
         waiting_time = 0
-        for i, station in enumerate(self.stations):
+        for station in self.stations:
             #update station data
-            station.update()
+            station.update(time, collector)
 
-            if i == 0:
+            if station.isEntry:
                 section_volume += station.getVolume()
-                self.section_vehicles.update(station.getInputVehIds())
+                if vehicle_set is None:
+                    self.section_vehicles.update(station.getInputVehIds())
+                else:
+                    vehicle_set.add(station.getInputVehIds())
 
             #update input station data according to InputStation Setup
-            if station.id == get_input_station_value(self.direction):
+            if station.isInput:
                 self.traffic_queue += station.getVolume()
 
             self.traffic_queue -= station.getExitVolume()
-            self.section_vehicles.difference_update(station.getExitVehIds())
+            if vehicle_set is None:
+                self.section_vehicles.difference_update(station.getExitVehIds())
+            else:
+                vehicle_set.discard(station.getExitVehIds())
 
             scnt = len(station.getSpeedInts())
 
-            if i == 0 and scnt > pscnt:
+            if station.isEntry and scnt > pscnt:
                 isspeedadded = True
                 sspeed = station.getSpeedInt()
                 if sspeed != -1 :
@@ -492,17 +582,23 @@ class SSection(Section):
             self.append_section_speedint(average_speed_int)
             self.append_section_timeint(time)
 
-        for vehicle in self.section_vehicles:
-            try:
-                if traci.vehicle.getCO2Emission(vehicle) >= 0:
-                    section_co2_emission += traci.vehicle.getCO2Emission(vehicle) / 1000
-                waiting_time += traci.vehicle.getWaitingTime(vehicle)
-            except TraCIException:
-                print('------------------------disappear -> ',vehicle)
-                #self.section_vehicles.remove(vehicle)
-                removal_veh.append(vehicle)
-
-        self.section_vehicles.difference_update(removal_veh)
+        if vehicle_set is None:
+            for vehicle in self.section_vehicles:
+                try:
+                    if traci.vehicle.getCO2Emission(vehicle) >= 0:
+                        section_co2_emission += traci.vehicle.getCO2Emission(vehicle) / 1000
+                    waiting_time += traci.vehicle.getWaitingTime(vehicle)
+                except TraCIException:
+                    steplog.debug('vehicle disappeared: %s', vehicle)
+                    #self.section_vehicles.remove(vehicle)
+                    removal_veh.append(vehicle)
+            self.section_vehicles.difference_update(removal_veh)
+        else:
+            # vehicles that left the network are dropped, the others are summed vectorized
+            members = vehicle_set.retain(collector.alive)
+            co2 = collector.getVehicleValues(tc.VAR_CO2EMISSION)
+            section_co2_emission = co2[members & (co2 >= 0)].sum() / 1000
+            waiting_time = collector.getVehicleValues(tc.VAR_WAITING_TIME)[members].sum()
 
         self.append_section_waitingtime(waiting_time)
         self.append_section_queues(self.traffic_queue)
@@ -518,8 +614,8 @@ class SSection(Section):
         print('this is SSection!!')
 
 class DSection(Section):
-    def __init__(self, id, stations=None):
-        super().__init__(id, stations)
+    def __init__(self, id, stations=None, store=None):
+        super().__init__(id, stations, store)
 
     def update(self):
         pass
@@ -527,38 +623,72 @@ class DSection(Section):
     def print(self):
         print('this is DSection!!')
 
+class Intersection:
+    """Sections controlled by one traffic light system."""
+    def __init__(self, id, sections=None):
+        self.id = id
+        self.sections = {} if sections is None else sections
+
+    def addSection(self, section):
+        self.sections[section.id] = section
+
+    def getSections(self) -> dict:
+        return self.sections
+
+    def getTotalQueue(self):
+        return sum(section.getCurrentQueue() for section in self.sections.values())
+
+def group_intersections(sections) -> Dict[str, Intersection]:
+    # TLS id -> Intersection, in section order; sections of files without TLS ids form one intersection
+    intersections = {}
+    for index, section in enumerate(sections.values()):
+        section.index = index
+        tls_id = getattr(section, 'tls_id', None)
+        if tls_id not in intersections:
+            intersections[tls_id] = Intersection(tls_id)
+        intersections[tls_id].addSection(section)
+    return intersections
+
 class Infra:
-    def __init__(self, sumocfg_path, scenario_path, scenario_file, sections, sigtype=None):
+    # accumulated results are read back every step, keep them exact
+    COLUMN_DTYPES = {TOTAL_RESULT.TOTAL_CO2_ACC: np.float64, TOTAL_RESULT.TOTAL_VOLUME: np.float64}
+
+    def __init__(self, sumocfg_path, scenario_path, scenario_file, sections, sigtype=None, collector=None, store=None):
         self.sumocfg_path = sumocfg_path
         # SUMO Scenario File Path
         self.scenario_path = scenario_path
         # SUMO Scenario File(.add.xml)
         self.scenario_file = scenario_file
         self.__sections = sections
+        # all sections are updated together every step, intersections group them by TLS
+        self.__intersections = group_intersections(sections)
+
+        self._store = MetricStore(TOTAL_RESULT, dtypes=self.COLUMN_DTYPES) if store is None else store
+        self.__bind_store()
+
+        self.sigType: str = sigtype
+        self.collector = collector
+        self.__savedTime: datetime = None
+        self.__savefileName: str = None
 
-        self.__time = deque()
-        self.__totalCO2 = deque()
-        self.__totalCO2ACC = deque()
-        self.__totalVolume = deque()
-        self.__totalWaitingTime = deque()
-        self.__totalQuue = deque()
+        # snapshot handoff to the GUI thread
+        self._snapshot: InfraSnapshot = None
+        self._snapshot_requested = False
+
+    def __bind_store(self):
+        column = self._store.column
+        self.__time = column(TOTAL_RESULT.TIME)
+        self.__totalCO2 = column(TOTAL_RESULT.TOTAL_CO2)
+        self.__totalCO2ACC = column(TOTAL_RESULT.TOTAL_CO2_ACC)
+        self.__totalVolume = column(TOTAL_RESULT.TOTAL_VOLUME)
+        self.__totalWaitingTime = column(TOTAL_RESULT.TOTAL_WAITING_TIME)
+        self.__totalQuue = column(TOTAL_RESULT.TOTAL_QUEUE)
         self.append_time = self.__time.append
         self.append_totalCO2 = self.__totalCO2.append
         self.append_totalCO2ACC = self.__totalCO2ACC.append
         self.append_totalVolume = self.__totalVolume.append
         self.append_totalWaitingTime = self.__totalWaitingTime.append
         self.append_totalQueue = self.__totalQuue.append
-        self.dataDic = {}
-        self.dataDic[TOTAL_RESULT.TIME] = self.__time
-        self.dataDic[TOTAL_RESULT.TOTAL_CO2] = self.__totalCO2
-        self.dataDic[TOTAL_RESULT.TOTAL_CO2_ACC] = self.__totalCO2ACC
-        self.dataDic[TOTAL_RESULT.TOTAL_VOLUME] = self.__totalVolume
-        self.dataDic[TOTAL_RESULT.TOTAL_WAITING_TIME] = self.__totalWaitingTime
-        self.dataDic[TOTAL_RESULT.TOTAL_QUEUE] = self.__totalQuue
-
-        self.sigType: str = sigtype
-        self.__savedTime: datetime = None
-        self.__savefileName: str = None
 
     def update(self):
         totalCO2 = 0
@@ -566,9 +696,13 @@ class Infra:
         totalVol = 0
         totalWaitingTime = 0
         totalQueue = 0
-        time = traci.simulation.getTime()
+        if self.collector is not None:
+            self.collector.update()
+            time = self.collector.getTime()
+        else:
+            time = traci.simulation.getTime()
         for section_id, section in self.getSections().items():
-            section.update(time)
+            section.update(time, self.collector)
             totalCO2 += section.getCurrentCO2()
             totalVol += section.getCurrentVol()
             totalWaitingTime += section.getCurrentWaitingTime()
@@ -578,8 +712,8 @@ class Infra:
         # for vehicle_id in vehicle_ids:
         #     totalCO2 += traci.vehicle.getCO2Emission(vehicle_id) / 1000
 
-        totalCO2ACC = self.__totalCO2ACC[-1] + totalCO2 if len(self.__totalCO2ACC) > 0 else totalCO2
-        totalVol = self.__totalVolume[-1] + totalVol if len(self.__totalVolume) > 0 else totalVol
+        totalCO2ACC = self.__totalCO2ACC.last() + totalCO2
+        totalVol = self.__totalVolume.last() + totalVol
         self.append_totalCO2(totalCO2)
         self.append_totalCO2ACC(totalCO2ACC)
         self.append_totalVolume(totalVol)
@@ -587,34 +721,75 @@ class Infra:
         self.append_totalQueue(totalQueue)
         self.append_time(time)
 
+        if self._snapshot_requested:
+            self.publishSnapshot()
+
+    def requestSnapshot(self):
+        # called from the GUI thread, served at the end of the next update
+        self._snapshot_requested = True
+
+    def publishSnapshot(self):
+        # only call from the thread that updates this Infra (or after it stopped)
+        self._snapshot_requested = False
+        seq = 0 if self._snapshot is None else self._snapshot.seq + 1
+        self._snapshot = InfraSnapshot(self, TOTAL_RESULT, seq)
+        return self._snapshot
+
+    def getSnapshot(self) -> InfraSnapshot:
+        return self._snapshot
+
     def getDatabyID(self, totalresult: TOTAL_RESULT):
-        return self.dataDic[totalresult]
+        # zero-copy view of the filled part of the column
+        return self._store.view(totalresult)
 
     def getDatabyName(self, name: str):
         return self.getDatabyID(TOTAL_RESULT.from_string(name))
 
+    def getSummary(self) -> dict:
+        # per-run metrics: last value (accumulated results) and mean over the run
+        summary = {'sigType': self.sigType, 'steps': len(self.__time)}
+        for result in TOTAL_RESULT:
+            data = self.getDatabyID(result)
+            if result is TOTAL_RESULT.TIME or len(data) == 0:
+                continue
+            summary[result.name + '_last'] = float(data[-1])
+            summary[result.name + '_mean'] = float(data.mean(dtype=np.float64))
+        return summary
+
     def getTotalCO2(self):
-        if len(self.__totalCO2) > 0:
-            return self.__totalCO2[-1]
-        else:
-            return 0
+        return self.__totalCO2.last()
+
+    def getNetworkCO2(self):
+        # CO2 of every vehicle in the network (not only the sections) in the current step, mg/s
+        if self.collector is not None:
+            return self.collector.getTotalCO2()
+        total_co2_emission = 0
+        for veh_id in traci.vehicle.getIDList():
+            total_co2_emission += traci.vehicle.getCO2Emission(veh_id)
+        return total_co2_emission
 
     def getTotalCO2mg(self):
         return self.getTotalCO2() * 100
 
     def getTotalWaitingTime(self):
-        if len(self.__totalWaitingTime) > 0:
-            return self.__totalWaitingTime[-1]
-        else:
-            return 0
+        return self.__totalWaitingTime.last()
 
     def getTime(self):
-        return self.__time
+        return self.__time.view()
+
+    def getCurrentTime(self):
+        return self.__time.last()
 
     def getSections(self) -> dict:
         return self.__sections
 
-    def setSaveFileName(self, name=None):
+    def getIntersections(self) -> Dict[str, Intersection]:
+        return self.__intersections
+
+    def getIntersection(self, tls_id) -> Intersection:
+        return self.__intersections[tls_id]
+
+    def setSaveFileName(self, name=None, extension='.data'):
         if self.__savedTime is None:
             self.setCurrentTime()
 
@@ -625,7 +800,7 @@ class Infra:
         formatted_time = self.__savedTime.strftime("%Y%m%d%H%M%S")
         filename = filename+formatted_time
 
-        self.__savefileName = filename + '.data'
+        self.__savefileName = filename + extension
         return self.__savefileName
 
     def getFileName(self):
@@ -636,12 +811,35 @@ class Infra:
 
     def setCurrentTime(self):
         self.__savedTime = datetime.now()
-        print(self.__savedTime)
+        log.debug('saved time %s', self.__savedTime)
+
+    def setSavedTime(self, savedTime: datetime):
+        self.__savedTime = savedTime
 
     def __getstate__(self):
         state = self.__dict__.copy()
+        # live TraCI cache and GUI snapshot are not part of the results
+        state['collector'] = None
+        state['_snapshot'] = None
+        state['_snapshot_requested'] = False
+        # column references and append functions are rebuilt from _store
+        for key in ('_Infra__time', '_Infra__totalCO2', '_Infra__totalCO2ACC', '_Infra__totalVolume',
+                    '_Infra__totalWaitingTime', '_Infra__totalQuue', 'append_time', 'append_totalCO2',
+                    'append_totalCO2ACC', 'append_totalVolume', 'append_totalWaitingTime', 'append_totalQueue'):
+            del state[key]
         return state
 
     # 역직렬화된 데이터를 객체 상태에 복원하는 메서드
     def __setstate__(self, state):
         self.__dict__.update(state)
+        if 'collector' not in state:
+            self.collector = None
+        if '_snapshot' not in state:
+            self._snapshot = None
+            self._snapshot_requested = False
+        if '_store' not in state:
+            # older result files keep the data in deques referenced by dataDic
+            self._store = MetricStore.from_dict(self.__dict__.pop('dataDic'), self.COLUMN_DTYPES)
+        if '_Infra__intersections' not in state:
+            self.__intersections = group_intersections(self.__sections)
+        self.__bind_store()
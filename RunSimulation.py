@@ -1,24 +1,46 @@
-import os
-import pickle
+import math
 from typing import Dict, List
 
 import traci
+import traci.constants as tc
+import export
 from inframanager import InfraManager
+import resultfile
+import simlog
 from Infra import SDetector, SStation, SSection, Infra, SECTION_RESULT
+from scheduler import Wakeups, next_phase_end
+from signalplan import SignalPlan, SignalProgram, compile_program
+from subscription import IntervalCollector, SubscriptionCollector
+from topology import Topology, load_topology
+
+log = simlog.getLogger(__name__)
 
 class RunSimulation(InfraManager):
+    # vehicle values subscribed for every vehicle (SubscriptionCollector), controllers add what they read per step
+    VEHICLE_VARS = SubscriptionCollector.VEHICLE_VARS
+
     def __init__(self, config, name="Static Control", isExternalSignal=False):
         super().__init__(config, name, simMode=True, filenames=None, isExternal=isExternalSignal)
         self.stepbySec = 1
         self.colDuration = 30  # seconds
 
-        self.traffic_light_id = "TLS_0"
+        # every TLS with detector sections is controlled, the first one is the primary
+        # intersection of the single junction controllers (RL, DilemaZone)
+        self.traffic_light_id = self.traffic_light_ids[0]
         self.isStop = True
         self.step = 0
+        # simulation time of the current step
+        self.time = 0
+        # next step each controller task runs in, see _signalControl
+        self.wakeups = Wakeups()
 
         self.original_logic = None
         self.logic = None
+        self.signalPlan: SignalPlan = None
+        self.signalPlans: Dict[str, SignalPlan] = {}
         self._rtinfra = self.getInfra()
+        self.events: simlog.EventLog = simlog.openEventLog(self.config.event_log)
+        self.exporter: export.StreamingExporter = None
 
     def preinit(self):
         self.__set_SUMO()
@@ -33,85 +55,198 @@ class RunSimulation(InfraManager):
         StationClass = SStation
         SectionClass = SSection
 
+        # detector/station/section structure, parsed once per scenario files (cached)
+        self.topology: Topology = load_topology(self.config)
+        self.traffic_light_ids = self.topology.getTLSIDs()
         dets = self.__init_detector(DetectorClass)
         station_objects = self.__init_station(dets, StationClass)
         section_objects = self.__init_section(station_objects, SectionClass)
 
-        return [Infra(self.config.sumocfg_path, self.config.scenario_path, self.config.scenario_file, section_objects, self.sigTypeName)]
+        collector = None
+        self.fastForward = self.config.fast_forward and self.canFastForward()
+        if self.fastForward:
+            collector = IntervalCollector([det.id for det in dets], self.VEHICLE_VARS, [self.topology.getDetector(det.id).period for det in dets])
+        elif self.config.use_subscription:
+            collector = SubscriptionCollector([det.id for det in dets], self.VEHICLE_VARS)
 
-    def __get_detector_ids(self, config):
-        detector_ids = []
-        with open(os.path.join(config.scenario_path, config.scenario_file), "r") as f:
-            for line in f:
-                if "inductionLoop" in line:
-                    parts = line.split('"')
-                    detector_ids.append(parts[1])
-        return detector_ids
+        return [Infra(self.config.sumocfg_path, self.config.scenario_path, self.config.scenario_file, section_objects, self.sigTypeName, collector)]
 
     def __init_detector(self, detectorclass=SDetector):
-        return [detectorclass(detector_id) for detector_id in self.__get_detector_ids(self.config)]
+        return [detectorclass(info.id, info) for info in self.topology.detectors.values()]
 
     def __init_station(self, dets, stationclass=SStation):
         station_objects = {}
         for detector in dets:
             if detector.station_id not in station_objects:
                 station_objects[detector.station_id] = stationclass(detector.station_id)
+                station_objects[detector.station_id].isInput = self.topology.getStation(detector.station_id).is_input
             station_objects[detector.station_id].addDetector(detector)
         return station_objects
 
     def __init_section(self, stations, sectionclass=SSection) -> Dict[int, SSection]:
         section_objects = {}
-        logic = None
+        logics = {}
         if self.isExternalSignal is False and sectionclass is SSection:
-            logic = traci.trafficlight.getAllProgramLogics("TLS_0")[0]
+            logics = {tls_id: traci.trafficlight.getAllProgramLogics(tls_id)[0] for tls_id in self.topology.getTLSIDs()}
 
         for station_id in stations:
-            section_id = station_id[1]
+            section_id = self.topology.getStation(station_id).section_id
             if section_id not in section_objects:
+                info = self.topology.getSection(section_id)
+                if info.input_station is None:
+                    log.warning('section %s has no input detectors, its queue only counts the vehicles leaving it', section_id)
                 section_objects[section_id] = sectionclass(section_id)
-            section_objects[section_id].addStation(stations[station_id])
+                section_objects[section_id].phase_index = info.phase
+                section_objects[section_id].tls_id = info.tls
+                # stations in the topology order (not the detector file order), the first one counts the section volume
+                for member_id in info.stations:
+                    section_objects[section_id].addStation(stations[member_id])
+                stations[info.stations[0]].isEntry = True
 
         #set Default greentime
         for sid, section in section_objects.items():
-            if logic is not None:
-                section.default_greentime = logic.phases[section.direction.value[1]].duration
+            if section.tls_id in logics:
+                section.default_greentime = logics[section.tls_id].phases[section.phase_index].duration
         return section_objects
 
     def __set_SUMO(self):
-        traci.start(["sumo-gui", "-c", self.config.sumocfg_path, "--start", "--quit-on-end", "--seed", "100"])
+        traci.start([self.config.sumo_binary, "-c", self.config.sumocfg_path, *self.config.sumo_options, "--seed", str(self.getSeed(100))], label=self.config.label)
         traci.simulationStep()
 
+    def getSeed(self, default):
+        return default if self.config.seed is None else self.config.seed
+
     def terminate(self):
         self.isStop = True
 
     def isTermiated(self):
         return self.isStop
 
+    def recordEvent(self, kind, target=-1, action=-1, value=0.0):
+        # decision log, a no-op unless Config_SUMO.event_log is set
+        # (time stamp: last Infra update, i.e. the step before the decision takes effect)
+        if self.events is not None:
+            self.events.record(self._rtinfra.getCurrentTime(), kind, target, action, value)
+
+    def closeEventLog(self):
+        if self.events is not None:
+            self.events.close()
+
+    def _openExporter(self):
+        # results streamed to Config_SUMO.export_path while the simulation runs
+        if self.config.export_path is not None:
+            self.exporter = export.StreamingExporter(self._rtinfra, self.config.export_path, self.config.export_format)
+
+    def _closeExporter(self):
+        if self.exporter is not None:
+            self.exporter.close()
+            self.exporter = None
+
+    def getRunStats(self) -> dict:
+        # controller specific run statistics (e.g. policy latency), merged into the run summary
+        return {}
+
     def saveData(self, filename):
         if self.isStop is True:
-            print('save data clicked')
-            with open(self._rtinfra.setSaveFileName(filename), "wb") as f:
-                pickle.dump(self._rtinfra, f)
-                print('---file saved at ',self._rtinfra.getFileName())
+            resultfile.save(self._rtinfra, self._rtinfra.setSaveFileName(filename, resultfile.EXTENSION))
+            log.info('file saved at %s', self._rtinfra.getFileName())
             #self.extract_excel()
 
+    def getSignalPlan(self, tls_id=None) -> SignalPlan:
+        return self.signalPlans[self.traffic_light_id if tls_id is None else tls_id]
+
+    def getSignalProgram(self, tls_id=None) -> SignalProgram:
+        # compiled from the phase states in the net file, no TraCI request
+        return compile_program(self.topology.programs[self.traffic_light_id if tls_id is None else tls_id])
+
+    def getActionSections(self, tls_id=None, required=False):
+        # sections served by each green phase (RL action) of the TLS, empty for a phase without detector section
+        # required: every action needs a section, ValueError otherwise
+        tls_id = self.traffic_light_id if tls_id is None else tls_id
+        program = self.getSignalProgram(tls_id)
+        sections = program.getPhaseSections(self._rtinfra.getIntersection(tls_id).getSections().values())
+        if required and not all(sections):
+            missing = [phase for phase, phase_sections in zip(program.green, sections) if not phase_sections]
+            raise ValueError("%s: green phases %s of traffic light %s serve no detector section, their actions cannot be recorded"
+                             % (type(self).__name__, missing, tls_id))
+        return sections
+
+    def setActionGreenTime(self, sections, green_time):
+        # every section of the action's green phase records the green time
+        for section in sections:
+            section.setGreenTime(green_time, None)
+
     def _refreshSignalPhase(self):
-        traci.trafficlight.setProgramLogic("TLS_0", self.logic)
+        for tls_id, signalPlan in self.signalPlans.items():
+            # a changed program moves the phase ends, the TLS is checked again in the next step
+            if signalPlan.push() and tls_id in self.wakeups:
+                self.wakeups.at(tls_id, self.time)
 
-    def _signalControl(self):
+    def _simulationTime(self):
+        # from the simulation subscription of the collector once it has subscribed (no TraCI request)
+        sim = traci.simulation.getSubscriptionResults() if self._rtinfra.collector is not None else None
+        return sim[tc.VAR_TIME] if sim else traci.simulation.getTime()
+
+    def _scheduleStart(self):
+        # every intersection runs in the first step, _onWakeup schedules its next run
+        for tls_id in self.traffic_light_ids:
+            self.wakeups.at(tls_id, -math.inf)
+
+    def schedulePhaseEnd(self, tls_id, phase_index, next_switch, wanted):
+        """Wakes tls_id in the step its first phase with wanted(phase index) true ends.
+
+        The end is predicted from the cached program, programs SUMO times itself
+        (actuated) are checked again in the next step.
+        """
+        time = next_phase_end(self.getSignalPlan(tls_id).getLogic(), phase_index, next_switch, wanted, self.time)
+        self.wakeups.at(tls_id, self.time if time is None else time)
+
+    def _onWakeup(self, tls_id):
         pass
 
+    def canFastForward(self):
+        # only controllers scheduled through wakeups can skip steps, the others poll in every step
+        if not self.config.use_subscription:
+            log.warning('fast forward needs Config_SUMO.use_subscription, the simulation runs step by step')
+            return False
+        if type(self)._signalControl is not RunSimulation._signalControl or type(self).run_simulation is not RunSimulation.run_simulation:
+            log.warning('%s runs in every step, fast forward is not used', type(self).__name__)
+            return False
+        return True
+
+    def _nextStepTime(self):
+        # the step before the next controller wake-up (controllers see the results up to their previous step,
+        # as without fast forward), at most fast_forward_max and one detector period ahead
+        jump = min(self.config.fast_forward_max, self._rtinfra.collector.getMaxJump(), self.config.max_step - self.step + 1)
+        return max(self.time + 1, min(self.wakeups.next - 1, self.time + jump))
+
+    def _signalControl(self):
+        # only the controller tasks due in this step run, the other steps cost no TraCI requests
+        for tls_id in self.wakeups.popDue(self.time):
+            self._onWakeup(tls_id)
+
     def run_simulation(self):
-        print('---- start Simulation (signController : ',self.sigTypeName, ") ----")
+        log.info('start simulation (signal controller: %s)', self.sigTypeName)
         self.step = 0
         self.isStop = False
 
-        while not self.isStop and self.step <= 11700:
-            #start_time = time.time()
-            traci.simulationStep()
+        # fetch the program logics once, controllers read and change the cached copies
+        self.signalPlans = {tls_id: SignalPlan(tls_id) for tls_id in self.traffic_light_ids}
+        self.signalPlan = self.signalPlans[self.traffic_light_id]
+        self.logic = self.signalPlan.getLogic()
+        self.wakeups = Wakeups()
+        self._scheduleStart()
+        self._openExporter()
+        self.time = self._simulationTime()
 
-            #set logic every step
-            self.logic = traci.trafficlight.getAllProgramLogics("TLS_0")[0]
+        while not self.isStop and self.step <= self.config.max_step:
+            #start_time = time.time()
+            previous = self.time
+            if self.fastForward:
+                traci.simulationStep(self._nextStepTime())
+            else:
+                traci.simulationStep()
+            self.time = self._simulationTime()
 
             self._signalControl()
             if self.sigTypeName != "Reinforement Learning based Control":
@@ -119,16 +254,20 @@ class RunSimulation(InfraManager):
             # print('Green times: ', end='')
 
             self._rtinfra.update()
+            if self.exporter is not None:
+                self.exporter.update()
 
-            self.step += 1
+            self.step += int(self.time - previous) if self.fastForward else 1
 
         self.isStop = True
         traci.close()
+        self.closeEventLog()
+        self._closeExporter()
 
 
-    def Check_TrafficLight_State(self):
+    def Check_TrafficLight_State(self, tls_id=None):
         try:
-            signal_states = traci.trafficlight.getRedYellowGreenState("TLS_0")
+            signal_states = traci.trafficlight.getRedYellowGreenState(self.traffic_light_id if tls_id is None else tls_id)
         except traci.exceptions.TraCIException:
             signal_states = 'N/A'
         return signal_states
\ No newline at end of file
@@ -10,12 +10,16 @@ import pyqtgraph as pg
 from Infra import Direction, Infra, SECTION_RESULT, TOTAL_RESULT, Config_SUMO
 from graphmanager import GraphLayout
 from plotobject import PlotSection, PlotInfra
+from snapshot import InfraSnapshot
 from runactuated import RunActuated
 from RunSimulation import RunSimulation
 from collections import deque
 from PyQt5.QtGui import QFont
 from scipy.signal import butter, filtfilt
 
+import resultfile
+import simlog
+from profiler import profile_run
 from runemulator import RunEmulator
 from signaltype import SignalMode
 
@@ -233,7 +237,7 @@ class TrafficSimulatorApp(QMainWindow):
     def initialize_controller(self, extract=False):
         print(self.signalControlType)
         if extract is not True:
-            self.controller = self.signalControlType.value[0]()  # 예: RunActuated(config=Config_SUMO())
+            self.controller = self.signalControlType.create()  # 예: RunActuated(config=Config_SUMO())
         else:
             self.controller = RunSimulation(config=Config_SUMO(), name="Extract Mode", isExtract=True)
         if self.compData is not None:
@@ -289,7 +293,7 @@ class TrafficSimulatorApp(QMainWindow):
         return f"{base_filename} [{base_name} : {formatted_time}]"
 
     def getSavedFileList(self) -> List[Tuple[str, str]]:
-        data_files = [f for f in os.listdir('.') if f.endswith('.data')]
+        data_files = [f for f in os.listdir('.') if f.endswith('.data') or f.endswith(resultfile.EXTENSION)]
         result = []
         for f in data_files:
             without_extension = os.path.splitext(f)[0]
@@ -298,7 +302,7 @@ class TrafficSimulatorApp(QMainWindow):
         return result
 
     @pyqtSlot(object)
-    def draw_bar_chart(self, rtinfra: Infra):
+    def draw_bar_chart(self, rtinfra: InfraSnapshot):
         self.bar_x = []
         self.bar_y = []
         labels = dict()
@@ -306,7 +310,7 @@ class TrafficSimulatorApp(QMainWindow):
             sections = rtinfra.getSections().values()
             for i, section in enumerate(sections):
                 self.bar_x.append(i + 1)
-                self.bar_y.append(section.getCurrentQueue())
+                self.bar_y.append(section.getDatabyID(SECTION_RESULT.TRAFFIC_QUEUE)[-1].item())
                 labels[i + 1] = section.direction.name
 
             self.queue_graph.clear()
@@ -394,14 +398,28 @@ class SimulationThread(QThread):
     def __init__(self, controller):
         super().__init__()
         self.controller: RunSimulation = controller
+        self.lastSnapshot: InfraSnapshot = None
 
     def run(self):
-        self.controller.run_simulation()
+        # GUI emission runs in the GUI thread, it is timed as its own stage
+        profile_run(self.controller, extra_stages=[('emit_results', SimulationThread, 'emit_results')])
 
     def emit_results(self):
-        self.results_signal.emit(
-            self.controller.getInfra(),
-        )
+        # the live Infra is never handed to the GUI, only snapshots published by the simulation thread
+        infra = self.controller.getInfra()
+        if infra is None:
+            return
+        if self.isFinished():
+            snapshot = infra.getSnapshot()
+            if snapshot is None or len(snapshot.getTime()) != len(infra.getTime()):
+                infra.publishSnapshot()
+        else:
+            infra.requestSnapshot()
+
+        snapshot = infra.getSnapshot()
+        if snapshot is not None and snapshot is not self.lastSnapshot:
+            self.lastSnapshot = snapshot
+            self.results_signal.emit(snapshot)
 
 
 def my_exception_hook(exctype, value, traceback):
@@ -410,6 +428,7 @@ def my_exception_hook(exctype, value, traceback):
 
 
 def main():
+    simlog.configure()
     sys._excepthook = sys.excepthook
     sys.excepthook = my_exception_hook
     app = QApplication(sys.argv)
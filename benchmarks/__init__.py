@@ -0,0 +1,10 @@
+"""
+Simulation throughput benchmarks, run from the repository root.
+
+    python -m benchmarks                      every SignalMode, 1800 steps, seed 100
+    python -m benchmarks --modes Static ActuatedBOCC --steps 3600
+    python -m benchmarks --micro              Infra.update only, replayed frames, no SUMO
+
+Every run is appended to benchmarks/history.json and compared with the
+previous run of the same kind/steps/seed on the same host.
+"""
@@ -0,0 +1,85 @@
+"""
+Subscription/polling consistency check.
+
+    python -m benchmarks --check-collectors
+
+Runs a controller on a generated 3x3 TLS grid twice, with the
+SubscriptionCollector and polling TraCI, and compares the volume and exit
+volume of every station step by step. The exit loops sit 5 m before the end
+of every lane, where the vehicles whose route ends on the edge leave the
+network while the loop still reports them.
+"""
+
+import os
+import subprocess
+import sys
+
+import numpy as np
+import sumolib
+
+from runheadless import make_config
+
+GRID_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "grid")
+# exit loops: distance (m) to the lane end, input loops in the middle of the lane
+EXIT_OFFSET = 5.0
+
+
+def build_grid(directory=GRID_DIR, seed=1, end=1500):
+    """Net, routes, loops and sumocfg of the check network, returns the sumocfg path."""
+    os.makedirs(directory, exist_ok=True)
+    net = os.path.join(directory, "grid.net.xml")
+    trips = os.path.join(directory, "grid.trips.xml")
+    routes = os.path.join(directory, "grid.rou.xml")
+    loops = os.path.join(directory, "grid.add.xml")
+    sumocfg = os.path.join(directory, "grid.sumocfg")
+    if os.path.exists(sumocfg):
+        return sumocfg
+
+    subprocess.run([sumolib.checkBinary("netgenerate"), "--grid", "--grid.number", "3", "--grid.length", "200",
+                    "--default.lanenumber", "2", "--tls.guess", "--no-turnarounds", "-o", net],
+                   check=True, capture_output=True)
+    subprocess.run([sys.executable, os.path.join(os.environ["SUMO_HOME"], "tools", "randomTrips.py"), "-n", net,
+                    "-o", trips, "-r", routes, "--seed", str(seed), "--end", str(end), "--period", "1", "--fringe-factor", "10"],
+                   check=True, capture_output=True)
+    with open(loops, "w") as f:
+        f.write("<additional>\n")
+        for i, lane in enumerate(lane for edge in sumolib.net.readNet(net).getEdges() for lane in edge.getLanes()):
+            # exit loops first, the stations are ordered by the topology
+            f.write('    <inductionLoop id="loop%d_exit" lane="%s" pos="%.1f" period="60" file="NUL"/>\n'
+                    % (i, lane.getID(), lane.getLength() - EXIT_OFFSET))
+            f.write('    <inductionLoop id="loop%d_in" lane="%s" pos="%.1f" period="60" file="NUL"/>\n'
+                    % (i, lane.getID(), lane.getLength() / 2))
+        f.write("</additional>\n")
+    with open(sumocfg, "w") as f:
+        f.write('<configuration><input><net-file value="grid.net.xml"/><route-files value="grid.rou.xml"/>'
+                '<additional-files value="grid.add.xml"/></input></configuration>\n')
+    return sumocfg
+
+
+def station_counts(mode_name, sumocfg, steps, seed, use_subscription):
+    # station id -> (volume, exit volume) per step
+    from signaltype import SignalMode
+
+    config = make_config("sumo", seed, steps)
+    config.sumocfg_path = sumocfg
+    config.scenario_path = os.path.dirname(sumocfg)
+    config.scenario_file = "grid.add.xml"
+    config.use_subscription = use_subscription
+    config.label = "check_%s_%d" % (mode_name, use_subscription)
+    controller = SignalMode[mode_name].create(config)
+    controller.run_simulation()
+    return {station.id: (station.volumes.view().copy(), station.exitVolumes.view().copy())
+            for section in controller.getInfra().getSections().values() for station in section.stations}
+
+
+def check_collectors(mode_name="Static", steps=1500, seed=1):
+    """Station ids whose counts differ between the two paths, with their total (volume, exit volume) of both."""
+    sumocfg = build_grid()
+    subscribed = station_counts(mode_name, sumocfg, steps, seed, True)
+    polled = station_counts(mode_name, sumocfg, steps, seed, False)
+    mismatches = {}
+    for station_id, (volumes, exits) in polled.items():
+        sub_volumes, sub_exits = subscribed[station_id]
+        if not (np.array_equal(volumes, sub_volumes) and np.array_equal(exits, sub_exits)):
+            mismatches[station_id] = ((float(sub_volumes.sum()), float(sub_exits.sum())), (float(volumes.sum()), float(exits.sum())))
+    return len(polled), mismatches
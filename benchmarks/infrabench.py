@@ -0,0 +1,87 @@
+import os
+import pickle
+import time
+
+import numpy as np
+
+from subscription import SubscriptionCollector
+
+FRAME_VERSION = 1
+
+
+class FrameCollector(SubscriptionCollector):
+    """SubscriptionCollector serving recorded per-step responses instead of TraCI."""
+    def __init__(self, frames):
+        super().__init__([])
+        self.frames = frames
+        self.pos = 0
+
+    def subscribe(self):
+        pass
+
+    def update(self):
+        self.time, self.loops, self.vehicles = self.frames[self.pos]
+        self.pos += 1
+        self.indexVehicles()
+
+
+def record_frames(controller, path):
+    """Run controller.run_simulation and store the subscription responses of every step.
+
+    The frames are what Infra.update reads through its SubscriptionCollector,
+    replaying them repeats the aggregation without SUMO.
+    """
+    collector = controller.getInfra().collector
+    if collector is None:
+        raise ValueError("frames are recorded from the subscription collector, Config_SUMO.use_subscription is off")
+    frames = []
+    update = collector.update
+
+    def recording_update():
+        update()
+        # response dicts are rebuilt every step, the per-object entries are copied all the same
+        frames.append((collector.time,
+                       {det_id: dict(data) for det_id, data in collector.loops.items()},
+                       {veh_id: dict(data) for veh_id, data in collector.vehicles.items()}))
+    collector.update = recording_update
+    try:
+        controller.run_simulation()
+    finally:
+        del collector.update
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'wb') as f:
+        pickle.dump({'version': FRAME_VERSION, 'frames': frames}, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return len(frames)
+
+
+def load_frames(path):
+    with open(path, 'rb') as f:
+        data = pickle.load(f)
+    if data.get('version') != FRAME_VERSION:
+        raise ValueError("%s: unsupported frame file version %s" % (path, data.get('version')))
+    return data['frames']
+
+
+def replay(config, frames, repeat=5):
+    """Time Infra.update over the recorded frames, a fresh Infra per repetition."""
+    from trainrl import InfraBuilder
+
+    step_us = []
+    for _ in range(repeat):
+        infra = InfraBuilder(config, 'Replay').getInfra()
+        infra.collector = FrameCollector(frames)
+        update = infra.update
+        start = time.perf_counter_ns()
+        for _ in range(len(frames)):
+            update()
+        step_us.append((time.perf_counter_ns() - start) / 1000 / len(frames))
+
+    best = min(step_us)
+    return {
+        'steps': len(frames),
+        'repeat': repeat,
+        'update_us_best': best,
+        'update_us_median': float(np.median(step_us)),
+        'steps_per_sec': 1e6 / best if best > 0 else 0,
+    }
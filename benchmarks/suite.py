@@ -0,0 +1,249 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import traceback
+from datetime import datetime
+
+import simlog
+from runheadless import make_config
+
+HISTORY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "history.json")
+FRAME_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "frames")
+
+# metric -> +1 when higher is better, -1 when lower is better
+METRICS = {
+    'suite': {'steps_per_sec': 1, 'traci_calls_per_step': -1, 'peak_rss_mb': -1, 'sumo_peak_rss_mb': -1, 'result_bytes': -1},
+    'micro': {'steps_per_sec': 1},
+}
+
+
+def _peak_rss_mb(pid='self'):
+    # VmHWM starts over with exec, ru_maxrss would include the RSS of the parent at fork time
+    try:
+        with open('/proc/%s/status' % pid) as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if pid != 'self':
+        return None
+    # ru_maxrss is in kilobytes on Linux (bytes on macOS)
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+def _watch_sumo_rss(peaks):
+    # SUMO's peak RSS is read just before the connection is closed (not available with libsumo)
+    try:
+        from traci.connection import Connection
+    except ImportError:
+        return
+    close = Connection.close
+
+    def measured_close(conn, *args, **kwargs):
+        if conn._process is not None:
+            peaks.append(_peak_rss_mb(conn._process.pid))
+        return close(conn, *args, **kwargs)
+    Connection.close = measured_close
+
+
+def _worker_init():
+    # workers only report warnings, the suite prints one table
+    simlog.configure(os.environ.get('SIM_LOG_LEVEL', 'WARNING'))
+
+
+def run_case(case):
+    # executed in a fresh worker process, so the peak RSS belongs to this run only
+    from profiler import Profiler
+    from signaltype import SignalMode
+
+    mode_name, steps, seed, output_dir = case
+    config = make_config("sumo", seed, steps)
+    config.label = "bench_" + mode_name
+    sumo_rss = []
+    _watch_sumo_rss(sumo_rss)
+    try:
+        controller = SignalMode[mode_name].create(config)
+        # only the TraCI calls are counted, stage timers would slow the run down
+        profiler = Profiler(controller, timed=False)
+        start = time.perf_counter()
+        with profiler:
+            controller.run_simulation()
+        elapsed = time.perf_counter() - start
+
+        infra = controller.getInfra()
+        os.makedirs(output_dir, exist_ok=True)
+        controller.saveData(os.path.join(output_dir, mode_name))
+        done = infra.getSummary()['steps']
+        return mode_name, {
+            'steps': done,
+            'wall_time': elapsed,
+            'steps_per_sec': done / elapsed if elapsed > 0 else 0,
+            'traci_calls_per_step': profiler.getSummary()['traci_calls_per_step'],
+            # with libsumo SUMO's memory is part of peak_rss_mb
+            'peak_rss_mb': _peak_rss_mb(),
+            'sumo_peak_rss_mb': max(sumo_rss, default=None),
+            'result_bytes': os.path.getsize(infra.getFileName()),
+        }
+    except Exception:
+        return mode_name, {'error': traceback.format_exc()}
+
+
+def record_case(case):
+    from benchmarks.infrabench import record_frames
+    from signaltype import SignalMode
+
+    mode_name, steps, seed, path = case
+    config = make_config("sumo", seed, steps)
+    config.label = "frames_" + mode_name
+    return record_frames(SignalMode[mode_name].create(config), path)
+
+
+def _run_isolated(func, cases):
+    # one spawned process per case (the patches in run_case end with it), runs are sequential so they do not compete for cores
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(processes=1, maxtasksperchild=1, initializer=_worker_init) as pool:
+        return list(pool.imap(func, cases))
+
+
+def run_suite(mode_names, steps, seed, output_dir):
+    cases = [(mode, steps, seed, output_dir) for mode in mode_names]
+    return dict(_run_isolated(run_case, cases))
+
+
+def run_micro(steps, seed, repeat, frames_mode="Static"):
+    from benchmarks.infrabench import load_frames, replay
+
+    path = os.path.join(FRAME_DIR, "%s_%d_%d.pkl" % (frames_mode, steps, seed))
+    if not os.path.exists(path):
+        # needs SUMO once, later runs only read the frame file
+        _run_isolated(record_case, [(frames_mode, steps, seed, path)])
+    config = make_config("sumo", seed, steps)
+    return {'Infra.update': replay(config, load_frames(path), repeat)}
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_history(path=HISTORY_FILE):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return json.load(f)
+
+
+def append_history(record, path=HISTORY_FILE):
+    history = load_history(path)
+    history.append(record)
+    with open(path, 'w') as f:
+        json.dump(history, f, indent=2)
+    return history
+
+
+def find_baseline(history, record):
+    # last earlier run that measured the same thing on the same machine
+    for previous in reversed(history):
+        if previous is record:
+            continue
+        if all(previous.get(key) == record.get(key) for key in ('kind', 'steps', 'seed', 'host')):
+            return previous
+    return None
+
+
+def compare(record, baseline, threshold):
+    """Changes beyond threshold (relative) in the wrong direction: (case, metric, before, after)."""
+    regressions = []
+    metrics = METRICS[record['kind']]
+    for case, result in record['results'].items():
+        before = baseline['results'].get(case, {})
+        for metric, direction in metrics.items():
+            if result.get(metric) is None or not before.get(metric):
+                continue
+            change = (result[metric] - before[metric]) / before[metric]
+            if change * direction < -threshold:
+                regressions.append((case, metric, before[metric], result[metric]))
+    return regressions
+
+
+def format_table(record):
+    metrics = list(METRICS[record['kind']])
+    lines = ['%-16s' % 'case' + ''.join('%22s' % metric for metric in metrics)]
+    for case, result in record['results'].items():
+        if 'error' in result:
+            lines.append('%-16s %s' % (case, result['error'].strip().splitlines()[-1]))
+            continue
+        values = [result.get(metric) for metric in metrics]
+        lines.append('%-16s' % case + ''.join('%22s' % '-' if value is None else '%22.2f' % value for value in values))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    from signaltype import SignalMode
+
+    parser = argparse.ArgumentParser(description="Benchmark simulation throughput of the SignalMode controllers")
+    parser.add_argument("--modes", nargs="+", default=[mode.name for mode in SignalMode], help="SignalMode member names")
+    parser.add_argument("--steps", type=int, default=1800)
+    parser.add_argument("--seed", type=int, default=100)
+    parser.add_argument("--micro", action="store_true", help="replay recorded frames through Infra.update, no SUMO after the first run")
+    parser.add_argument("--repeat", type=int, default=5, help="--micro: replays, the best one is reported")
+    parser.add_argument("--output-dir", default=os.path.join("benchmarks", "results"), help="result files of the runs")
+    parser.add_argument("--history", default=HISTORY_FILE)
+    parser.add_argument("--no-history", action="store_true", help="do not append this run to the history")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative change reported as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true", help="exit with status 1 when a regression is found")
+    parser.add_argument("--check-collectors", action="store_true",
+                        help="compare the station counts of the subscription and polling paths on a generated grid, no benchmark")
+    args = parser.parse_args(argv)
+
+    log = simlog.getLogger(__name__)
+    simlog.configure()
+    if args.check_collectors:
+        from benchmarks.collectorcheck import check_collectors
+
+        stations, mismatches = check_collectors()
+        for station_id, (subscribed, polled) in mismatches.items():
+            log.warning('station %s: volume/exit volume %s with subscriptions, %s polling', station_id, subscribed, polled)
+        log.info('%d of %d stations differ between the subscription and polling paths', len(mismatches), stations)
+        if mismatches:
+            sys.exit(1)
+        return
+    if args.micro:
+        results = run_micro(args.steps, args.seed, args.repeat)
+    else:
+        results = run_suite(args.modes, args.steps, args.seed, args.output_dir)
+
+    record = {
+        'time': datetime.now().isoformat(timespec='seconds'),
+        'kind': 'micro' if args.micro else 'suite',
+        'commit': _git_commit(),
+        'host': platform.node(),
+        'python': platform.python_version(),
+        'steps': args.steps,
+        'seed': args.seed,
+        'results': results,
+    }
+    history = load_history(args.history) if args.no_history else append_history(record, args.history)
+    print(format_table(record))
+
+    baseline = find_baseline(history, record)
+    if baseline is None:
+        log.info('no earlier %s run with %d steps / seed %d on this host to compare with', record['kind'], args.steps, args.seed)
+        return
+    regressions = compare(record, baseline, args.threshold)
+    for case, metric, before, after in regressions:
+        log.warning('regression %s %s: %.2f -> %.2f (baseline %s, %s)', case, metric, before, after, baseline['commit'], baseline['time'])
+    if not regressions:
+        log.info('no regressions against %s (%s)', baseline['commit'], baseline['time'])
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
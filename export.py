@@ -0,0 +1,193 @@
+"""
+Section and total results of an Infra as Parquet or CSV tables.
+
+    export(infra, 'out/run1')                   # out/run1_sections.parquet, _intervals, _total
+    export(infra, 'out/run1', fmt='csv')        # CSV, written section by section
+    to_excel('out/run1_sections.parquet', 'out/run1.xlsx')     # optional, one sheet per metric
+
+The tables are in long format so the results of several runs can be
+concatenated (optional run column):
+
+    sections   section, TIME, SECTION_CO2, VOLUME, TRAFFIC_QUEUE, GREEN_TIME, WAITING_TIME
+    intervals  section, TIMEINT, SPEED_INT (appended every SMUtil.interval steps)
+    total      TIME, TOTAL_CO2, TOTAL_CO2_ACC, TOTAL_VOLUME, TOTAL_QUEUE
+
+Rows are sliced from the MetricStore columns, nothing is built per row.
+StreamingExporter writes the rows added since its last flush while the
+simulation runs (Config_SUMO.export_path). Parquet needs pyarrow, without it
+the default format is CSV.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+import simlog
+from Infra import Infra, SECTION_RESULT, TOTAL_RESULT
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+log = simlog.getLogger(__name__)
+
+DEFAULT_FORMAT = 'csv' if pq is None else 'parquet'
+SECTION_COLUMNS = (SECTION_RESULT.TIME, SECTION_RESULT.SECTION_CO2, SECTION_RESULT.VOLUME, SECTION_RESULT.TRAFFIC_QUEUE,
+                   SECTION_RESULT.GREEN_TIME, SECTION_RESULT.WAITING_TIME)
+INTERVAL_COLUMNS = (SECTION_RESULT.TIMEINT, SECTION_RESULT.SPEED_INT)
+# TOTAL_WAITING_TIME is not recorded
+TOTAL_COLUMNS = (TOTAL_RESULT.TIME, TOTAL_RESULT.TOTAL_CO2, TOTAL_RESULT.TOTAL_CO2_ACC, TOTAL_RESULT.TOTAL_VOLUME,
+                 TOTAL_RESULT.TOTAL_QUEUE)
+
+
+class _Table:
+    """Rows of one table and, per source (section or the Infra), how many of them are written."""
+    def __init__(self, name, keys, sources, run=None):
+        self.name = name
+        self.keys = keys
+        # (section id or None, getDatabyID)
+        self.sources = sources
+        self.run = run
+        self.positions = [0] * len(sources)
+        self.rows = 0
+
+    def take(self):
+        # one chunk of columns per source with new rows, columns appended in the same step are cut to the shortest
+        for i, (section_id, get) in enumerate(self.sources):
+            views = [get(key) for key in self.keys]
+            start, stop = self.positions[i], min(len(view) for view in views)
+            if stop <= start:
+                continue
+            self.positions[i] = stop
+            self.rows += stop - start
+            chunk = {}
+            if self.run is not None:
+                chunk['run'] = np.full(stop - start, self.run, dtype=object)
+            if section_id is not None:
+                chunk['section'] = np.full(stop - start, section_id, dtype=object)
+            for key, view in zip(self.keys, views):
+                chunk[key.name] = np.asarray(view[start:stop])
+            yield chunk
+
+
+class _ParquetWriter:
+    def __init__(self, path):
+        self.path = path
+        self.writer = None
+
+    def write(self, chunk):
+        table = pa.table(chunk)
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.path, table.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+class _CSVWriter:
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def write(self, chunk):
+        header = self.file is None
+        if header:
+            self.file = open(self.path, 'w', newline='')
+        pd.DataFrame(chunk, copy=False).to_csv(self.file, header=header, index=False)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+WRITERS = {'parquet': (_ParquetWriter, '.parquet'), 'csv': (_CSVWriter, '.csv')}
+
+
+def _tables(infra: Infra, run=None):
+    sections = infra.getSections()
+    return [_Table('sections', SECTION_COLUMNS, [(section_id, section.getDatabyID) for section_id, section in sections.items()], run),
+            _Table('intervals', INTERVAL_COLUMNS, [(section_id, section.getDatabyID) for section_id, section in sections.items()], run),
+            _Table('total', TOTAL_COLUMNS, [(None, infra.getDatabyID)], run)]
+
+
+def _check_format(fmt):
+    if fmt not in WRITERS:
+        raise ValueError("unknown export format %r, one of %s" % (fmt, ', '.join(WRITERS)))
+    if fmt == 'parquet' and pq is None:
+        raise ImportError("Parquet export needs pyarrow, use fmt='csv'")
+
+
+class StreamingExporter:
+    """Writes the rows added to an Infra since the last flush, during the run.
+
+    update() is called after Infra.update (any number of steps apart) and
+    flushes once `every` steps are pending, close() writes the rest.
+    """
+    def __init__(self, infra: Infra, prefix, fmt=None, run=None, every=600):
+        fmt = DEFAULT_FORMAT if fmt is None else fmt
+        _check_format(fmt)
+        writer, extension = WRITERS[fmt]
+        os.makedirs(os.path.dirname(os.path.abspath(prefix)), exist_ok=True)
+        self.infra = infra
+        self.every = every
+        self.tables = _tables(infra, run)
+        self.paths = {table.name: '%s_%s%s' % (prefix, table.name, extension) for table in self.tables}
+        self.writers = {table.name: writer(self.paths[table.name]) for table in self.tables}
+        self._flushed = 0
+
+    def update(self):
+        steps = len(self.infra.getDatabyID(TOTAL_RESULT.TIME))
+        if steps - self._flushed >= self.every:
+            self.flush()
+
+    def flush(self):
+        for table in self.tables:
+            writer = self.writers[table.name]
+            for chunk in table.take():
+                writer.write(chunk)
+        self._flushed = len(self.infra.getDatabyID(TOTAL_RESULT.TIME))
+
+    def close(self):
+        self.flush()
+        for writer in self.writers.values():
+            writer.close()
+        log.info('exported %s', ', '.join('%s (%d rows)' % (self.paths[table.name], table.rows) for table in self.tables))
+        return self.paths
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def export(infra: Infra, prefix, fmt=None, run=None):
+    """Writes the tables of infra to <prefix>_<table>.<fmt>, returns {table: path}."""
+    exporter = StreamingExporter(infra, prefix, fmt, run)
+    return exporter.close()
+
+
+def read_table(path) -> pd.DataFrame:
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path)
+    return pd.read_csv(path)
+
+
+def to_excel(path, xlsx_path, metrics=None):
+    """Converts an exported sections (or intervals) table to a workbook, one sheet of time x section per metric."""
+    df = read_table(path)
+    index = [column for column in ('run', 'TIME', 'TIMEINT') if column in df.columns]
+    if metrics is None:
+        metrics = [column for column in df.columns if column not in index and column != 'section']
+    with pd.ExcelWriter(xlsx_path) as writer:
+        for metric in metrics:
+            df.pivot(index=index, columns='section', values=metric).to_excel(writer, sheet_name=metric)
+    log.info('%s written', xlsx_path)
+    return xlsx_path
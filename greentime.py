@@ -0,0 +1,87 @@
+import math
+
+import numpy as np
+
+from Infra import Infra
+
+
+def allocate_green(queues, capacities, groups, total_green, min_green=0, max_green=math.inf):
+    """Green times of all sections of all intersections in one pass.
+
+    The sections of intersection g share total_green[g] in proportion to
+    queue / capacity, negative queues (more exits than inputs counted) weigh
+    0. The result is rounded (half to even, as round()) and clamped to
+    [min_green, max_green], NaN for the sections of an intersection without
+    queue.
+    """
+    weights = np.maximum(queues / capacities, 0)
+    # per intersection sums, added in section order
+    totals = np.bincount(groups, weights, minlength=len(total_green))[groups]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        green = np.where(totals > 0, weights / totals * total_green[groups], np.nan)
+    return np.clip(np.round(green), min_green, max_green)
+
+
+class GreenAllocator:
+    """allocate_green over the green phases of an Infra, the phase arrays are built once.
+
+    The sections of a TLS phase (the approaches it serves) share one green
+    time: their queues and capacities are summed per (tls_id, phase_index)
+    and the phases of an intersection split its green time.
+    capacity(section_id, intersection) is the queue divisor of a section,
+    total_green the green time of a cycle (one for every intersection or a
+    dict by TLS id). Green times are indexed by Section.index, every section
+    has the green time of its phase.
+    """
+    def __init__(self, infra: Infra, capacity, total_green, min_green=0, max_green=math.inf):
+        intersections = infra.getIntersections()
+        self.sections = list(infra.getSections().values())
+        self.tls_ids = list(intersections)
+        group_of = {tls_id: group for group, tls_id in enumerate(self.tls_ids)}
+        phase_of = {}
+        for section in self.sections:
+            phase_of.setdefault((section.tls_id, section.phase_index), len(phase_of))
+        self.phases = list(phase_of)
+        # by section: phase and intersection
+        self.section_phases = np.array([phase_of[(section.tls_id, section.phase_index)] for section in self.sections], dtype=np.intp)
+        self.section_groups = np.array([group_of[section.tls_id] for section in self.sections], dtype=np.intp)
+        # by phase
+        self.groups = np.array([group_of[tls_id] for tls_id, _ in self.phases], dtype=np.intp)
+        section_capacities = [capacity(section.id, intersections[section.tls_id]) for section in self.sections]
+        self.capacities = np.bincount(self.section_phases, section_capacities, minlength=len(self.phases))
+        self.stations = np.array([len(section.stations) for section in self.sections], dtype=np.float64)
+        if isinstance(total_green, dict):
+            self.total_green = np.array([total_green[tls_id] for tls_id in self.tls_ids], dtype=np.float64)
+        else:
+            self.total_green = np.full(len(self.tls_ids), total_green, dtype=np.float64)
+        self.min_green = min_green
+        self.max_green = max_green
+
+    def getQueues(self):
+        return np.fromiter((section.traffic_queue for section in self.sections), dtype=np.float64, count=len(self.sections))
+
+    def getTotalGreen(self):
+        # green time of a cycle by section
+        return self.total_green[self.section_groups]
+
+    def allocate(self, queues=None):
+        # section queues in, green times by section out; a negative section queue does not offset the others of its phase
+        queues = self.getQueues() if queues is None else queues
+        phase_queues = np.bincount(self.section_phases, np.maximum(queues, 0), minlength=len(self.phases))
+        green = allocate_green(phase_queues, self.capacities, self.groups, self.total_green, self.min_green, self.max_green)
+        return green[self.section_phases]
+
+    def assign(self, intersection, green_times, getSignalPlan):
+        """Sets the green times of the sections of intersection, False (nothing set) when it has no queue.
+
+        The phase duration is written once per phase, through its first section.
+        """
+        sections = intersection.getSections().values()
+        if not np.isfinite(green_times[[section.index for section in sections]]).all():
+            return False
+        written = set()
+        for section in sections:
+            signalPlan = None if section.phase_index in written else getSignalPlan(section.tls_id)
+            section.setGreenTime(int(green_times[section.index]), signalPlan)
+            written.add(section.phase_index)
+        return True
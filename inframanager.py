@@ -1,7 +1,9 @@
-from collections import deque
 from typing import Dict, List
-import pandas as pd
-from Infra import Infra, SECTION_RESULT
+import export
+import simlog
+from Infra import Infra
+
+log = simlog.getLogger(__name__)
 
 class InfraManager():
     def __init__(self, config, name="Static Control", simMode=True, filenames=None, isExternal=False):
@@ -31,46 +33,16 @@ class InfraManager():
         else:
             return None
 
-    def extract_excel(self, saveCompare=False):
-        section_results = deque()
-        append_result = section_results.append
-        file_name = ""
+    def extract_excel(self, saveCompare=False, excel=True):
+        # section/total tables (Parquet, CSV without pyarrow), the workbook is converted from the section table
         if saveCompare is False:
             data = self.getInfra()
+            file_name = 'section_results'
         else:
             data = self.compareInfra
-            file_name = 'extract_'
-
-        timedata = data.getSections()['0'].getDatabyID(SECTION_RESULT.TIME)
-        for i, time in enumerate(timedata):
-            for section_id, section in data.getSections().items():
-                section_co2_emission, section_volume, traffic_queue, green_time = section.collect_data()
-
-                # print("%s - v: %d, Q: %d"%(section_id, section_volume, section_queue))
-                append_result({
-                    'Time': time,
-                    'Section': section_id,
-                    'Section_CO2_Emission': section.getDatabyID(SECTION_RESULT.SECTION_CO2)[i],
-                    'Section_Volume': section.getDatabyID(SECTION_RESULT.VOLUME)[i],
-                    'traffic_queue': section.getDatabyID(SECTION_RESULT.TRAFFIC_QUEUE)[i],
-                    'green_time': section.getDatabyID(SECTION_RESULT.GREEN_TIME)[i],
-                    'sectionBound': str(section.direction)
-                })
-
-        df = pd.DataFrame(section_results)
-
-        co2_emission_df = df.pivot(index='Time', columns='Section', values='Section_CO2_Emission')
-        volume_df = df.pivot(index='Time', columns='Section', values='Section_Volume')
-        queue_df = df.pivot(index='Time', columns='Section', values='traffic_queue')
-        greentime_df = df.pivot(index='Time', columns='Section', values='green_time')
-        MaxAccel_df = df.pivot(index='Time', columns='Section', values='Section_Max_Accel')
-        MaxDecel_df = df.pivot(index='Time', columns='Section', values='Section_Max_Decel')
-        with pd.ExcelWriter(file_name + 'section_results.xlsx') as writer:
-            co2_emission_df.to_excel(writer, sheet_name='Section_CO2_Emission')
-            volume_df.to_excel(writer, sheet_name='Section_Volume')
-            queue_df.to_excel(writer, sheet_name='traffic_queue')
-            greentime_df.to_excel(writer, sheet_name='green_time')
-            MaxAccel_df.to_excel(writer, sheet_name='Section_Max_Accel')
-            MaxDecel_df.to_excel(writer, sheet_name='Section_Max_Decel')
+            file_name = 'extract_section_results'
 
-        print("Maked Excel")
\ No newline at end of file
+        paths = export.export(data, file_name)
+        if excel:
+            export.to_excel(paths['sections'], file_name + '.xlsx')
+        return paths
@@ -0,0 +1,95 @@
+import numpy as np
+
+# one full run of the test scenario (Config_SUMO.max_step steps plus the initial one)
+DEFAULT_CAPACITY = 11701
+
+
+class MetricColumn:
+    """Append-only numeric column backed by a preallocated array.
+
+    The array grows geometrically when full, view() returns the filled part
+    without copying.
+    """
+    __slots__ = ('_data', '_size')
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, dtype=np.float32):
+        self._data = np.empty(max(1, capacity), dtype=dtype)
+        self._size = 0
+
+    def append(self, value):
+        if self._size == len(self._data):
+            self._grow(self._size + 1)
+        self._data[self._size] = value
+        self._size += 1
+
+    def extend(self, values):
+        values = np.asarray(values, dtype=self._data.dtype)
+        size = self._size + len(values)
+        if size > len(self._data):
+            self._grow(size)
+        self._data[self._size:size] = values
+        self._size = size
+
+    def _grow(self, minimum):
+        data = np.empty(max(len(self._data) * 2, minimum), dtype=self._data.dtype)
+        data[:self._size] = self._data[:self._size]
+        self._data = data
+
+    def view(self):
+        return self._data[:self._size]
+
+    def last(self, default=0):
+        if self._size > 0:
+            return self._data[self._size - 1].item()
+        return default
+
+    def __len__(self):
+        return self._size
+
+    def __getstate__(self):
+        # only the filled part is serialized
+        return (self.view().copy(),)
+
+    def __setstate__(self, state):
+        self._data = state[0]
+        self._size = len(self._data)
+
+    @classmethod
+    def from_values(cls, values, dtype=np.float32):
+        if isinstance(values, cls):
+            return values
+        column = cls(len(values), dtype)
+        column.extend(values)
+        return column
+
+
+class MetricStore:
+    """One MetricColumn per result key."""
+    def __init__(self, keys, capacity=DEFAULT_CAPACITY, dtypes=None):
+        dtypes = {} if dtypes is None else dtypes
+        self.columns = {key: MetricColumn(capacity, dtypes.get(key, np.float32)) for key in keys}
+
+    def column(self, key) -> MetricColumn:
+        return self.columns[key]
+
+    def view(self, key):
+        return self.columns[key].view()
+
+    def keys(self):
+        return self.columns.keys()
+
+    @classmethod
+    def from_columns(cls, columns: dict):
+        # wrap existing column objects (e.g. memory-mapped columns of a result file)
+        store = cls(())
+        store.columns.update(columns)
+        return store
+
+    @classmethod
+    def from_dict(cls, data: dict, dtypes=None):
+        # rebuild a store from per-key sequences (e.g. the deques of older result files)
+        dtypes = {} if dtypes is None else dtypes
+        store = cls(())
+        for key, values in data.items():
+            store.columns[key] = MetricColumn.from_values(values, dtypes.get(key, np.float32))
+        return store
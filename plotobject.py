@@ -8,9 +8,11 @@ from PyQt5.QtWidgets import *
 from PyQt5.QtCore import QThread, pyqtSignal, QTimer, pyqtSlot
 import pyqtgraph as pg
 from pyqtgraph import PlotWidget
-from scipy.signal import butter, filtfilt
+from scipy.signal import butter, lfilter, lfilter_zi, sosfilt, sosfilt_zi
 
-from Infra import Direction, Infra, SECTION_RESULT, TOTAL_RESULT, SMUtil
+from Infra import Infra, SECTION_RESULT, TOTAL_RESULT, SMUtil
+from metricstore import MetricColumn
+from snapshot import InfraSnapshot
 
 
 class PLOTMODE(Enum):
@@ -31,6 +33,88 @@ class PLOTMODE(Enum):
                 return mode
         raise ValueError(f"{result} is not a valid SignalMode value")
 
+class StreamingLowPass:
+    """Causal Butterworth low-pass filter that keeps its state between chunks."""
+    def __init__(self, cutoff=0.05, fs=1.0, order=8):
+        nyq = 0.5 * fs  # Nyquist Frequency
+        self.sos = butter(order, cutoff / nyq, btype='low', output='sos')
+        self.zi = None
+
+    def reset(self):
+        self.zi = None
+
+    def __call__(self, data):
+        if self.zi is None:
+            # start from the first sample instead of ramping up from zero
+            self.zi = sosfilt_zi(self.sos) * data[0]
+        out, self.zi = sosfilt(self.sos, data, zi=self.zi)
+        return out
+
+
+class StreamingMovingAverage:
+    """Trailing moving average that keeps its state between chunks."""
+    def __init__(self, window_size):
+        self.b = np.ones(window_size) / window_size
+        self.zi = None
+
+    def reset(self):
+        self.zi = None
+
+    def __call__(self, data):
+        if self.zi is None:
+            self.zi = lfilter_zi(self.b, [1.0]) * data[0]
+        out, self.zi = lfilter(self.b, [1.0], data, zi=self.zi)
+        return out
+
+
+# most points a curve hands to pyqtgraph per frame
+MAX_DISPLAY_POINTS = 2000
+
+
+class CurveBuffer:
+    """Append-only display data of one curve, only new source samples are processed."""
+    def __init__(self, datafilter=None):
+        self.datafilter = datafilter
+        self.reset()
+
+    def reset(self):
+        self.consumed = 0
+        self.x = MetricColumn()
+        self.y = MetricColumn()
+        if self.datafilter is not None:
+            self.datafilter.reset()
+
+    def update(self, x, y, scale=1):
+        # returns the processed new samples, None if there is nothing new
+        size = min(len(x), len(y))
+        if size < self.consumed:
+            self.reset()
+        if size == self.consumed:
+            return None
+
+        new_y = np.asarray(y[self.consumed:size], dtype=np.float64)
+        if scale != 1:
+            new_y = new_y * scale
+        if self.datafilter is not None:
+            new_y = self.datafilter(new_y)
+        self.x.extend(x[self.consumed:size])
+        self.y.extend(new_y)
+        self.consumed = size
+        return new_y
+
+    def getDisplayData(self, window=None):
+        # the last window (x units) of the curve or all of it, every n-th sample beyond MAX_DISPLAY_POINTS
+        x, y = self.x.view(), self.y.view()
+        if window is not None and len(x) > 0:
+            start = np.searchsorted(x, x[-1] - window)
+            x, y = x[start:], y[start:]
+        step = -(-len(x) // MAX_DISPLAY_POINTS)
+        if step > 1:
+            # keep the last sample so the curve reaches the current time
+            x, y = x[::-1][::step][::-1], y[::-1][::step][::-1]
+        return x, y
+
+
 class PlotObject():
     def __init__(self, title, l_bottom, l_left, sel_data, useComp=False, compInfra: List[Infra]=None, ismoving=False, interval=500, isTimeInterval=False):
         self._title = title
@@ -46,6 +130,8 @@ class PlotObject():
         self._plotwidget: PlotWidget = None
         self._plots = []
         self._labels = []
+        self._buffers: List[CurveBuffer] = []
+        self._source = None
         self._compInfra: List[Infra] = compInfra
         self.isCompAdded = False
         self.useComp = useComp
@@ -75,7 +161,7 @@ class PlotObject():
 
     def setPlotYRange(self, data):
         if len(data) > 0:
-            data = np.array(data)
+            data = np.asarray(data)
             min_v = np.min(data)
             max_v = np.max(data)
             self._ymax = max(self._ymax, max_v)
@@ -89,11 +175,19 @@ class PlotObject():
             label.setPos(x, y_max)
             y_max -= d_gap
 
+    def makeFilter(self):
+        return None
+
     def addPlot(self, name='default', color='black'):
         if self._sel_data != SECTION_RESULT.GREEN_TIME:
-            self._plots.append(self._plotwidget.plot(pen=color))
+            plot = self._plotwidget.plot(pen=color)
         else:
-            self._plots.append(self._plotwidget.plot(pen=None, symbol='o', symbolSize=3, symbolBrush=color, symbolPen=None))
+            plot = self._plotwidget.plot(pen=None, symbol='o', symbolSize=3, symbolBrush=color, symbolPen=None)
+        # draw only the visible range, reduced to about one point per pixel
+        plot.setClipToView(True)
+        plot.setDownsampling(auto=True, method='peak')
+        self._plots.append(plot)
+        self._buffers.append(CurveBuffer(self.makeFilter()))
 
         color_str = f"RGB{color}"
         #add label
@@ -108,6 +202,7 @@ class PlotObject():
                 while len(self._plots) > 0:
                     self._plotwidget.removeItem(self._plots.pop())
                     self._plotwidget.removeItem(self._labels.pop())
+                    self._buffers.pop()
 
             for i, ci in enumerate(self._compInfra):
                 color = 'b'
@@ -123,47 +218,30 @@ class PlotObject():
     def setLabelText(self, idx, name):
         self._labels[idx].setPlainText(name)
 
-    def low_pass_filter(self, data, cutoff=0.05, fs=1.0, order=8):
-        if len(data) <= 15:  # 필터의 padlen보다 작은 경우
-            return data  # 필터링을 건너뛰고 원래 데이터를 반환
-        nyq = 0.5 * fs  # Nyquist Frequency
-        normal_cutoff = cutoff / nyq
-        b, a = butter(order, normal_cutoff, btype='low', analog=False)
-        y = filtfilt(b, a, data, padlen=5)  # padlen 값을 줄여서 설정
-        return y
-
-    def moving_average(self, data, window_size=None):
-        dsize = len(data)
-        if window_size is None:
-            window_size = max(1, int(dsize * 0.05))
-
-        if len(data) < window_size:
-            return data  # 데이터가 창 크기보다 작으면 필터링을 건너뜁니다.
-        return np.convolve(data, np.ones(window_size) / window_size, mode='same')
+    def updateCurve(self, idx, x, y, scale=1):
+        # only samples added since the last frame are filtered and scanned for the y range
+        buffer = self._buffers[idx]
+        new_data = buffer.update(x, y, scale)
+        if new_data is None:
+            return False
+        self._plots[idx].setData(*buffer.getDisplayData(self._movingInterval if self._isMoving else None))
+        self.setPlotYRange(new_data)
+        return True
 
     def updateLabels(self, xmin=0):
         #y_max = self._plotwidget.plotItem.viewRange()[1][1]
         self.setLabelPos(xmin, self._ymax)
 
-    def trimData(self, time, raw):
-        a = np.array(time)
-        b = np.array(raw)
-
-        if len(a) == 0 or len(b) == 0:
-            return a, b
-        else:
-            # 두 배열 중 더 짧은 길이 찾기
-            min_length = min(len(a), len(b))
-
-            # 더 짧은 길이에 맞춰 자르기
-            a_trimmed = a[:min_length]
-            b_trimmed = b[:min_length]
-            return a_trimmed, b_trimmed
-
     def updatePlot(self):
         pass
 
     def update(self, rtinfra, compare_infras):
+        source = rtinfra.source if isinstance(rtinfra, InfraSnapshot) else rtinfra
+        if source is not self._source:
+            # new simulation run, curves start over
+            for buffer in self._buffers:
+                buffer.reset()
+            self._source = source
         self.rtinfra = rtinfra
         self._compInfra = compare_infras
         if self._compInfra is not None and self.isCompAdded is False:
@@ -185,51 +263,46 @@ class PlotObject():
 class PlotSection(PlotObject):
     def __init__(self, title, l_bottom, l_left, sel_data, ismoving=False, interval=500, istimeinterval=False):
         super().__init__(title, l_bottom, l_left, sel_data, useComp=False, ismoving=ismoving, interval=interval, isTimeInterval=istimeinterval)
-        self.sectionColor = {}
-        self.__initSectionColor()
-        self.__initSectionplot()
-
-    def __initSectionColor(self):
-        for i, dr in enumerate(Direction):
-            print(dr.value[0])
-            self.sectionColor[dr.value[0]] = (dr.name, self.colorset[i])
+        # section id of each curve, from the infra of the running simulation
+        self._sectionIds = []
+
+    def __initSectionplot(self, infra):
+        # one curve per section of every intersection, Direction names and colors (SB, NB, EB, WB) on the single junction
+        while len(self._plots) > 0:
+            self._plotwidget.removeItem(self._plots.pop())
+            self._plotwidget.removeItem(self._labels.pop())
+            self._buffers.pop()
+        self._sectionIds = []
+        for intersection in infra.getIntersections().values():
+            for section in intersection.getSections().values():
+                i = len(self._sectionIds)
+                color = self.colorset[i] if i < len(self.colorset) else self.generate_random_color()
+                self.addPlot(section.id if section.direction is None else section.direction.name, color)
+                self._sectionIds.append(section.id)
+
+    def makeFilter(self):
+        if self._sel_data == SECTION_RESULT.GREEN_TIME:
+            return None
+        return StreamingMovingAverage(max(1, int(self._movingInterval * 0.05)))
 
-    def __initSectionplot(self):
-        for i in range(4):
-            self.addPlot(self.sectionColor[i][0], self.sectionColor[i][1])
+    def update(self, rtinfra, compare_infras):
+        source = rtinfra.source if isinstance(rtinfra, InfraSnapshot) else rtinfra
+        if source is not self._source:
+            self.__initSectionplot(source)
+        super().update(rtinfra, compare_infras)
 
     def updatePlot(self):
         sections = self.rtinfra.getSections()
-        time_data = None#self.rtinfra.getTime()
-        data = None
-        for i, plot in enumerate(self._plots):
-            if self._isTimeInterval is False:
-                time_data = sections[str(i)].getDatabyID(SECTION_RESULT.TIME)
-            else:
-                time_data = sections[str(i)].getDatabyID(SECTION_RESULT.TIMEINT)
-
-            rawdata = sections[str(i)].getDatabyID(self._sel_data)
-            if self._isMoving is True:
-                time_data = list(time_data)[-self._movingInterval:]
-                rawdata = list(rawdata)[-self._movingInterval:]
-
-            time_data, rawdata = self.trimData(time_data, rawdata)
-
-            if self._sel_data != SECTION_RESULT.GREEN_TIME:
-                #rawdata = self.low_pass_filter(rawdata)
-                rawdata = self.moving_average(rawdata)
-
-            # min_length = min(len(time_data), len(data))
-            # time_data = list(time_data)[:min_length]
-            # data = list(data)[:min_length]
-
-            plot.setData(time_data, rawdata)
-            self.setPlotYRange(rawdata)
-            #self._plotwidget.plotItem.setYRange(min(min(data), 0), max(data)+)
+        time_id = SECTION_RESULT.TIMEINT if self._isTimeInterval else SECTION_RESULT.TIME
+        for i, section_id in enumerate(self._sectionIds):
+            section = sections.get(section_id)
+            if section is not None:
+                self.updateCurve(i, section.getDatabyID(time_id), section.getDatabyID(self._sel_data))
 
-        if self._isMoving is True:
-            self._plotwidget.plotItem.setXRange(max(time_data[-1] - self._movingInterval, 0), time_data[-1])
-            self.updateLabels(max(time_data[-1] - self._movingInterval, 0))
+        last_time = self._buffers[0].x.last(None) if self._buffers else None
+        if self._isMoving is True and last_time is not None:
+            self._plotwidget.plotItem.setXRange(max(last_time - self._movingInterval, 0), last_time)
+            self.updateLabels(max(last_time - self._movingInterval, 0))
 
 
 class PlotInfra(PlotObject):
@@ -240,37 +313,19 @@ class PlotInfra(PlotObject):
         self.addCompPlot(self._compInfra)
         self.addPlot('Proposed', 'r')
 
-    def updatePlot(self):
-        time_data = self.rtinfra.getTime()
-        data = self.rtinfra.getDatabyID(self._sel_data)
+    def makeFilter(self):
+        if self._sel_data == TOTAL_RESULT.TOTAL_CO2:
+            return StreamingLowPass()
+        return None
 
+    def updatePlot(self):
+        scale = 1
         if self._sel_data == TOTAL_RESULT.TOTAL_CO2 or self._sel_data == TOTAL_RESULT.TOTAL_CO2_ACC:
-            data = np.array(data) / 1000
+            scale = 1 / 1000
 
-        # min_length = min(len(time_data), len(data))
-        # time_data = list(time_data)[:min_length]
-        # data = list(data)[:min_length]
-
-        time_data, rawdata = self.trimData(time_data, data)
-        if self._sel_data == TOTAL_RESULT.TOTAL_CO2:
-            rawdata = self.low_pass_filter(rawdata)
-        self._plots[-1].setData(time_data, rawdata)
-        self.setPlotYRange(data)
+        self.updateCurve(len(self._plots) - 1, self.rtinfra.getTime(), self.rtinfra.getDatabyID(self._sel_data), scale)
 
-        compinfra = None
+        # saved runs do not grow, their curves are processed once
         if self._compInfra is not None:
             for i, ci in enumerate(self._compInfra):
-                comptime = ci.getTime()
-                compinfra = ci.getDatabyID(self._sel_data) if ci is not None else 0
-
-                if self._sel_data == TOTAL_RESULT.TOTAL_CO2  or self._sel_data == TOTAL_RESULT.TOTAL_CO2_ACC:
-                    compinfra = np.array(compinfra) / 1000
-
-                # min_length = min(len(comptime), len(compinfra))
-                # comptime = list(comptime)[:min_length]
-                # compinfra = list(compinfra)[:min_length]
-                comptime, compinfra = self.trimData(comptime, compinfra)
-                if self._sel_data == TOTAL_RESULT.TOTAL_CO2:
-                    compinfra = self.low_pass_filter(compinfra)
-                self._plots[i].setData(comptime, compinfra)
-                self.setPlotYRange(compinfra)
+                self.updateCurve(i, ci.getTime(), ci.getDatabyID(self._sel_data), scale)
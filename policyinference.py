@@ -0,0 +1,98 @@
+import logging
+import time
+
+import numpy as np
+import torch
+
+import simlog
+from metricstore import MetricColumn
+
+log = simlog.getLogger(__name__)
+
+
+class PolicyRunner:
+    """Greedy/epsilon-greedy action selection of a DQN policy without SB3 predict overhead.
+
+    The Q network is traced to TorchScript once and warmed up, observations are
+    copied into a preallocated input buffer shared with the input tensor.
+    Per decision the policy latency and the whole decision time (observation,
+    policy and applying the action) are recorded.
+    """
+    def __init__(self, model, warmup=10, batch_size=1, num_threads=1):
+        # the network is tiny, intra-op threads only add wake-up latency next to SUMO
+        if num_threads is not None:
+            torch.set_num_threads(num_threads)
+        self.exploration_rate = model.exploration_rate
+        self.n_actions = model.action_space.n
+        obs_size = int(np.prod(model.observation_space.shape))
+
+        q_net = model.q_net.to('cpu').eval()
+        self.obs_buffer = np.zeros((batch_size, obs_size), dtype=np.float32)
+        self._input = torch.from_numpy(self.obs_buffer)
+        with torch.no_grad():
+            self.q_function = torch.jit.freeze(torch.jit.trace(q_net, self._input))
+            for _ in range(warmup):
+                self.q_function(self._input)
+
+        self.policy_latency = MetricColumn(dtype=np.float64)
+        self.decision_latency = MetricColumn(dtype=np.float64)
+        self._decision_start = None
+
+    def getObservationBuffer(self, idx=0):
+        # observation builders write into this row directly
+        return self.obs_buffer[idx]
+
+    def startDecision(self):
+        self._decision_start = time.perf_counter_ns()
+
+    def endDecision(self):
+        if self._decision_start is not None:
+            self.decision_latency.append((time.perf_counter_ns() - self._decision_start) / 1000)
+            self._decision_start = None
+
+    def q_values(self, batch=1):
+        start = time.perf_counter_ns()
+        with torch.no_grad():
+            q = self.q_function(self._input[:batch]).numpy()
+        self.policy_latency.append((time.perf_counter_ns() - start) / 1000)
+        return q
+
+    def predict(self, obs=None, deterministic=False):
+        # same action selection as DQN.predict for a single observation
+        if obs is not None:
+            self.obs_buffer[0] = np.ravel(obs)
+        if not deterministic and np.random.rand() < self.exploration_rate:
+            return int(np.random.randint(self.n_actions))
+        return int(self.q_values(1)[0].argmax())
+
+    def predict_batch(self, observations=None, deterministic=False):
+        # one forward pass for several observations (e.g. one per intersection)
+        if observations is not None:
+            batch = len(observations)
+            self.obs_buffer[:batch] = observations
+        else:
+            batch = len(self.obs_buffer)
+        actions = self.q_values(batch).argmax(axis=1)
+        if not deterministic:
+            explore = np.random.rand(batch) < self.exploration_rate
+            actions[explore] = np.random.randint(self.n_actions, size=int(explore.sum()))
+        return actions
+
+    def getLatencyStats(self) -> dict:
+        # microseconds, overhead = decision time that is not spent in the policy
+        stats = {'decisions': len(self.decision_latency), 'policy_calls': len(self.policy_latency)}
+        for name, column in (('policy', self.policy_latency), ('decision', self.decision_latency)):
+            data = column.view()
+            if len(data) == 0:
+                continue
+            stats[name + '_us_mean'] = float(data.mean())
+            stats[name + '_us_p50'] = float(np.percentile(data, 50))
+            stats[name + '_us_p99'] = float(np.percentile(data, 99))
+        if len(self.decision_latency) > 0 and len(self.policy_latency) > 0:
+            stats['overhead_us_mean'] = stats['decision_us_mean'] - float(self.policy_latency.view().sum()) / len(self.decision_latency)
+        return stats
+
+    def report(self):
+        if log.isEnabledFor(logging.INFO):
+            stats = self.getLatencyStats()
+            log.info('policy latency (us) %s', ', '.join(f'{key}={value:.1f}' for key, value in stats.items()))
@@ -0,0 +1,299 @@
+"""
+Hot-path profiler for a simulation run.
+
+    profiler = Profiler(trace=True)
+    with profiler:
+        controller.run_simulation()
+    profiler.report()
+    profiler.saveChromeTrace('run.trace.json')
+
+While active, the stages listed in _stages() are wrapped with timers (inclusive times,
+Infra.update contains SSection.update contains SStation.update ...) and every
+TraCI command is counted by command/variable. Times are accumulated per
+simulation step, a step starts with each traci.simulationStep call.
+TraCI counts are not available with libsumo (no TraCI connection).
+Stages called from other threads (e.g. the GUI's emit_results) are summed
+separately under a lock and reported apart from the per-step stages.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+import traci
+import traci.constants as tc
+
+import simlog
+from Infra import Infra, SSection, SStation, SDetector
+from metricstore import MetricColumn
+
+log = simlog.getLogger(__name__)
+
+try:
+    from traci.connection import Connection
+except ImportError:
+    # libsumo as traci
+    Connection = None
+
+STEP = 'simulationStep'
+
+
+def _stages():
+    # (stage name, owner, attribute)
+    trafficlight = traci.trafficlight if isinstance(traci.trafficlight, type) else type(traci.trafficlight)
+    stages = [
+        (STEP, Connection, 'simulationStep') if Connection is not None else (STEP, traci, 'simulationStep'),
+        ('getAllProgramLogics', trafficlight, 'getAllProgramLogics'),
+        ('setProgramLogic', trafficlight, 'setProgramLogic'),
+        ('Infra.update', Infra, 'update'),
+        ('SSection.update', SSection, 'update'),
+        ('SStation.update', SStation, 'update'),
+        ('SDetector.update', SDetector, 'update'),
+    ]
+    return stages
+
+
+def _command_names():
+    # cmd id -> (name, preferred var prefix), var ids are reused, the shortest matching constant is shown
+    cmds = {}
+    for name in dir(tc):
+        if name.startswith('CMD_') and isinstance(getattr(tc, name), int):
+            cmds.setdefault(getattr(tc, name), (name, 'VAR_'))
+    try:
+        from traci.domain import DOMAINS
+    except ImportError:
+        DOMAINS = []
+    for domain in DOMAINS:
+        prefix = {'trafficlight': 'TL_', 'inductionloop': 'LAST_STEP_', 'lanearea': 'LAST_STEP_'}.get(domain._name, 'VAR_')
+        cmds[domain._cmdGetID] = (domain._name + '.get', prefix)
+        cmds[domain._cmdSetID] = (domain._name + '.set', prefix)
+        cmds[domain._subscribeID] = (domain._name + '.subscribe', prefix)
+    vars = {}
+    for name in dir(tc):
+        value = getattr(tc, name)
+        if isinstance(value, int) and name.startswith(('VAR_', 'LAST_STEP_', 'TL_', 'TRACI_ID_LIST', 'ID_COUNT')):
+            vars.setdefault(value, []).append(name)
+    return cmds, vars
+
+
+def _command_name(cmds, vars, cmd, var):
+    name, prefix = cmds.get(cmd, (hex(cmd), 'VAR_'))
+    if var is None:
+        return name
+    candidates = vars.get(var, [])
+    preferred = [c for c in candidates if c.startswith(prefix)] or candidates
+    return '%s:%s' % (name, min(preferred, key=len) if preferred else hex(var))
+
+
+class Profiler:
+    def __init__(self, controller=None, trace=False, extra_stages=(), timed=True):
+        # controller: its _signalControl is timed as well, extra_stages: more (name, owner, attribute) to time
+        # timed=False: only simulationStep is wrapped (step boundaries), TraCI calls are still counted
+        self.controller = controller
+        self.trace = trace
+        self.timed = timed
+        self.extra_stages = list(extra_stages)
+        self.step_columns = {}
+        self.calls = Counter()
+        self.step_times = {}
+        self.traci_calls = Counter()
+        self.traci_calls_per_step = MetricColumn(dtype=np.int64)
+        self.trace_events = []
+        # stages run outside the simulation thread: totals (ns) and calls, guarded by _lock
+        self.thread_times = Counter()
+        self.thread_calls = Counter()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._patched = []
+        self._steps = 0
+        self._step_traci = 0
+        self._started = None
+
+    # --- instrumentation ---
+    def _timed(self, stage, func):
+        profiler = self
+        step_times = self.step_times
+        calls = self.calls
+        pid = os.getpid()
+
+        def wrapper(*args, **kwargs):
+            if stage == STEP:
+                profiler._nextStep()
+            start = time.perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                end = time.perf_counter_ns()
+                thread = threading.get_ident()
+                if thread == profiler._thread:
+                    step_times[stage] = step_times.get(stage, 0) + (end - start)
+                    calls[stage] += 1
+                else:
+                    # the simulation thread flushes step_times meanwhile, not part of a step
+                    with profiler._lock:
+                        profiler.thread_times[stage] += end - start
+                        profiler.thread_calls[stage] += 1
+                if profiler.trace:
+                    profiler.trace_events.append((stage, start, end - start, pid, thread))
+        wrapper.__wrapped__ = func
+        return wrapper
+
+    def _patch(self, stage, owner, name):
+        # methods inherited from a base class are patched on owner and removed again in stop()
+        own = name in owner.__dict__
+        original = owner.__dict__[name] if own else getattr(owner, name)
+        setattr(owner, name, self._timed(stage, original))
+        self._patched.append((owner, name, original if own else None))
+
+    def _patchTraci(self):
+        if Connection is None:
+            return
+        counts = self.traci_calls
+        profiler = self
+        original = Connection._sendCmd
+
+        def sendCmd(conn, cmdID, varID, objID, format="", *values):
+            counts[(cmdID, varID if not isinstance(varID, tuple) else None)] += 1
+            profiler._step_traci += 1
+            return original(conn, cmdID, varID, objID, format, *values)
+        Connection._sendCmd = sendCmd
+        self._patched.append((Connection, '_sendCmd', original))
+
+    def _nextStep(self):
+        if self._steps > 0:
+            self._flushStep()
+        self._steps += 1
+
+    def _flushStep(self):
+        for stage, total in self.step_times.items():
+            column = self.step_columns.get(stage)
+            if column is None:
+                column = self.step_columns[stage] = MetricColumn(dtype=np.float64)
+            # stages first seen later in the run had 0 in the earlier steps
+            missing = self._steps - 1 - len(column)
+            if missing > 0:
+                column.extend(np.zeros(missing))
+            column.append(total / 1000)
+        self.step_times.clear()
+        self.traci_calls_per_step.append(self._step_traci)
+        self._step_traci = 0
+
+    def start(self):
+        # run_simulation is called from the starting thread
+        self._thread = threading.get_ident()
+        stages = _stages()
+        if self.controller is not None:
+            stages.append(('_signalControl', type(self.controller), '_signalControl'))
+        stages.extend(self.extra_stages)
+        for stage, owner, name in stages:
+            if self.timed or stage == STEP:
+                self._patch(stage, owner, name)
+        self._patchTraci()
+        self._started = time.perf_counter_ns()
+        return self
+
+    def stop(self):
+        if self._steps > 0:
+            self._flushStep()
+        while self._patched:
+            owner, name, original = self._patched.pop()
+            if original is None:
+                delattr(owner, name)
+            else:
+                setattr(owner, name, original)
+        self.wall_time = (time.perf_counter_ns() - self._started) / 1e9
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    # --- results ---
+    def getSteps(self):
+        return len(self.traci_calls_per_step)
+
+    def getSummary(self) -> dict:
+        steps = max(self.getSteps(), 1)
+        stages = {}
+        for stage, column in self.step_columns.items():
+            data = column.view()
+            if len(data) < steps:
+                data = np.concatenate([data, np.zeros(steps - len(data))])
+            stages[stage] = {
+                'calls': self.calls[stage],
+                'calls_per_step': self.calls[stage] / steps,
+                'total_ms': float(data.sum()) / 1000,
+                'step_us_p50': float(np.percentile(data, 50)),
+                'step_us_p95': float(np.percentile(data, 95)),
+                'step_us_p99': float(np.percentile(data, 99)),
+            }
+        with self._lock:
+            thread_stages = {stage: {
+                'calls': self.thread_calls[stage],
+                'total_ms': self.thread_times[stage] / 1e6,
+                'call_us_mean': self.thread_times[stage] / 1000 / self.thread_calls[stage],
+            } for stage in self.thread_calls}
+        cmds, vars = _command_names()
+        traci_calls = {}
+        for (cmd, var), count in self.traci_calls.most_common():
+            traci_calls[_command_name(cmds, vars, cmd, var)] = count
+        return {
+            'steps': self.getSteps(),
+            'wall_time': self.wall_time,
+            'stages': stages,
+            'thread_stages': thread_stages,
+            'traci_calls_per_step': float(self.traci_calls_per_step.view().mean()) if self.getSteps() > 0 else 0.0,
+            'traci_calls': traci_calls,
+        }
+
+    def report(self, top=10):
+        if not log.isEnabledFor(logging.INFO):
+            return
+        summary = self.getSummary()
+        lines = ['profile: %d steps, %.2f s, %.1f TraCI calls/step' %
+                 (summary['steps'], summary['wall_time'], summary['traci_calls_per_step'])]
+        lines.append('%-20s %10s %10s %10s %10s %10s %10s' % ('stage', 'calls/step', 'total ms', 'p50 us', 'p95 us', 'p99 us', 'share'))
+        for stage, s in sorted(summary['stages'].items(), key=lambda item: -item[1]['total_ms']):
+            lines.append('%-20s %10.2f %10.1f %10.1f %10.1f %10.1f %9.1f%%' %
+                         (stage, s['calls_per_step'], s['total_ms'], s['step_us_p50'], s['step_us_p95'], s['step_us_p99'],
+                          100 * s['total_ms'] / 1000 / summary['wall_time']))
+        if summary['thread_stages']:
+            lines.append('%-20s %10s %10s %10s (other threads)' % ('stage', 'calls', 'total ms', 'mean us'))
+            for stage, s in summary['thread_stages'].items():
+                lines.append('%-20s %10d %10.1f %10.1f' % (stage, s['calls'], s['total_ms'], s['call_us_mean']))
+        for name, count in list(summary['traci_calls'].items())[:top]:
+            lines.append('  %-48s %10d %8.2f/step' % (name, count, count / max(summary['steps'], 1)))
+        log.info('\n'.join(lines))
+
+    def saveChromeTrace(self, path):
+        # chrome://tracing / Perfetto JSON, times in microseconds
+        events = [{'name': stage, 'ph': 'X', 'ts': start / 1000, 'dur': dur / 1000, 'pid': pid, 'tid': tid}
+                  for stage, start, dur, pid, tid in self.trace_events]
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+        return path
+
+
+def profile_run(controller, extra_stages=()):
+    """Run controller.run_simulation, profiled when Config_SUMO.profile is set.
+
+    Returns the Profiler, or None when profiling is off.
+    """
+    config = controller.config
+    if not config.profile:
+        controller.run_simulation()
+        return None
+    profiler = Profiler(controller, trace=config.profile_trace is not None, extra_stages=extra_stages)
+    with profiler:
+        controller.run_simulation()
+    profiler.report()
+    if config.profile_trace is not None:
+        profiler.saveChromeTrace(config.profile_trace)
+    return profiler
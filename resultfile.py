@@ -0,0 +1,157 @@
+"""
+Result file layout (version 1)
+
+    prefix   : magic b'SIMRES', uint16 version, uint32 header length (little endian)
+    header   : UTF-8 JSON (run info, total/section column table)
+    columns  : raw little endian arrays, each block aligned to ALIGN bytes
+
+Column entries hold dtype, offset (relative to the first column block) and
+length, so every metric can be memory-mapped on its own.
+"""
+
+import json
+import os
+import pickle
+import struct
+import sys
+from datetime import datetime
+
+import numpy as np
+
+from Infra import Infra, DSection, Direction, SECTION_RESULT, TOTAL_RESULT
+from metricstore import MetricStore
+
+EXTENSION = '.simres'
+MAGIC = b'SIMRES'
+VERSION = 1
+ALIGN = 64
+_PREFIX = struct.Struct('<6sHI')
+
+
+def _align(size):
+    return (size + ALIGN - 1) // ALIGN * ALIGN
+
+
+def save(infra: Infra, path):
+    blocks = []
+    offset = 0
+
+    def add_column(data):
+        nonlocal offset
+        array = np.ascontiguousarray(data)
+        array = array.astype(array.dtype.newbyteorder('<'), copy=False)
+        entry = {'dtype': array.dtype.str, 'offset': offset, 'length': len(array)}
+        blocks.append((offset, array))
+        offset = _align(offset + array.nbytes)
+        return entry
+
+    saved_time = infra.getSavedTime()
+    header = {
+        'version': VERSION,
+        'sigType': infra.sigType,
+        'savedTime': None if saved_time is None else saved_time.isoformat(),
+        'sumocfg_path': infra.sumocfg_path,
+        'scenario_path': infra.scenario_path,
+        'scenario_file': infra.scenario_file,
+        'total': {result.name: add_column(infra.getDatabyID(result)) for result in TOTAL_RESULT},
+        'sections': [{'id': section_id,
+                      'direction': None if section.direction is None else section.direction.name,
+                      'tls': getattr(section, 'tls_id', None),
+                      'columns': {key.name: add_column(section.getDatabyID(key)) for key in section.COLUMNS}}
+                     for section_id, section in infra.getSections().items()],
+    }
+    header_bytes = json.dumps(header).encode('utf-8')
+    data_start = _align(_PREFIX.size + len(header_bytes))
+
+    with open(path, 'wb') as f:
+        f.write(_PREFIX.pack(MAGIC, VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        for block_offset, array in blocks:
+            f.seek(data_start + block_offset)
+            f.write(array.tobytes())
+    return path
+
+
+class ResultFile:
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            magic, version, header_size = _PREFIX.unpack(f.read(_PREFIX.size))
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a result file")
+            if version > VERSION:
+                raise ValueError(f"{path}: unsupported result file version {version}")
+            self.version = version
+            self.header = json.loads(f.read(header_size).decode('utf-8'))
+        self.data_start = _align(_PREFIX.size + header_size)
+
+    def array(self, entry):
+        if entry['length'] == 0:
+            return np.empty(0, dtype=entry['dtype'])
+        return np.memmap(self.path, dtype=entry['dtype'], mode='r',
+                         offset=self.data_start + entry['offset'], shape=(entry['length'],))
+
+
+class MappedColumn:
+    """Read-only column of a result file, memory-mapped on first access."""
+    __slots__ = ('_file', '_entry', '_data')
+
+    def __init__(self, resultfile: ResultFile, entry):
+        self._file = resultfile
+        self._entry = entry
+        self._data = None
+
+    def view(self):
+        if self._data is None:
+            self._data = self._file.array(self._entry)
+        return self._data
+
+    def append(self, value):
+        raise TypeError("result file columns are read-only")
+
+    def last(self, default=0):
+        if len(self) > 0:
+            return self.view()[-1].item()
+        return default
+
+    def __len__(self):
+        return self._entry['length']
+
+
+def load(path) -> Infra:
+    resultfile = ResultFile(path)
+    header = resultfile.header
+
+    sections = {}
+    for entry in header['sections']:
+        columns = {SECTION_RESULT[name]: MappedColumn(resultfile, col) for name, col in entry['columns'].items()}
+        section = DSection(entry['id'], store=MetricStore.from_columns(columns))
+        if entry['direction'] is not None:
+            section.direction = Direction[entry['direction']]
+        section.tls_id = entry.get('tls')
+        sections[entry['id']] = section
+
+    columns = {TOTAL_RESULT[name]: MappedColumn(resultfile, col) for name, col in header['total'].items()}
+    infra = Infra(header['sumocfg_path'], header['scenario_path'], header['scenario_file'], sections,
+                  header['sigType'], store=MetricStore.from_columns(columns))
+    if header['savedTime'] is not None:
+        infra.setSavedTime(datetime.fromisoformat(header['savedTime']))
+    return infra
+
+
+def load_legacy(path) -> Infra:
+    # pickled Infra object graph (.data files)
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def convert_legacy(path, out_path=None):
+    if out_path is None:
+        out_path = os.path.splitext(path)[0] + EXTENSION
+    return save(load_legacy(path), out_path)
+
+
+if __name__ == '__main__':
+    # python resultfile.py "Static Control_20240824040548.data" ...
+    for fn in sys.argv[1:]:
+        print(fn, '->', convert_legacy(fn))
@@ -0,0 +1,35 @@
+from sumo_rl import SumoEnvironment, TrafficSignal
+
+from Infra import Infra
+
+
+def co2_reward(ts: TrafficSignal):
+    return ts.env._compute_reward()
+
+
+class CO2SumoEnvironment(SumoEnvironment):
+    """sumo-rl environment of the RL controllers: updates simInfra every step and rewards its network CO2."""
+    def __init__(self, simInfra, **kwargs):
+        # the agent is rewarded by _compute_reward instead of the sumo-rl default (diff-waiting-time)
+        kwargs.setdefault('reward_fn', co2_reward)
+        # sumo-rl system/agent info costs TraCI calls per vehicle and lane every step and is not used here
+        kwargs.setdefault('add_system_info', False)
+        kwargs.setdefault('add_per_agent_info', False)
+        super().__init__(**kwargs)
+        self._cust_step = 0
+        self._cust_infra: Infra = simInfra
+
+    def _compute_reward(self):
+        # read from the per-step vehicle cache Infra.update already filled
+        total_co2_emission = self._cust_infra.getNetworkCO2()
+
+        reward = -total_co2_emission
+        return reward
+
+    def getCustInfra(self):
+        return self._cust_infra
+
+    def _sumo_step(self):
+        self.sumo.simulationStep()
+        self._cust_infra.update()
+        self._cust_step += 1
@@ -1,108 +1,57 @@
+import logging
+
 import traci
+import simlog
+from greentime import GreenAllocator
 from RunSimulation import RunSimulation
 
+log = simlog.getLogger(__name__)
+
 
 class RunActuated(RunSimulation):
     def __init__(self, config, name):
         super().__init__(config, name)
         self.cycle_time = 200
         self.total_yellow_time = 20
-
-    def _signalControl(self):
-        MinGreenTime = 0
-
-        current_phase_index = traci.trafficlight.getPhase("TLS_0")
-        logic = traci.trafficlight.getAllProgramLogics("TLS_0")[0]
+        # 바운드별 용량 비율(%), 테이블에 없는 구간(다른 교차로)은 균등 배분
+        capacity_percentage = {"0": 25, "1": 20, "2": 28, "3": 27}
+        self.allocator = GreenAllocator(self._rtinfra,
+                                        lambda section_id, intersection: capacity_percentage.get(section_id, 100 / len(intersection.getSections())),
+                                        self.cycle_time - self.total_yellow_time)
+
+    def _onWakeup(self, tls_id):
+        # 교차로(TLS)마다 각자의 신호 계획으로 제어, 마지막 신호가 끝나는 스텝에만 실행
+        intersection = self._rtinfra.getIntersection(tls_id)
+        logic = self.getSignalPlan(tls_id).getLogic()
+        current_phase_index = traci.trafficlight.getPhase(tls_id)
         num_phases = len(logic.phases)
-        next_phase_index = (current_phase_index + 1) % num_phases
-        current_phase = logic.phases[current_phase_index]
-
-        current_simulation_time = traci.simulation.getTime()
-        current_phase_duration = traci.trafficlight.getPhaseDuration("TLS_0")
-        next_switch_time = traci.trafficlight.getNextSwitch("TLS_0")
-        elapsed_time = current_simulation_time - (next_switch_time - current_phase_duration)
-
-        remaining_time = next_switch_time - current_simulation_time
+        next_switch_time = traci.trafficlight.getNextSwitch(tls_id)
+        remaining_time = next_switch_time - self.time
 
         if current_phase_index == num_phases-1 and remaining_time == 0:
-            self.traffic_signal_control(self.rtInfra.getSections(), self.cycle_time, self.total_yellow_time)
-            # green_times, surplus_rates, waiting_times = traffic_signal_control(self.section_objects, self.cycle_time, self.total_yellow_time)
-            # print(f"Simulation step {step}: Green times: {green_times}, Surplus rates: {surplus_rates}, Waiting times: {waiting_times}")
-
-        tls = self.Check_TrafficLight_State()
-
-        if tls == "rrrrrrrrrrrgggg":
-            bound = "2"
-            MinGreenTime = current_phase.minDur
-        elif tls == "rrrrggggrrrrrrr":
-            bound = "3"
-            MinGreenTime = current_phase.minDur
-        elif tls == "ggggrrrrrrrrrrr":
-            bound = "0"
-            MinGreenTime = current_phase.minDur
-        elif tls == "rrrrrrrrgggrrrr":
-            bound = "1"
-            MinGreenTime = current_phase.minDur
-        else:
-            bound = "yellow"
-            extended_time = 0
-
-        MaxGreenTime = MinGreenTime + 10
+            self.traffic_signal_control(intersection)
 
-    def traffic_signal_control(self, sections, cycle_time, total_yellow_time):
-        total_green_time = cycle_time - total_yellow_time
+        self.schedulePhaseEnd(tls_id, current_phase_index, next_switch_time, lambda phase: phase == num_phases-1)
 
-        total_vehicle_count = sum([section.traffic_queue for section in sections.values()])
-
-        # 각 바운드에 대한 계산
-        green_times = {}
-        surplus_rates = {}
-        waiting_times = {}
-        capacity_percentage = {"0": 25, "1": 20, "2": 28, "3": 27}
-
-        # 바운드의 가중치 계산
-        total_weight = sum(
-            [section.traffic_queue / capacity_percentage[section_id] for section_id, section in sections.items()])
-
-        for section_id, section in sections.items():
-            vehicle_count = section.traffic_queue
-            capacity_percent = capacity_percentage[section_id]
-
-            # 가중치 기반으로 신호 시간 계산
-            green_time = self.calculate_green_time(vehicle_count, capacity_percent, total_weight, total_green_time)
-            green_times[section_id] = round(green_time)
+    def traffic_signal_control(self, intersection):
+        # 모든 교차로의 신호 시간을 한 번에 계산하고 이 교차로의 구간에만 적용 (대기 차량이 없으면 기존 신호 유지)
+        # 새로운 신호 설정은 run_simulation에서 변경된 경우에만 적용
+        green_times = self.allocator.allocate()
+        if not self.allocator.assign(intersection, green_times, self.getSignalPlan):
+            return
 
+        for section in intersection.getSections().values():
+            self.recordEvent(simlog.EVENT.GREEN_TIME, section.index, value=section.current_greentime)
+        if log.isEnabledFor(logging.DEBUG):
             # 계산된 green_time을 사용하여 surplus rate 및 waiting time 계산
-            surplus_rate = self.calculate_surplus_rate(vehicle_count, green_time * len(section.stations) / total_green_time)
-            waiting_time = self.calculate_waiting_time(surplus_rate, total_green_time)
-
-            surplus_rates[section_id] = surplus_rate
-            waiting_times[section_id] = waiting_time
-
-        # 교차로 신호 조정
-        logic = traci.trafficlight.getAllProgramLogics("TLS_0")[0]
-
-        # 각 바운드에 신호 시간을 할당
-        # Eb phase
-        logic.phases[0].duration = green_times["2"]
-        # Wb phase
-        logic.phases[2].duration = green_times["3"]
-        # Sb phase
-        logic.phases[4].duration = green_times["0"]
-        # Nb phase
-        logic.phases[6].duration = green_times["1"]
-
-        # 새로운 신호 설정 적용
-        traci.trafficlight.setProgramLogic("TLS_0", logic)
-        current_step = traci.simulation.getTime()
-        print(current_step, " - set new phase")
-        print("0 : Sb, 1 : Nb, 2 : Eb, 3 : Wb]")
-        print(f"Green times: {green_times}, Surplus rates: {surplus_rates}, Waiting times: {waiting_times}")
-
-    def calculate_green_time(self, queue_length, capacity_percentage, total_weight, total_green_time):
-        # 가중치 기반 신호 시간 계산
-        weight = queue_length / capacity_percentage
-        return (weight / total_weight) * total_green_time
+            index = [section.index for section in intersection.getSections().values()]
+            total_green_time = self.allocator.getTotalGreen()[index]
+            surplus_rates = self.calculate_surplus_rate(self.allocator.getQueues()[index],
+                                                        green_times[index] * self.allocator.stations[index] / total_green_time)
+            waiting_times = self.calculate_waiting_time(surplus_rates, total_green_time)
+            # 0 : Sb, 1 : Nb, 2 : Eb, 3 : Wb
+            log.debug("%s - set new phase, green times: %s, surplus rates: %s, waiting times: %s",
+                      self._rtinfra.getCurrentTime(), green_times[index], surplus_rates, waiting_times)
 
     def calculate_surplus_rate(self, vehicle_count, service_rate):
         return vehicle_count - service_rate
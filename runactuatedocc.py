@@ -1,4 +1,5 @@
 import traci
+from greentime import GreenAllocator
 from RunSimulation import RunSimulation
 
 
@@ -7,68 +8,27 @@ class RunActuatedOCC(RunSimulation):
         super().__init__(config, name)
         self.cycle_time = 200
         self.total_yellow_time = 20
-
-    def _signalControl(self):
-        MinGreenTime = 0
-
-        current_phase_index = traci.trafficlight.getPhase("TLS_0")
-        num_phases = len(self.logic.phases)
-        next_phase_index = (current_phase_index + 1) % num_phases
-        current_phase = self.logic.phases[current_phase_index]
-
-        current_simulation_time = traci.simulation.getTime()
-        current_phase_duration = traci.trafficlight.getPhaseDuration("TLS_0")
-        next_switch_time = traci.trafficlight.getNextSwitch("TLS_0")
-        elapsed_time = current_simulation_time - (next_switch_time - current_phase_duration)
-
-        remaining_time = next_switch_time - current_simulation_time
+        # 바운드별 용량(대), 테이블에 없는 구간(다른 교차로)은 평균 용량
+        vehicle_by_bound = {"0": 107, "1": 88, "2": 126, "3": 119}
+        default_capacity = sum(vehicle_by_bound.values()) / len(vehicle_by_bound)
+        self.allocator = GreenAllocator(self._rtinfra, lambda section_id, intersection: vehicle_by_bound.get(section_id, default_capacity),
+                                        self.cycle_time - self.total_yellow_time)
+
+    def _onWakeup(self, tls_id):
+        # 교차로(TLS)마다 각자의 신호 계획으로 제어, 마지막 신호가 끝나는 스텝에만 실행
+        intersection = self._rtinfra.getIntersection(tls_id)
+        logic = self.getSignalPlan(tls_id).getLogic()
+        current_phase_index = traci.trafficlight.getPhase(tls_id)
+        num_phases = len(logic.phases)
+        next_switch_time = traci.trafficlight.getNextSwitch(tls_id)
+        remaining_time = next_switch_time - self.time
 
         if current_phase_index == num_phases-1 and remaining_time == 0:
-            self.traffic_signal_control(self._rtinfra.getSections(), self.cycle_time, self.total_yellow_time)
-            # green_times, surplus_rates, waiting_times = traffic_signal_control(self.section_objects, self.cycle_time, self.total_yellow_time)
-            # print(f"Simulation step {step}: Green times: {green_times}, Surplus rates: {surplus_rates}, Waiting times: {waiting_times}")
-
-        tls = self.Check_TrafficLight_State()
-
-    def traffic_signal_control(self, sections, cycle_time, total_yellow_time):
-        total_green_time = cycle_time - total_yellow_time
-
-        total_vehicle_count = sum([section.traffic_queue for section in sections.values()])
-
-        # 각 바운드에 대한 계산
-        green_times = {}
-        surplus_rates = {}
-        waiting_times = {}
-        vehicle_by_bound={"0": 107, "1": 88, "2": 126, "3": 119}
-
-        total_percentage = sum([section.traffic_queue / vehicle_by_bound[section_id] for section_id, section in sections.items()])
-
-        for section_id, section in sections.items():
-            vehicle_count = section.traffic_queue
-            occupancy_rate = section.traffic_queue / vehicle_by_bound[section_id]
-
-            # 가중치 기반으로 신호 시간 계산
-            # green_time = self.calculate_green_time_by_percentage(occupancy_rate, total_percentage, total_green_time)
-            # green_times[section_id] = round(green_time)
-            green_time = round(self.calculate_green_time_by_percentage(occupancy_rate, total_percentage, total_green_time))
-            section.setGreenTime(green_time, self.logic)
-
-            # 계산된 green_time을 사용하여 surplus rate 및 waiting time 계산
-            surplus_rate = self.calculate_surplus_rate(vehicle_count, section.getCurrentGreenTime() * len(section.stations) / total_green_time)
-            waiting_time = self.calculate_waiting_time(surplus_rate, total_green_time)
-
-            surplus_rates[section_id] = surplus_rate
-            waiting_times[section_id] = waiting_time
-
-        # 새로운 신호 설정 적용
-        current_step = traci.simulation.getTime()
-
-
-    def calculate_green_time_by_percentage(self, occupancy_rate, total_percentage, total_green_time):
-        return(occupancy_rate/total_percentage)*total_green_time
+            self.traffic_signal_control(intersection)
 
-    def calculate_surplus_rate(self, vehicle_count, service_rate):
-        return vehicle_count - service_rate
+        self.schedulePhaseEnd(tls_id, current_phase_index, next_switch_time, lambda phase: phase == num_phases-1)
 
-    def calculate_waiting_time(self, surplus_rate, signal_time):
-        return surplus_rate * signal_time
\ No newline at end of file
+    def traffic_signal_control(self, intersection):
+        # 점유율(대기 차량 / 용량) 비율로 모든 교차로의 신호 시간을 계산하고 이 교차로에 적용
+        green_times = self.allocator.allocate()
+        self.allocator.assign(intersection, green_times, self.getSignalPlan)
@@ -1,120 +1,116 @@
-import math
+import numpy as np
 import traci
+import traci.constants as tc
+from traci.exceptions import TraCIException
+import simlog
 from RunSimulation import RunSimulation
 
+log = simlog.getLogger(__name__)
+
+# distance to the stop line (m) within which a vehicle is checked
+DILEMMA_ZONE = 120
+
 class RunDilemaZone(RunSimulation):
+    VEHICLE_VARS = RunSimulation.VEHICLE_VARS + (tc.VAR_POSITION, tc.VAR_SPEED, tc.VAR_TYPE)
+
     def __init__(self, config, name):
         super().__init__(config, name)
-        self.extended_time = 0
+        # green time extensions of the current green phase, by TLS
+        self.extended_time = {tls_id: 0 for tls_id in self.traffic_light_ids}
+        # stop line geometry is static, taken from the net file once: lanes of the exit detectors at the junction
+        self.stop_lanes = {}
+        for section_id, section in self.getInfra().getSections().items():
+            infos = [self.topology.getDetector(det.id) for station in section.stations for det in station.dets]
+            self.stop_lanes[section_id] = np.array([info.stop_line for info in infos if info.is_exit and info.links], dtype=np.float64).reshape(-1, 2)
+        # sections served by each green phase, by TLS
+        self.green_sections = {}
+        for tls_id in self.traffic_light_ids:
+            green = set(self.getSignalProgram(tls_id).green)
+            sections = self.green_sections[tls_id] = {}
+            for section in self.getInfra().getIntersection(tls_id).getSections().values():
+                if section.phase_index in green:
+                    sections.setdefault(section.phase_index, []).append(section)
 
     def _signalControl(self):
-        MinGreenTime = 0
-
+        for tls_id in self.traffic_light_ids:
+            self._controlIntersection(tls_id)
 
-        simulation_time = traci.simulation.getTime()
-        current_phase_index = traci.trafficlight.getPhase("TLS_0")
-        logic = traci.trafficlight.getAllProgramLogics("TLS_0")[0]
+    def _controlIntersection(self, tls_id):
+        logic = self.signalPlans[tls_id].getLogic()
+        current_phase_index = traci.trafficlight.getPhase(tls_id)
         num_phases = len(logic.phases)
         next_phase_index = (current_phase_index + 1) % num_phases
         current_phase = logic.phases[current_phase_index]
 
-        current_simulation_time = traci.simulation.getTime()
-        current_phase_duration = traci.trafficlight.getPhaseDuration("TLS_0")
-        next_switch_time = traci.trafficlight.getNextSwitch("TLS_0")
-        elapsed_time = current_simulation_time - (next_switch_time - current_phase_duration)
+        # sections of the current green phase, none in a yellow phase
+        sections = self.green_sections[tls_id].get(current_phase_index)
+        if sections is None:
+            self.extended_time[tls_id] = 0
+            return
 
-        remaining_time = next_switch_time - current_simulation_time
-        tls = self.Check_TrafficLight_State()
-
-        # Identify which bound is currently green
-        if tls == "rrrrrrrrrrrgggg":
-            bound = "2"
-            MinGreenTime = current_phase.minDur
-        elif tls == "rrrrggggrrrrrrr":
-            bound = "3"
-            MinGreenTime = current_phase.minDur
-        elif tls == "ggggrrrrrrrrrrr":
-            bound = "0"
-            MinGreenTime = current_phase.minDur
-        elif tls == "rrrrrrrrgggrrrr":
-            bound = "1"
-            MinGreenTime = current_phase.minDur
-        else:
-            bound = "yellow"
-            self.extended_time = 0
+        current_phase_duration = traci.trafficlight.getPhaseDuration(tls_id)
+        next_switch_time = traci.trafficlight.getNextSwitch(tls_id)
+        elapsed_time = self.time - (next_switch_time - current_phase_duration)
 
+        remaining_time = next_switch_time - self.time
+        MinGreenTime = current_phase.minDur
         MaxGreenTime = MinGreenTime + 10
 
-        for section_id, section in self.getInfra().getSections().items():
-            if bound == "yellow":
-                pass
-            else:
-                check_control = self.check_DilemmaZone(section, elapsed_time, bound, MinGreenTime, self.extended_time)
-                if check_control == "pass":
-                    print("*" * 50)
-                    print("step:", simulation_time)
-                    print("Section ID:", section_id)
-                    print("Increasing green time by 1 second.")
-                    print("Extended count:", self.extended_time)
-                    new_duration = remaining_time + 1
-                    traci.trafficlight.setPhaseDuration("TLS_0", new_duration)
-                    print("*" * 50)
-                    self.extended_time += 1
-                elif check_control == "yellow":
-                    traci.trafficlight.setPhase("TLS_0", next_phase_index)
+        for section in sections:
+            check_control = self.check_DilemmaZone(section, elapsed_time, MinGreenTime, self.extended_time[tls_id])
+            if check_control == "pass":
+                log.debug("step %s, section %s: increasing green time by 1 second (extended count %d)",
+                          self.time, section.id, self.extended_time[tls_id])
+                new_duration = remaining_time + 1
+                traci.trafficlight.setPhaseDuration(tls_id, new_duration)
+                self.recordEvent(simlog.EVENT.GREEN_EXTEND, section.index, value=self.extended_time[tls_id])
+                self.extended_time[tls_id] += 1
+            elif check_control == "yellow":
+                traci.trafficlight.setPhase(tls_id, next_phase_index)
+
+    def check_DilemmaZone(self, section, time, MinGreenTime, MaxGreenTime):
+        # section of the current green phase; before the minimum green time and after the extensions no vehicle changes the signal
+        if time < MinGreenTime or MaxGreenTime >= 5:
+            return "none"
+        vehicles = self.get_vehicle_data(section.getVehicleIDs())
+        if not vehicles:
+            return "none"
+
+        # distance of every vehicle to every stop line of the section
+        stop_lines = self.get_stop_lane_positions(section)
+        positions = np.array([vehicle[tc.VAR_POSITION] for vehicle in vehicles])
+        distances = np.sqrt(((stop_lines[None, :, :] - positions[:, None, :]) ** 2).sum(axis=2))
+        in_zone = distances <= DILEMMA_ZONE
+        near = np.flatnonzero(in_zone.any(axis=1))
+        if len(near) == 0:
+            return "none"
 
-    def check_DilemmaZone(self, section, time, traffic_light_bound, MinGreenTime, MaxGreenTime):
-        # Use the section's id and stations
-        if traffic_light_bound == str(section.id):
-            dilemma_zone_results = []
-            # Get stop lane positions from the last station's stop detectors
-            stop_lane = self.get_stop_lane_positions(section.stations)
-            for vehicle in section.section_vehicles:  # Access section_vehicles directly from the section
-                vehicle_position = traci.vehicle.getPosition(vehicle)
-                vehicle_x, vehicle_y = vehicle_position
-                for i in range(0, len(stop_lane), 2):
-                    stop_lane_x, stop_lane_y = stop_lane[i:i+2]
-                    distance = math.sqrt((stop_lane_x - vehicle_x) ** 2 + (stop_lane_y - vehicle_y) ** 2)
-                    if distance <= 120:
-                        vehicle_speed = traci.vehicle.getSpeed(vehicle)
-                        vehicle_type = traci.vehicle.getTypeID(vehicle)
-                        check_value = self.DilemmaZoneControlSignal(time, vehicle_speed, distance, vehicle_type, MinGreenTime, MaxGreenTime)
-                        dilemma_zone_results.append(check_value)
-            if "pass" in dilemma_zone_results:
-                return "pass"
-            elif "yellow" in dilemma_zone_results:
-                return "yellow"
-            else:
-                return "none"
-        return "none"
+        # distance required to stop (speed in km/h), passenger vehicles brake harder
+        s = np.array([vehicles[i][tc.VAR_SPEED] for i in near]) * 3.6
+        deceleration = np.array([14 if vehicles[i][tc.VAR_TYPE] == "passenger" else 9 for i in near])
+        stopping = s * (s / deceleration)
+        # vehicles that cannot stop before a stop line pass, extending the green time
+        if np.any(in_zone[near] & ~(stopping[:, None] < distances[near])):
+            return "pass"
+        return "yellow"
 
-    def get_stop_lane_positions(self, stations):
-        stop_lane = ()
-        last_station = stations[-1]  # Use the last station to get stop lane positions
-        for stop_detector in last_station.dets:
-            lane_id = traci.inductionloop.getLaneID(stop_detector.id)
-            lane_shape = traci.lane.getShape(lane_id)
-            stop_lane_position = lane_shape[-1]  # Get the stop line position
-            stop_lane += stop_lane_position
-        return stop_lane
+    def get_stop_lane_positions(self, section):
+        # stop lines of the last station's detector lanes, (n, 2)
+        return self.stop_lanes[section.id]
 
-    def DilemmaZoneControlSignal(self, time, s, d, car_type, MinGreenTime, MaxGreenTime):
-        check = "none"
-        s = s * 3.6  # Convert speed to km/h
-        if time >= MinGreenTime:
-            if MaxGreenTime < 5:
-                if car_type == "passenger":
-                    T1 = s / 14  # Time to cross the stop line for a passenger vehicle
-                    D1 = s * T1  # Distance required to stop
-                    if D1 < d:
-                        check = "yellow"
-                    else:
-                        check = "pass"  # Allow the vehicle to pass by extending green time
-                else:
-                    T2 = s / 9  # Time to cross the stop line for a non-passenger vehicle
-                    D2 = s * T2  # Distance required to stop
-                    if D2 < d:
-                        check = "yellow"
-                    else:
-                        check = "pass"  # Allow the vehicle to pass by extending green time
-        return check
\ No newline at end of file
+    def get_vehicle_data(self, vehicle_ids):
+        # position, speed and type of the section vehicles after the last simulationStep,
+        # vehicles that left the network are skipped
+        if self.getInfra().collector is not None:
+            # subscribed for every vehicle, the simulationStep response already has them
+            results = traci.vehicle.getAllSubscriptionResults()
+            return [vehicle for vehicle in map(results.get, vehicle_ids) if vehicle is not None]
+        vehicles = []
+        for veh_id in vehicle_ids:
+            try:
+                vehicles.append({tc.VAR_POSITION: traci.vehicle.getPosition(veh_id),
+                                 tc.VAR_SPEED: traci.vehicle.getSpeed(veh_id),
+                                 tc.VAR_TYPE: traci.vehicle.getTypeID(veh_id)})
+            except TraCIException:
+                log.debug('vehicle disappeared: %s', veh_id)
+        return vehicles
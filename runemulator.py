@@ -1,6 +1,6 @@
-import pickle
 from typing import List
 
+import resultfile
 from Infra import Infra
 from inframanager import InfraManager
 
@@ -25,8 +25,12 @@ class RunEmulator(InfraManager):
         return infras
 
     def loadData(self, fileName):
-        with open(fileName, "rb") as f:
-            loadedInfra = pickle.load(f)
+        if fileName.endswith('.data'):
+            # pickled results saved before the result file format
+            loadedInfra = resultfile.load_legacy(fileName)
+        else:
+            # columns are memory-mapped, only the plotted metrics are read
+            loadedInfra = resultfile.load(fileName)
 
         print("Loaded Infra:", loadedInfra.sigType, loadedInfra.getSavedTime())
 
@@ -0,0 +1,109 @@
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+
+
+def make_config(binary="sumo", seed=None, max_step=None, route_file=None):
+    from Infra import Config_SUMO
+
+    config = Config_SUMO()
+    config.sumo_binary = binary
+    config.use_gui = binary == "sumo-gui"
+    config.sumo_options = ("--start", "--quit-on-end") if config.use_gui else ("--no-step-log",)
+    config.seed = seed
+    if max_step is not None:
+        config.max_step = max_step
+    if route_file is not None:
+        config.route_file = route_file
+        config.route_file_rl = os.path.join(config.scenario_path, route_file)
+        config.sumo_options = (*config.sumo_options, "--route-files", config.route_file_rl)
+    return config
+
+
+def run(mode_name, config, name=None, output_dir="."):
+    from profiler import profile_run
+    from signaltype import SignalMode
+    import tracereplay
+
+    # the controller starts SUMO when it is created, recording/replay covers both
+    with tracereplay.session(config) or contextlib.nullcontext():
+        controller = SignalMode[mode_name].create(config)
+        start = time.perf_counter()
+        profiler = profile_run(controller)
+        elapsed = time.perf_counter() - start
+
+    infra = controller.getInfra()
+    summary = infra.getSummary()
+    summary['mode'] = mode_name
+    summary['seed'] = config.seed
+    summary['replay'] = config.traci_replay
+    summary['route_file'] = config.route_file
+    summary['wall_time'] = elapsed
+    summary['steps_per_sec'] = summary['steps'] / elapsed if elapsed > 0 else 0
+    summary.update(controller.getRunStats())
+    if profiler is not None:
+        summary['profile'] = profiler.getSummary()
+
+    os.makedirs(output_dir, exist_ok=True)
+    prefix = os.path.join(output_dir, mode_name if name is None else name)
+    controller.saveData(prefix)
+    summary['data_file'] = infra.getFileName()
+    with open(os.path.splitext(infra.getFileName())[0] + '.json', 'w') as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a SignalMode controller without the Qt GUI")
+    parser.add_argument("mode", help="SignalMode member name, e.g. Static, ActuatedBOCC, RLBased3")
+    parser.add_argument("--steps", type=int, default=None, help="simulation steps (default: Config_SUMO.max_step)")
+    parser.add_argument("--seed", type=int, default=None, help="SUMO seed (default: controller default)")
+    parser.add_argument("--route", default=None, help="route file in the scenario directory, e.g. generated_flows_am.xml")
+    parser.add_argument("--name", default=None, help="result file name prefix")
+    parser.add_argument("--output-dir", default=".", help="directory for result files")
+    parser.add_argument("--libsumo", action="store_true", help="run SUMO in-process through libsumo")
+    parser.add_argument("--gui", action="store_true", help="use sumo-gui instead of sumo")
+    parser.add_argument("--log-level", default=None, help="DEBUG, INFO, WARNING (default: SIM_LOG_LEVEL or INFO)")
+    parser.add_argument("--event-log", default=None, help="write controller decisions to this binary event log")
+    parser.add_argument("--profile", action="store_true", help="time the simulation stages and count TraCI calls")
+    parser.add_argument("--trace", default=None, help="with --profile, also write a Chrome trace JSON file")
+    parser.add_argument("--record", default=None, help="record every TraCI response of the run to this trace file")
+    parser.add_argument("--replay", default=None, help="replay a recorded trace instead of starting SUMO")
+    parser.add_argument("--export", default=None, help="stream the section/total results to <EXPORT>_<table>.parquet|.csv")
+    parser.add_argument("--export-format", default=None, choices=("parquet", "csv"), help="default: parquet when pyarrow is installed")
+    parser.add_argument("--fast-forward", action="store_true", help="advance SUMO from one controller wake-up to the next (approximate interval-level results, see Config_SUMO.fast_forward)")
+    args = parser.parse_args(argv)
+
+    if args.record is not None and args.replay is not None:
+        parser.error("--record and --replay cannot be combined")
+    if args.libsumo and (args.record is not None or args.replay is not None):
+        parser.error("--record/--replay need a TraCI connection, not libsumo")
+    if args.libsumo:
+        if args.gui:
+            parser.error("--libsumo cannot be combined with --gui")
+        if "traci" in sys.modules:
+            parser.error("--libsumo has to be selected before traci is imported")
+        # controllers import traci at module level, so the backend is chosen before importing them
+        os.environ["LIBSUMO_AS_TRACI"] = "1"
+
+    import simlog
+    simlog.configure(args.log_level)
+
+    config = make_config("sumo-gui" if args.gui else "sumo", args.seed, args.steps, args.route)
+    config.event_log = args.event_log
+    config.profile = args.profile or args.trace is not None
+    config.profile_trace = args.trace
+    config.traci_record = args.record
+    config.traci_replay = args.replay
+    config.export_path = args.export
+    config.export_format = args.export_format
+    config.fast_forward = args.fast_forward
+    summary = run(args.mode, config, args.name, args.output_dir)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,37 +1,39 @@
 import traci
 from stable_baselines3 import DQN
-from stable_baselines3.common.callbacks import BaseCallback
 
 from Infra import Config_SUMO, Infra, TOTAL_RESULT, SSection
+import simlog
 from RunSimulation import RunSimulation
-from sumo_rl import SumoEnvironment
+from policyinference import PolicyRunner
+from rlenv import CO2SumoEnvironment
 import numpy as np
 from gymnasium import spaces
 from sumo_rl import ObservationFunction, TrafficSignal
 
 import random
 
-class CustomSumoEnvironment(SumoEnvironment):
-    def __init__(self, simInfra, **kwargs):
-        super().__init__(**kwargs)
-        self._cust_step = 0
-        self._cust_infra:Infra = simInfra
+log = simlog.getLogger(__name__)
 
-    def _compute_reward(self):
-        total_co2_emission = 0
-        for veh_id in traci.vehicle.getIDList():
-            total_co2_emission += traci.vehicle.getCO2Emission(veh_id)
 
-        reward = -total_co2_emission
-        return reward
+class CustomSumoEnvironment(CO2SumoEnvironment):
+    # simulation time of the current step, every traffic signal reads it several times per step
+    _sim_time = None
+
+    @property
+    def sim_step(self) -> float:
+        if self._sim_time is None:
+            self._sim_time = self.sumo.simulation.getTime()
+        return self._sim_time
 
-    def getCustInfra(self):
-        return self._cust_infra
+    def reset(self, seed=None, **kwargs):
+        self._sim_time = None
+        return super().reset(seed=seed, **kwargs)
 
     def _sumo_step(self):
-        self.sumo.simulationStep()
-        self._cust_infra.update()
-        self._cust_step += 1
+        super()._sumo_step()
+        # the collector already has the time of this step
+        collector = self._cust_infra.collector
+        self._sim_time = collector.getTime() if collector is not None else None
 
 
 class CO2ObservationFunction(ObservationFunction):
@@ -55,7 +57,7 @@ class CO2ObservationFunction(ObservationFunction):
         co2_emissions.append(total_co2_emission)
         # co2_emissions = self.ts.get_lanes_co2_emission()
         observation = np.array(phase_id + min_green + co2_emissions, dtype=np.float32)
-        print("observation: ", observation)
+        # print("observation: ", observation)
         return observation
 
     def observation_space(self) -> spaces.Box:
@@ -65,27 +67,18 @@ class CO2ObservationFunction(ObservationFunction):
             high=np.ones(self.ts.num_green_phases + 1 + 1, dtype=np.float32),
         )
 
-# 콜백 클래스를 정의하여 학습 결과를 매번 출력하도록 설정
-class EveryStepCallback(BaseCallback):
-    def __init__(self, verbose=0):
-        super(EveryStepCallback, self).__init__(verbose)
-
-    def _on_step(self) -> bool:
-        # if self.verbose > 0:
-        #     print(f"Step: {self.num_timesteps}, Reward: {self.locals['rewards'][-1]}")
-        return True
-
 class RunRLBased3(RunSimulation):
     def __init__(self, config, name):
-        SumoSeed = random.randint(0, 2_147_483_647)
+        SumoSeed = random.randint(0, 2_147_483_647) if config.seed is None else config.seed
         super().__init__(config, 'RL_DQL', isExternalSignal=True)
         self.model = DQN.load("dqn_model_episode_100_min32.zip")
+        self.policy = PolicyRunner(self.model)
         self.prevAction = -1
         self.env = CustomSumoEnvironment(
             net_file=self.config.scenario_file_rl,
             single_agent=True,
             route_file=self.config.route_file_rl,
-            use_gui=True,
+            use_gui=self.config.use_gui,
             yellow_time=4,
             min_green=32,
             max_green=120,
@@ -93,22 +86,21 @@ class RunRLBased3(RunSimulation):
             #observation_class=CO2ObservationFunction,
             simInfra=self.getInfra()
         )
-        print("sumo_seed: ", SumoSeed)
+        # sections served by each action (green phase)
+        self.actionSections = self.getActionSections(required=True)
+        log.info("sumo_seed: %s", SumoSeed)
     def preinit(self):
         pass
 
     def setSectionSignal(self, action):
-        #E(2) W(3) S(0) N(1)
-        #S N E W
-        bCorrection = [2, 3, 0 ,1]
-        program = traci.trafficlight.getAllProgramLogics('TLS_0')[0]
-        sections = self.getInfra().getSections()
+        # action: green phase of the program, its section from SignalProgram (E W S N)
+        sections = self.actionSections[action]
         if self.prevAction == action:
-            current_dur = sections[str(bCorrection[action])].getCurrentGreenTime() + self.env.delta_time
+            current_dur = sections[0].getCurrentGreenTime() + self.env.delta_time
         else:
             current_dur = self.env.delta_time
 
-        sections[str(bCorrection[action])].setGreenTime(current_dur, None)
+        self.setActionGreenTime(sections, current_dur)
         self.prevAction = action
 
         # for i, phase in enumerate(program.phases):
@@ -118,18 +110,30 @@ class RunRLBased3(RunSimulation):
 
     def run_simulation(self):
         obs, _ = self.env.reset()
+        self._openExporter()
         done = False
         total_reward = 0
         step = 0
-        maxstep = 11700 / self.env.delta_time
+        maxstep = self.config.max_step / self.env.delta_time
         self.isStop = False
 
         while self.isStop is not True and step <= maxstep:
-            action, _states = self.model.predict(obs, state=None, deterministic=False)
+            self.policy.startDecision()
+            action = self.policy.predict(obs, deterministic=False)
+            self.policy.endDecision()
             obs, reward, done, truncated, info = self.env.step(action)
+            if self.exporter is not None:
+                self.exporter.update()
             total_reward += reward
             step += 1
             self.setSectionSignal(action)
+            self.recordEvent(simlog.EVENT.RL_ACTION, action=action)
 
         self.isStop = True
-        traci.close()
\ No newline at end of file
+        traci.close()
+        self.policy.report()
+        self.closeEventLog()
+        self._closeExporter()
+
+    def getRunStats(self):
+        return self.policy.getLatencyStats()
\ No newline at end of file
@@ -1,35 +1,16 @@
 import traci
 from stable_baselines3 import DQN
-from stable_baselines3.common.callbacks import BaseCallback
 
 from Infra import Config_SUMO, Infra, TOTAL_RESULT, SSection
+import simlog
 from RunSimulation import RunSimulation
-from sumo_rl import SumoEnvironment
+from policyinference import PolicyRunner
+from rlenv import CO2SumoEnvironment as CustomSumoEnvironment
 import numpy as np
 from gymnasium import spaces
 from sumo_rl import ObservationFunction, TrafficSignal
 
-class CustomSumoEnvironment(SumoEnvironment):
-    def __init__(self, simInfra, **kwargs):
-        super().__init__(**kwargs)
-        self._cust_step = 0
-        self._cust_infra:Infra = simInfra
-
-    def _compute_reward(self):
-        total_co2_emission = 0
-        for veh_id in traci.vehicle.getIDList():
-            total_co2_emission += traci.vehicle.getCO2Emission(veh_id)
-
-        reward = -total_co2_emission
-        return reward
-
-    def getCustInfra(self):
-        return self._cust_infra
-
-    def _sumo_step(self):
-        self.sumo.simulationStep()
-        self._cust_infra.update()
-        self._cust_step += 1
+log = simlog.getLogger(__name__)
 
 
 class CO2ObservationFunction(ObservationFunction):
@@ -38,26 +19,30 @@ class CO2ObservationFunction(ObservationFunction):
     def __init__(self, ts: TrafficSignal):
         """Initialize CO2 observation function."""
         super().__init__(ts)
+        # allocated on the first call, the phases are not built yet
+        self._observation = None
+
+    def _fill_phase(self):
+        # phase one-hot and min green flag, returns the index of the first metric
+        observation = self._observation
+        n_phases = self.ts.num_green_phases
+        observation[:n_phases] = 0
+        observation[self.ts.green_phase] = 1
+        observation[n_phases] = 0 if self.ts.time_since_last_phase_change < self.ts.min_green + self.ts.yellow_time else 1
+        return n_phases + 1
 
     def __call__(self) -> np.ndarray:
-        self._custInfra: Infra = self.ts.env.getCustInfra()
-
-        total_co2_emission = 0
-        co2_emissions = []
-        waiting_time = []
-        # for veh_id in traci.vehicle.getIDList():
-        #     total_co2_emission += traci.vehicle.getCO2Emission(veh_id)
-        total_co2_emission = self._custInfra.getTotalCO2mg()
-        total_waiting_time = self._custInfra.getTotalWaitingTime()
         """Return the CO2-based observation."""
-        phase_id = [1 if self.ts.green_phase == i else 0 for i in range(self.ts.num_green_phases)]  # one-hot encoding
-        min_green = [0 if self.ts.time_since_last_phase_change < self.ts.min_green + self.ts.yellow_time else 1]
-        co2_emissions.append(total_co2_emission)
-        waiting_time.append(total_waiting_time)
+        if self._observation is None:
+            self._custInfra: Infra = self.ts.env.getCustInfra()
+            self._observation = np.zeros(self.ts.num_green_phases + 1 + 1 + 1, dtype=np.float32)
+
+        idx = self._fill_phase()
         # co2_emissions = self.ts.get_lanes_co2_emission()
-        observation = np.array(phase_id + min_green + co2_emissions + waiting_time, dtype=np.float32)
+        self._observation[idx] = self._custInfra.getTotalCO2mg()
+        self._observation[idx + 1] = self._custInfra.getTotalWaitingTime()
         # print("observation: ", observation)
-        return observation
+        return self._observation
 
     def observation_space(self) -> spaces.Box:
         """Return the observation space."""
@@ -66,49 +51,39 @@ class CO2ObservationFunction(ObservationFunction):
             high=np.ones(self.ts.num_green_phases + 1 + 1 + 1, dtype=np.float32),
         )
 
-# 콜백 클래스를 정의하여 학습 결과를 매번 출력하도록 설정
-class EveryStepCallback(BaseCallback):
-    def __init__(self, verbose=0):
-        super(EveryStepCallback, self).__init__(verbose)
-
-    def _on_step(self) -> bool:
-        # if self.verbose > 0:
-
-        #     print(f"Step: {self.num_timesteps}, Reward: {self.locals['rewards'][-1]}")
-        return True
-
 class RunRLBased4(RunSimulation):
     def __init__(self, config, name):
         super().__init__(config, 'RL_DQL_Check_Intersection', isExternalSignal=True)
         self.model = DQN.load("dqn_model_episode_3.zip")
+        self.policy = PolicyRunner(self.model)
         self.prevAction = -1
         self.env = CustomSumoEnvironment(
             net_file=self.config.scenario_file_rl,
             single_agent=True,
             route_file=self.config.route_file_rl,
-            use_gui=True,
+            use_gui=self.config.use_gui,
             yellow_time=4,
             min_green=32,
             max_green=60,
-            sumo_seed=100,
+            sumo_seed=self.getSeed(100),
             observation_class=CO2ObservationFunction,
             simInfra=self.getInfra()
         )
+        # sections served by each action (green phase)
+        self.actionSections = self.getActionSections(required=True)
     def preinit(self):
         pass
 
     def setSectionSignal(self, action):
-        # E(2) W(3) S(0) N(1)
-        # S N E W
-        bCorrection = [2, 3, 0, 1]
-        sections = self.getInfra().getSections()
+        # action: green phase of the program, its section from SignalProgram (E W S N)
+        sections = self.actionSections
 
         # Retrieve max_green from environment
         max_green = self.env.max_green
 
         if self.prevAction == action:
             # If the action remains the same, increase the current green time
-            current_dur = sections[str(bCorrection[action])].getCurrentGreenTime() + self.env.delta_time
+            current_dur = sections[action][0].getCurrentGreenTime() + self.env.delta_time
         else:
             # Reset the green time if the action (phase) has changed
             current_dur = self.env.delta_time
@@ -116,30 +91,42 @@ class RunRLBased4(RunSimulation):
         # If the green time exceeds max_green, switch the action (phase)
         if current_dur >= max_green:
             # Change the action (phase) to the next one in sequence
-            action = (action + 1) % len(bCorrection)
+            action = (action + 1) % len(sections)
             current_dur = self.env.delta_time  # Reset green time for the new phase
 
-        print(f"Current Duration: {current_dur}, Max Green: {self.env.max_green}")
+        log.debug("Current Duration: %s, Max Green: %s", current_dur, self.env.max_green)
         # Apply the updated or reset green time
-        sections[str(bCorrection[action])].setGreenTime(current_dur, None)
+        self.setActionGreenTime(sections[action], current_dur)
         self.prevAction = action
 
     def run_simulation(self):
         obs, _ = self.env.reset()
+        self._openExporter()
         done = False
         total_reward = 0
         step = 0
-        maxstep = 11700 / self.env.delta_time
+        maxstep = self.config.max_step / self.env.delta_time
         self.isStop = False
 
         while self.isStop is not True and step <= maxstep:
-            action, _states = self.model.predict(obs, state=None, deterministic=False)
+            self.policy.startDecision()
+            action = self.policy.predict(obs, deterministic=False)
+            self.policy.endDecision()
             obs, reward, done, truncated, info = self.env.step(action)
+            if self.exporter is not None:
+                self.exporter.update()
             total_reward += reward
             step += 1
             self.setSectionSignal(action)
-            print(f"Step: {step}, Action: {action}, Previous Action: {self.prevAction}")
-            print(f"Observation: {obs}, Reward: {reward}")
+            self.recordEvent(simlog.EVENT.RL_ACTION, action=action)
+            log.debug("Step: %d, Action: %s, Previous Action: %s, Observation: %s, Reward: %s",
+                      step, action, self.prevAction, obs, reward)
 
         self.isStop = True
         traci.close()
+        self.policy.report()
+        self.closeEventLog()
+        self._closeExporter()
+
+    def getRunStats(self):
+        return self.policy.getLatencyStats()
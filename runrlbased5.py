@@ -1,35 +1,16 @@
 import traci
 from stable_baselines3 import DQN
-from stable_baselines3.common.callbacks import BaseCallback
 
 from Infra import Config_SUMO, Infra, TOTAL_RESULT, SSection
+import simlog
 from RunSimulation import RunSimulation
-from sumo_rl import SumoEnvironment
+from policyinference import PolicyRunner
+from rlenv import CO2SumoEnvironment as CustomSumoEnvironment
 import numpy as np
 from gymnasium import spaces
 from sumo_rl import ObservationFunction, TrafficSignal
 
-class CustomSumoEnvironment(SumoEnvironment):
-    def __init__(self, simInfra, **kwargs):
-        super().__init__(**kwargs)
-        self._cust_step = 0
-        self._cust_infra:Infra = simInfra
-
-    def _compute_reward(self):
-        total_co2_emission = 0
-        for veh_id in traci.vehicle.getIDList():
-            total_co2_emission += traci.vehicle.getCO2Emission(veh_id)
-
-        reward = -total_co2_emission
-        return reward
-
-    def getCustInfra(self):
-        return self._cust_infra
-
-    def _sumo_step(self):
-        self.sumo.simulationStep()
-        self._cust_infra.update()
-        self._cust_step += 1
+log = simlog.getLogger(__name__)
 
 
 class CO2ObservationFunction(ObservationFunction):
@@ -38,24 +19,31 @@ class CO2ObservationFunction(ObservationFunction):
     def __init__(self, ts: TrafficSignal):
         """Initialize CO2 observation function."""
         super().__init__(ts)
+        # allocated on the first call, the phases are not built yet
+        self._observation = None
+
+    def _fill_phase(self):
+        # phase one-hot and min green flag, returns the index of the first metric
+        observation = self._observation
+        n_phases = self.ts.num_green_phases
+        observation[:n_phases] = 0
+        observation[self.ts.green_phase] = 1
+        observation[n_phases] = 0 if self.ts.time_since_last_phase_change < self.ts.min_green + self.ts.yellow_time else 1
+        return n_phases + 1
 
     def __call__(self) -> np.ndarray:
-        self._custInfra: Infra = self.ts.env.getCustInfra()
-
-        co2_emissions = []
-        waiting_time = []
-
-        section_data = self._custInfra.getSections()
-
-        for section_id, section in section_data.items():
-            co2_emissions.append(section.getCurrentCO2())
-            waiting_time.append(section.getCurrentWaitingTime())
-
         """Return the CO2-based observation."""
-        phase_id = [1 if self.ts.green_phase == i else 0 for i in range(self.ts.num_green_phases)]  # one-hot encoding
-        min_green = [0 if self.ts.time_since_last_phase_change < self.ts.min_green + self.ts.yellow_time else 1]
-
-        observation = np.array(phase_id + min_green + co2_emissions + waiting_time, dtype=np.float32)
+        if self._observation is None:
+            self._custInfra: Infra = self.ts.env.getCustInfra()
+            self._sections = list(self._custInfra.getSections().values())
+            self._observation = np.zeros(self.ts.num_green_phases + 1 + 2 * len(self._sections), dtype=np.float32)
+
+        observation = self._observation
+        idx = self._fill_phase()
+        n_sections = len(self._sections)
+        for i, section in enumerate(self._sections):
+            observation[idx + i] = section.getCurrentCO2()
+            observation[idx + n_sections + i] = section.getCurrentWaitingTime()
 
         # print("observation: ", observation)
         return observation
@@ -67,21 +55,11 @@ class CO2ObservationFunction(ObservationFunction):
             high=np.ones(self.ts.num_green_phases + 1 + 2 * 4, dtype=np.float32),
         )
 
-# 콜백 클래스를 정의하여 학습 결과를 매번 출력하도록 설정
-class EveryStepCallback(BaseCallback):
-    def __init__(self, verbose=0):
-        super(EveryStepCallback, self).__init__(verbose)
-
-    def _on_step(self) -> bool:
-        # if self.verbose > 0:
-
-        #     print(f"Step: {self.num_timesteps}, Reward: {self.locals['rewards'][-1]}")
-        return True
-
 class RunRLBased5(RunSimulation):
     def __init__(self, config, name):
         super().__init__(config, 'RL_DQL_Check_Section', isExternalSignal=True)
         self.model = DQN.load("dqn_model_episode_1.zip")
+        self.policy = PolicyRunner(self.model)
         self.action = 0
         self.prevAction = -1
         self.current_dur = 0
@@ -89,44 +67,41 @@ class RunRLBased5(RunSimulation):
             net_file=self.config.scenario_file_rl,
             single_agent=True,
             route_file=self.config.route_file_rl,
-            use_gui=True,
+            use_gui=self.config.use_gui,
             # delta_time=1,
             yellow_time=4,
             min_green=32,
             max_green=60,
-            sumo_seed=1,
+            sumo_seed=self.getSeed(1),
             observation_class=CO2ObservationFunction,
             simInfra=self.getInfra()
         )
+        # sections served by each action (green phase)
+        self.actionSections = self.getActionSections(required=True)
     def preinit(self):
         pass
 
     def setSectionSignal(self, action):
-        # E(2) W(3) S(0) N(1)
-        # S N E W
-        bCorrection = [2, 3, 0, 1]
-        sections = self.getInfra().getSections()
-
-        TL_logic = traci.trafficlight.getAllProgramLogics("TLS_0")[0]
-        phase_state = TL_logic.phases[action].state
+        # action: green phase of the program, its section from SignalProgram (E W S N)
+        sections = self.actionSections
 
         if self.prevAction == action:
             # If the green time exceeds max_green, switch the action (phase)
             if self.current_dur >= self.env.max_green:
                 # Change the action (phase) to the next one in sequence
-                action = (action + 1) % len(bCorrection)
+                action = (action + 1) % len(sections)
                 self.action = action
                 self.current_dur = self.env.delta_time  # Reset green time for the new phase
                 # Apply the updated or reset green time
-                sections[str(bCorrection[action])].setGreenTime(self.current_dur, None)
-                # phase = TL_logic.phases[(action + 1) % len(bCorrection)].state
+                self.setActionGreenTime(sections[action], self.current_dur)
+                # phase = TL_logic.phases[(action + 1) % len(sections)].state
                 # traci.trafficlight.setRedYellowGreenState("TLS_0", phase)
-                print("change action: over max_green")
+                log.debug("change action: over max_green")
                 # print("Phase: ", phase)
             else:
                 # If the action remains the same, increase the current green time
                 self.current_dur += self.env.delta_time
-                print("stay action: action is same")
+                log.debug("stay action: action is same")
                 # print("Phase: ", phase_state)
         else:
             # If the green time does not satisfy the min_green time, keep the action (phase)
@@ -134,46 +109,55 @@ class RunRLBased5(RunSimulation):
                 action = self.prevAction
                 self.action = action
                 self.current_dur += self.env.delta_time
-                sections[str(bCorrection[action])].setGreenTime(self.current_dur, None)
+                self.setActionGreenTime(sections[action], self.current_dur)
                 # phase = TL_logic.phases[action].state
                 # traci.trafficlight.setRedYellowGreenState("TLS_0", phase)
-                print("stay action: not enough min_green")
+                log.debug("stay action: not enough min_green")
                 # print("Phase: ", phase)
             else:
                 # Reset the green time if the action (phase) has changed
                 self.current_dur = self.env.delta_time
-                sections[str(bCorrection[action])].setGreenTime(self.current_dur, None)
+                self.setActionGreenTime(sections[action], self.current_dur)
                 # traci.trafficlight.setRedYellowGreenState("TLS_0", phase_state)
-                print("change action")
+                log.debug("change action")
                 # print("Phase: ", phase_state)
 
-        print(f"Current Duration: {self.current_dur}, Min Green: {self.env.min_green}, Max Green: {self.env.max_green}")
+        log.debug("Current Duration: %s, Min Green: %s, Max Green: %s", self.current_dur, self.env.min_green, self.env.max_green)
 
 
     def run_simulation(self):
         obs, _ = self.env.reset()
+        self._openExporter()
         done = False
         total_reward = 0
         step = 0
-        maxstep = 11700 / self.env.delta_time
+        maxstep = self.config.max_step / self.env.delta_time
         self.isStop = False
 
         while self.isStop is not True and step <= maxstep:
-            action, _states = self.model.predict(obs, state=None, deterministic=False)
-            print("\norigin action: ", action)
+            self.policy.startDecision()
+            action = self.policy.predict(obs, deterministic=False)
             self.action = action
             self.setSectionSignal(self.action)
+            self.policy.endDecision()
+            self.recordEvent(simlog.EVENT.RL_ACTION, action=self.action, value=self.current_dur)
             obs, reward, done, truncated, info = self.env.step(self.action)
+            if self.exporter is not None:
+                self.exporter.update()
             # self.action = action
             total_reward += reward
             step += 1
             # self.setSectionSignal(self.action)
             # obs, reward, done, truncated, info = self.env.step(action)
-            print(f"Step: {step}, Action: {self.action}, Previous Action: {self.prevAction}")
+            log.debug("Step: %d, Action: %s, Previous Action: %s", step, self.action, self.prevAction)
             self.prevAction = self.action
             # print(f"Observation: {obs}, Reward: {reward}")
-            print("Current Phase state:\n", traci.trafficlight.getRedYellowGreenState("TLS_0"))
-            print("Logic:\n", traci.trafficlight.getAllProgramLogics("TLS_0")[1])
 
         self.isStop = True
         traci.close()
+        self.policy.report()
+        self.closeEventLog()
+        self._closeExporter()
+
+    def getRunStats(self):
+        return self.policy.getLatencyStats()
@@ -0,0 +1,118 @@
+import traci
+from stable_baselines3 import DQN
+
+import simlog
+from RunSimulation import RunSimulation
+from policyinference import PolicyRunner
+from runrlbased3 import CustomSumoEnvironment
+from signalplan import SignalWriteBatch
+
+import random
+
+log = simlog.getLogger(__name__)
+
+
+class AgentGroup:
+    """Traffic signals sharing one policy, evaluated with one forward pass per decision."""
+    def __init__(self, model_path, ts_ids, env):
+        model = DQN.load(model_path)
+        for ts in ts_ids:
+            obs_shape = env.observation_spaces(ts).shape
+            n_actions = env.action_spaces(ts).n
+            if obs_shape != model.observation_space.shape or n_actions != model.action_space.n:
+                raise ValueError("traffic signal %s (observation %s, %d actions) does not fit policy %s (observation %s, %d actions)"
+                                 % (ts, obs_shape, n_actions, model_path, model.observation_space.shape, model.action_space.n))
+        self.model_path = model_path
+        self.ts_ids = ts_ids
+        self.policy = PolicyRunner(model, batch_size=len(ts_ids))
+
+    def predict(self, observations, deterministic=False):
+        # only the traffic signals acting in this step have an observation
+        acting = [ts for ts in self.ts_ids if ts in observations]
+        if not acting:
+            return {}
+        self.policy.startDecision()
+        actions = self.policy.predict_batch([observations[ts] for ts in acting], deterministic=deterministic)
+        self.policy.endDecision()
+        return dict(zip(acting, actions.tolist()))
+
+
+class RunRLMulti(RunSimulation):
+    def __init__(self, config, name):
+        SumoSeed = random.randint(0, 2_147_483_647) if config.seed is None else config.seed
+        super().__init__(config, 'RL_DQL_Multi', isExternalSignal=True)
+        self.env = CustomSumoEnvironment(
+            net_file=self.config.scenario_file_rl,
+            single_agent=False,
+            route_file=self.config.route_file_rl,
+            use_gui=self.config.use_gui,
+            yellow_time=4,
+            min_green=32,
+            max_green=120,
+            sumo_seed=SumoSeed,
+            simInfra=self.getInfra()
+        )
+        # one policy per model file, traffic signals without their own model share Config_SUMO.rl_model
+        agent_models = self.config.rl_agent_models or {}
+        ts_by_model = {}
+        for ts in self.env.ts_ids:
+            ts_by_model.setdefault(agent_models.get(ts, self.config.rl_model), []).append(ts)
+        self.groups = [AgentGroup(path, ts_ids, self.env) for path, ts_ids in ts_by_model.items()]
+        self.agent_index = {ts: i for i, ts in enumerate(self.env.ts_ids)}
+        self.prevActions = {}
+
+        # TLS id -> sections of each action (empty: phase without detector section)
+        self.actionSections = {tls_id: self.getActionSections(tls_id) for tls_id in self.traffic_light_ids}
+        log.info("sumo_seed: %s, %d traffic signals, %d policies", SumoSeed, len(self.env.ts_ids), len(self.groups))
+
+    def preinit(self):
+        pass
+
+    def setSectionSignal(self, ts_id, action):
+        action_sections = self.actionSections.get(ts_id, ())
+        sections = action_sections[action] if action < len(action_sections) else ()
+        if not sections:
+            return
+        if self.prevActions.get(ts_id) == action:
+            current_dur = sections[0].getCurrentGreenTime() + self.env.delta_time
+        else:
+            current_dur = self.env.delta_time
+        self.setActionGreenTime(sections, current_dur)
+        self.prevActions[ts_id] = action
+
+    def run_simulation(self):
+        observations = self.env.reset()
+        self._openExporter()
+        step = 0
+        maxstep = self.config.max_step / self.env.delta_time
+        self.isStop = False
+
+        while self.isStop is not True and step <= maxstep:
+            actions = {}
+            for group in self.groups:
+                actions.update(group.predict(observations, deterministic=False))
+            # the signal states of all intersections are written with one message before the simulation step
+            with SignalWriteBatch(self.env.sumo):
+                observations, rewards, dones, info = self.env.step(actions)
+            if self.exporter is not None:
+                self.exporter.update()
+            step += 1
+            for ts, action in actions.items():
+                self.setSectionSignal(ts, action)
+                self.recordEvent(simlog.EVENT.RL_ACTION, self.agent_index[ts], action=action)
+            if dones['__all__']:
+                break
+
+        self.isStop = True
+        traci.close()
+        for group in self.groups:
+            group.policy.report()
+        self.closeEventLog()
+        self._closeExporter()
+
+    def getRunStats(self):
+        stats = {'agents': len(self.env.ts_ids), 'policies': len(self.groups)}
+        for i, group in enumerate(self.groups):
+            prefix = '' if len(self.groups) == 1 else 'policy%d_' % i
+            stats.update({prefix + key: value for key, value in group.policy.getLatencyStats().items()})
+        return stats
@@ -0,0 +1,69 @@
+import argparse
+import itertools
+import multiprocessing
+import os
+import traceback
+
+import pandas as pd
+
+import simlog
+from runheadless import make_config, run
+
+ROUTE_FILES = ("generated_flows_am.xml", "generated_flows_pm.xml")
+
+
+def run_case(case):
+    # executed in a worker process: its own traci module and its own labelled connection
+    mode_name, route_file, seed, max_step, output_dir = case
+    # workers only report warnings, per-run results go to the summary table
+    simlog.configure(os.environ.get('SIM_LOG_LEVEL', 'WARNING'))
+    label = "%s_%s_%d" % (mode_name, os.path.splitext(route_file)[0], seed)
+    config = make_config("sumo", seed, max_step, route_file)
+    config.label = label
+    try:
+        return run(mode_name, config, label, output_dir)
+    except Exception:
+        return {'mode': mode_name, 'route_file': route_file, 'seed': seed, 'error': traceback.format_exc()}
+
+
+def sweep(mode_names, route_files=ROUTE_FILES, seeds=(100,), max_step=None, output_dir="sweep_results", workers=None):
+    """Run every controller x route file x seed combination in a process pool.
+
+    Returns one row per run with the Infra.getSummary metrics.
+    """
+    cases = [(mode, route, seed, max_step, output_dir)
+             for mode, route, seed in itertools.product(mode_names, route_files, seeds)]
+    workers = min(workers or os.cpu_count(), len(cases))
+
+    # a fresh process per run, SUMO/libsumo state never leaks between runs
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(processes=workers, maxtasksperchild=1) as pool:
+        rows = list(pool.imap_unordered(run_case, cases))
+
+    table = pd.DataFrame(rows)
+    return table.sort_values(['mode', 'route_file', 'seed']).reset_index(drop=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare SignalMode controllers over route files and seeds in parallel")
+    parser.add_argument("--modes", nargs="+", required=True, help="SignalMode member names")
+    parser.add_argument("--routes", nargs="+", default=list(ROUTE_FILES), help="route files in the scenario directory")
+    parser.add_argument("--seeds", nargs="+", type=int, default=[100])
+    parser.add_argument("--steps", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: number of cores)")
+    parser.add_argument("--output-dir", default="sweep_results")
+    parser.add_argument("--libsumo", action="store_true", help="run SUMO in-process through libsumo in each worker")
+    args = parser.parse_args(argv)
+
+    if args.libsumo:
+        # inherited by the spawned workers before they import traci
+        os.environ["LIBSUMO_AS_TRACI"] = "1"
+
+    table = sweep(args.modes, args.routes, args.seeds, args.steps, args.output_dir, args.workers)
+    os.makedirs(args.output_dir, exist_ok=True)
+    table.to_csv(os.path.join(args.output_dir, "sweep_summary.csv"), index=False)
+    print(table.to_string())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+import math
+
+import traci.constants as tc
+
+
+class Wakeups:
+    """Simulation time at which each controller task (e.g. one per TLS) runs next.
+
+    A task runs once per wake-up and schedules its next one, the steps in
+    between cost the controller no TraCI traffic.
+    """
+    def __init__(self):
+        self.times = {}
+        self.next = math.inf
+
+    def at(self, key, time):
+        self.times[key] = time
+        if time < self.next:
+            self.next = time
+
+    def cancel(self, key):
+        self.times.pop(key, None)
+        self.next = min(self.times.values(), default=math.inf)
+
+    def popDue(self, now):
+        # keys whose wake-up time has come, removed from the table
+        if now < self.next:
+            return ()
+        due = [key for key, time in self.times.items() if time <= now]
+        for key in due:
+            del self.times[key]
+        self.next = min(self.times.values(), default=math.inf)
+        return due
+
+    def __contains__(self, key):
+        return key in self.times
+
+    def __len__(self):
+        return len(self.times)
+
+
+def next_phase_end(logic, phase_index, next_switch, wanted, after):
+    """End time of the first phase from phase_index on (ending at next_switch) with wanted(phase index) true, later than after.
+
+    Walks the cached program durations, None when no phase is wanted or the
+    program is not static (phase durations decided by SUMO at run time).
+    """
+    if logic.type != tc.TRAFFICLIGHT_TYPE_STATIC:
+        return None
+    phases = logic.phases
+    time = next_switch
+    for _ in range(len(phases) + 1):
+        if time > after and wanted(phase_index):
+            return time
+        phase_index = (phase_index + 1) % len(phases)
+        time += phases[phase_index].duration
+    return None
@@ -0,0 +1,155 @@
+import functools
+
+import numpy as np
+import traci
+import traci.constants as tc
+
+
+class SignalPlan:
+    """Cached copy of a TLS program logic with dirty tracking.
+
+    Controllers change phase durations on the local copy (through
+    SSection.setGreenTime) and the logic is sent to SUMO only when something
+    actually changed.
+    """
+    def __init__(self, tls_id):
+        self.tls_id = tls_id
+        self.logic = None
+        self.dirty = False
+        self.refresh()
+
+    def refresh(self):
+        self.logic = traci.trafficlight.getAllProgramLogics(self.tls_id)[0]
+        self.dirty = False
+
+    def getLogic(self):
+        return self.logic
+
+    def getPhases(self):
+        return self.logic.phases
+
+    def getPhaseDuration(self, phase_index):
+        return self.logic.phases[phase_index].duration
+
+    def setPhaseDuration(self, phase_index, duration):
+        phase = self.logic.phases[phase_index]
+        if phase.duration != duration:
+            phase.duration = duration
+            self.dirty = True
+
+    def isDirty(self):
+        return self.dirty
+
+    def push(self):
+        if not self.dirty:
+            return False
+        # the cached phase index is stale, keep SUMO on the phase it is running
+        self.logic.currentPhaseIndex = traci.trafficlight.getPhase(self.tls_id)
+        traci.trafficlight.setProgramLogic(self.tls_id, self.logic)
+        self.dirty = False
+        return True
+
+
+class SignalProgram:
+    """Green and yellow states of a TLS program, compiled once (compile_program).
+
+    green holds the program phases used as green phases (RL action i selects
+    green[i], the sumo-rl order). states are the green states followed by the
+    yellow states between every two of them: links green in i and red in j
+    turn yellow. transition[i, j] is the index in states of the yellow phase
+    from green i to green j, i on the diagonal.
+    """
+    def __init__(self, phase_states):
+        self.phase_states = tuple(phase_states)
+        self.green = tuple(i for i, state in enumerate(self.phase_states)
+                           if 'y' not in state and state.count('r') + state.count('s') != len(state))
+        n = len(self.green)
+        chars = np.array([list(self.phase_states[i]) for i in self.green], dtype='U1').reshape(n, -1)
+        is_green = (chars == 'G') | (chars == 'g')
+        is_red = (chars == 'r') | (chars == 's')
+        yellow = np.where(is_green[:, None, :] & is_red[None, :, :], 'y', chars[:, None, :])
+
+        self.states = [''.join(row) for row in chars]
+        self.transition = np.arange(n)[:, None].repeat(n, axis=1)
+        for i in range(n):
+            for j in range(n):
+                if i != j:
+                    self.transition[i, j] = len(self.states)
+                    self.states.append(''.join(yellow[i, j]))
+        self.states = tuple(self.states)
+
+    def getNumGreenPhases(self):
+        return len(self.green)
+
+    def getGreenState(self, green_index):
+        return self.states[green_index]
+
+    def getYellowState(self, from_green, to_green):
+        return self.states[self.transition[from_green, to_green]]
+
+    def getPhases(self, green_time, yellow_time):
+        # traci Phase objects of states, for a program logic that switches by setRedYellowGreenState
+        n = len(self.green)
+        return [traci.trafficlight.Phase(green_time if i < n else yellow_time, state) for i, state in enumerate(self.states)]
+
+    def getPhaseSections(self, sections):
+        # sections served by each green phase (empty: no detector section), from Section.phase_index
+        by_phase = {}
+        for section in sections:
+            by_phase.setdefault(section.phase_index, []).append(section)
+        return [by_phase.get(phase, []) for phase in self.green]
+
+
+@functools.lru_cache(maxsize=None)
+def compile_program(phase_states) -> SignalProgram:
+    """SignalProgram of a program's phase states (tuple), shared by every controller of the process."""
+    return SignalProgram(phase_states)
+
+
+
+class SignalWriteBatch:
+    """Traffic light set commands sent inside the block go to SUMO in one message.
+
+    TraCI answers a set command with its status only, so the commands are
+    queued and sent together before the next other request (usually
+    simulationStep) in their own message. Their status is checked there, a
+    failed write raises TraCIException before the step is sent. libsumo has
+    no messages, nothing is queued.
+    """
+    def __init__(self, connection):
+        self.connection = connection
+        self.send = getattr(connection, '_sendExact', None)
+        # queued set commands and their length in the message
+        self.pending = 0
+        self.length = 0
+
+    def __enter__(self):
+        if self.send is not None:
+            self.connection._sendExact = self._send
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.send is None:
+            return
+        del self.connection._sendExact
+        if exc_type is None:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.pending = self.length = 0
+            self.send()
+
+    def _send(self):
+        connection = self.connection
+        if connection._queue[-1] == tc.CMD_SET_TL_VARIABLE:
+            self.pending = len(connection._queue)
+            self.length = len(connection._string)
+            return None
+        if self.pending:
+            # the queued writes first, the new request after their status is read
+            string, queue = connection._string[self.length:], connection._queue[self.pending:]
+            connection._string, connection._queue = connection._string[:self.length], connection._queue[:self.pending]
+            self.flush()
+            connection._string, connection._queue = string, queue
+        return self.send()
@@ -11,19 +11,24 @@ from runrlbased2 import RunRLBased2
 from runrlbased3 import RunRLBased3
 from runrlbased4 import RunRLBased4
 from runrlbased5 import RunRLBased5
+from runrlmulti import RunRLMulti
 
 
 class SignalMode(Enum):
-    Static = (lambda: RunSimulation(config=Config_SUMO(), name="Static Control"), "Static Control")
-    Actuated = (lambda: RunActuated(config=Config_SUMO(), name="Actuated Control"), "Actuated Control")
-    ActuatedOCC = (lambda: RunActuatedOCC(config=Config_SUMO(), name="Actuated Control OCC"), "Actuated Control OCC")
-    ActuatedBOCC = (lambda: RunActuatedBOCC(config=Config_SUMO(), name="Actuated Control OCC"), "Actuated Control Bound OCC")
-    RLBased = (lambda: RunRLBased(config=Config_SUMO(), name="Reinforement Learning based Control"), "Reinforement Learning based Control")
-    RLBased2 = (lambda: RunRLBased2(config=Config_SUMO(), name="Reinforement Learning based Control"),"Reinforement Learning based Control 2")
-    RLBased3 = (lambda: RunRLBased3(config=Config_SUMO(), name="Reinforement Learning based Control"),"Reinforement Learning based Control 3")
-    RLBased4 = (lambda: RunRLBased4(config=Config_SUMO(), name="Reinforement Learning based Control"), "Reinforement Learning based Control 4")
-    RLBased5 = (lambda: RunRLBased5(config=Config_SUMO(), name="Reinforement Learning based Control"), "Reinforement Learning based Control 5")
-    DilemaZone = (lambda: RunDilemaZone(config=Config_SUMO(), name="DilemaZone Control"), "DilemaZone Control")
+    Static = (lambda config: RunSimulation(config=config, name="Static Control"), "Static Control")
+    Actuated = (lambda config: RunActuated(config=config, name="Actuated Control"), "Actuated Control")
+    ActuatedOCC = (lambda config: RunActuatedOCC(config=config, name="Actuated Control OCC"), "Actuated Control OCC")
+    ActuatedBOCC = (lambda config: RunActuatedBOCC(config=config, name="Actuated Control OCC"), "Actuated Control Bound OCC")
+    RLBased = (lambda config: RunRLBased(config=config, name="Reinforement Learning based Control"), "Reinforement Learning based Control")
+    RLBased2 = (lambda config: RunRLBased2(config=config, name="Reinforement Learning based Control"),"Reinforement Learning based Control 2")
+    RLBased3 = (lambda config: RunRLBased3(config=config, name="Reinforement Learning based Control"),"Reinforement Learning based Control 3")
+    RLBased4 = (lambda config: RunRLBased4(config=config, name="Reinforement Learning based Control"), "Reinforement Learning based Control 4")
+    RLBased5 = (lambda config: RunRLBased5(config=config, name="Reinforement Learning based Control"), "Reinforement Learning based Control 5")
+    RLMulti = (lambda config: RunRLMulti(config=config, name="Reinforement Learning based Control"), "Multi-agent Reinforcement Learning based Control")
+    DilemaZone = (lambda config: RunDilemaZone(config=config, name="DilemaZone Control"), "DilemaZone Control")
+
+    def create(self, config=None):
+        return self.value[0](Config_SUMO() if config is None else config)
 
     @classmethod
     def from_string(cls, string_value):
@@ -0,0 +1,114 @@
+"""
+Logging for the simulation modules.
+
+    getLogger(__name__)             per-module logger, use lazy %-formatting
+                                    (log.debug("x=%s", x)), disabled levels cost one level check
+    getRateLimitedLogger(__name__)  debug channel for per-step messages, at most one record per
+                                    call site and interval, suppressed records are counted
+    EventLog                        optional binary log of controller decisions (fixed-size records)
+
+The level comes from configure(level) or the SIM_LOG_LEVEL environment variable
+(default INFO, per-step messages are DEBUG). Without configure() only warnings are printed.
+"""
+
+import logging
+import os
+import time
+from enum import IntEnum
+
+import numpy as np
+
+LOG_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+
+def configure(level=None, fmt=LOG_FORMAT):
+    if level is None:
+        level = os.environ.get('SIM_LOG_LEVEL', 'INFO')
+    if isinstance(level, str):
+        level = logging.getLevelName(level.upper())
+    root = logging.getLogger()
+    if not root.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter(fmt))
+        root.addHandler(handler)
+    root.setLevel(level)
+
+
+def getLogger(name) -> logging.Logger:
+    return logging.getLogger(name)
+
+
+class RateLimitFilter(logging.Filter):
+    """Passes at most one record per call site (file, line) every interval seconds."""
+    def __init__(self, interval=1.0):
+        super().__init__()
+        self.interval = interval
+        self.sites = {}
+
+    def filter(self, record):
+        site = (record.pathname, record.lineno)
+        now = time.monotonic()
+        last, suppressed = self.sites.get(site, (None, 0))
+        if last is not None and now - last < self.interval:
+            self.sites[site] = (last, suppressed + 1)
+            return False
+        self.sites[site] = (now, 0)
+        if suppressed > 0:
+            record.msg = str(record.msg) + ' (%d similar suppressed)' % suppressed
+        return True
+
+
+def getRateLimitedLogger(name, interval=1.0) -> logging.Logger:
+    logger = logging.getLogger(name + '.ratelimited')
+    if not any(isinstance(f, RateLimitFilter) for f in logger.filters):
+        logger.addFilter(RateLimitFilter(interval))
+    return logger
+
+
+class EVENT(IntEnum):
+    GREEN_TIME = 1      # target: section id, value: green time set for the section
+    RL_ACTION = 2       # action: chosen action, value: green duration of the action phase, target: agent index (multi-agent)
+    PHASE_CHANGE = 3    # action: new green phase
+    GREEN_EXTEND = 4    # target: section id, value: extension count
+
+
+EVENT_DTYPE = np.dtype([('time', '<f8'), ('kind', '<u2'), ('target', '<i2'), ('action', '<i4'), ('value', '<f8')])
+
+
+class EventLog:
+    """Append-only binary decision log, records are buffered and written in blocks."""
+    def __init__(self, path, buffer_size=4096):
+        self.path = path
+        self.file = open(path, 'wb')
+        self.buffer = np.zeros(buffer_size, dtype=EVENT_DTYPE)
+        self.size = 0
+
+    def record(self, time, kind, target=-1, action=-1, value=0.0):
+        if self.size == len(self.buffer):
+            self.flush()
+        self.buffer[self.size] = (time, kind, target, action, value)
+        self.size += 1
+
+    def flush(self):
+        if self.size > 0:
+            self.buffer[:self.size].tofile(self.file)
+            self.size = 0
+        self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.flush()
+            self.file.close()
+            self.file = None
+
+    @staticmethod
+    def read(path):
+        return np.fromfile(path, dtype=EVENT_DTYPE)
+
+
+def openEventLog(path):
+    # None when decision logging is off (the default)
+    if path is None:
+        return None
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    return EventLog(path)
@@ -0,0 +1,44 @@
+"""
+Snapshots handed from the simulation thread to the GUI.
+
+Result columns are append-only, so the part filled by a completed
+Infra.update never changes afterwards. A snapshot keeps read-only views of
+exactly that part: taking one copies no data, and the GUI can read it while
+the simulation keeps appending.
+"""
+
+
+def _freeze(data):
+    view = data[:len(data)]
+    view.flags.writeable = False
+    return view
+
+
+class SectionSnapshot:
+    def __init__(self, section):
+        self.id = section.id
+        self.direction = section.direction
+        self.__columns = {key: _freeze(section.getDatabyID(key)) for key in section.COLUMNS}
+
+    def getDatabyID(self, id):
+        return self.__columns[id]
+
+
+class InfraSnapshot:
+    def __init__(self, infra, keys, seq):
+        # infra: run the snapshot belongs to, seq: number of published snapshots of that run
+        self.source = infra
+        self.seq = seq
+        self.sigType = infra.sigType
+        self.__time = _freeze(infra.getTime())
+        self.__columns = {key: _freeze(infra.getDatabyID(key)) for key in keys}
+        self.__sections = {section_id: SectionSnapshot(section) for section_id, section in infra.getSections().items()}
+
+    def getDatabyID(self, totalresult):
+        return self.__columns[totalresult]
+
+    def getTime(self):
+        return self.__time
+
+    def getSections(self) -> dict:
+        return self.__sections
@@ -0,0 +1,284 @@
+import math
+
+import numpy as np
+import traci
+import traci.constants as tc
+
+
+class VehicleIndex:
+    """Dense integer ids for vehicle ids.
+
+    Ids of vehicles that left the network are handed out again one step
+    later, so the index stays about as large as the number of vehicles in the
+    network at the same time.
+    """
+    def __init__(self, capacity=1024):
+        self.ids = {}
+        self.names = []
+        self.capacity = capacity
+        self._free = []
+        self._released = []
+
+    def intern(self, veh_id):
+        idx = self.ids.get(veh_id)
+        if idx is None:
+            if self._free:
+                idx = self._free.pop()
+                self.names[idx] = veh_id
+            else:
+                idx = len(self.names)
+                self.names.append(veh_id)
+                if idx >= self.capacity:
+                    self.capacity *= 2
+            self.ids[veh_id] = idx
+        return idx
+
+    def release(self, indices):
+        # reusable after the next step(), every VehicleSet has dropped them by then
+        names = self.names
+        for idx in indices:
+            del self.ids[names[idx]]
+            names[idx] = None
+        self._released.extend(indices)
+
+    def step(self):
+        self._free.extend(self._released)
+        self._released = []
+
+    def getName(self, idx):
+        return self.names[idx]
+
+
+class VehicleSet:
+    """Set of interned vehicles as a boolean array over the VehicleIndex ids."""
+    def __init__(self, index):
+        self.index = index
+        self.mask = np.zeros(index.capacity, dtype=bool)
+
+    def _fit(self):
+        if len(self.mask) < self.index.capacity:
+            mask = np.zeros(self.index.capacity, dtype=bool)
+            mask[:len(self.mask)] = self.mask
+            self.mask = mask
+
+    def add(self, indices):
+        if indices:
+            self._fit()
+            self.mask[list(indices)] = True
+
+    def discard(self, indices):
+        if indices:
+            self._fit()
+            self.mask[list(indices)] = False
+
+    def retain(self, alive):
+        # drops the vehicles that are not in alive (vehicles that left the network)
+        self._fit()
+        size = len(alive)
+        self.mask[:size] &= alive
+        self.mask[size:] = False
+        return self.mask[:size]
+
+    def getIndices(self):
+        return np.flatnonzero(self.mask)
+
+    def getNames(self):
+        names = self.index.names
+        return [names[idx] for idx in np.flatnonzero(self.mask)]
+
+    def __len__(self):
+        return int(np.count_nonzero(self.mask))
+
+
+class SubscriptionCollector:
+    """Batched per-step TraCI data cache for Infra.update.
+
+    Induction loops and vehicles are subscribed once, so every
+    simulationStep response already carries all values the sections need and
+    reading them costs no extra round trip. Vehicles are interned to dense
+    integer ids (VehicleIndex), the numeric vehicle values of a step are kept
+    in arrays over these ids for vectorized section sums.
+    """
+    LOOP_VARS = (tc.LAST_STEP_VEHICLE_ID_LIST, tc.LAST_STEP_VEHICLE_NUMBER, tc.VAR_INTERVAL_SPEED)
+    VEHICLE_VARS = (tc.VAR_CO2EMISSION, tc.VAR_WAITING_TIME)
+    # vehicle values that are not one number, only in the per-vehicle dicts
+    OBJECT_VARS = frozenset((tc.VAR_POSITION, tc.VAR_POSITION3D, tc.VAR_TYPE, tc.VAR_VEHICLECLASS, tc.VAR_ROAD_ID,
+                             tc.VAR_LANE_ID, tc.VAR_ROUTE_ID))
+    SIMULATION_VARS = (tc.VAR_TIME, tc.VAR_DEPARTED_VEHICLES_IDS)
+
+    def __init__(self, detector_ids, vehicle_vars=None):
+        self.detector_ids = list(detector_ids)
+        self.vehicle_vars = self.VEHICLE_VARS if vehicle_vars is None else tuple(vehicle_vars)
+        self.array_vars = tuple(var for var in self.vehicle_vars if var not in self.OBJECT_VARS)
+        self.time = 0
+        self.loops = {}
+        self.vehicles = {}
+        # per-step sums over all vehicles, computed on first use
+        self.totals = {}
+        self.index = VehicleIndex()
+        # ids of vehicles gone from the network, released once no loop reports them: the loops still report
+        # a vehicle after it left and the detectors compare the ids with their previous step
+        self.leaving = set()
+        self.alive = np.zeros(self.index.capacity, dtype=bool)
+        self.values = {var: np.zeros(self.index.capacity) for var in self.array_vars}
+
+    def subscribe(self):
+        traci.simulation.subscribe(self.SIMULATION_VARS)
+        for det_id in self.detector_ids:
+            traci.inductionloop.subscribe(det_id, self.LOOP_VARS)
+        for veh in traci.vehicle.getIDList():
+            traci.vehicle.subscribe(veh, self.vehicle_vars)
+
+    def update(self):
+        sim = traci.simulation.getSubscriptionResults()
+        if not sim:
+            # subscriptions belong to the connection, a (re)started SUMO has none yet
+            self.subscribe()
+            sim = traci.simulation.getSubscriptionResults()
+        else:
+            for veh in sim[tc.VAR_DEPARTED_VEHICLES_IDS]:
+                traci.vehicle.subscribe(veh, self.vehicle_vars)
+
+        self.time = sim[tc.VAR_TIME]
+        self.loops = traci.inductionloop.getAllSubscriptionResults()
+        # vehicles departed in this step are included, subscribe() returns their current values
+        self.vehicles = traci.vehicle.getAllSubscriptionResults()
+        self.indexVehicles()
+
+    def indexVehicles(self):
+        # per-step arrays over the interned ids of self.vehicles
+        index = self.index
+        index.step()
+        vehicles = self.vehicles
+        if self.leaving:
+            # a loop reports a vehicle that arrived on it for two steps, its id is kept as long
+            reported = {veh for data in self.loops.values() for veh in data.get(tc.LAST_STEP_VEHICLE_ID_LIST, ())}
+            names = index.names
+            index.release([idx for idx in self.leaving if names[idx] not in vehicles and names[idx] not in reported])
+            self.leaving = {idx for idx in self.leaving if names[idx] in reported}
+        ids = np.fromiter(map(index.intern, vehicles), dtype=np.intp, count=len(vehicles))
+        if len(self.alive) < index.capacity:
+            size = index.capacity
+            self.alive = np.concatenate([self.alive, np.zeros(size - len(self.alive), dtype=bool)])
+            self.values = {var: np.zeros(size) for var in self.array_vars}
+        alive = np.zeros(len(self.alive), dtype=bool)
+        alive[ids] = True
+        self.leaving.update(np.flatnonzero(self.alive & ~alive).tolist())
+        self.alive = alive
+        for var, values in self.values.items():
+            values.fill(0)
+            values[ids] = np.fromiter((data[var] for data in vehicles.values()), dtype=np.float64, count=len(vehicles))
+        self.totals = {}
+
+    def getTime(self):
+        return self.time
+
+    def getLoopData(self, det_id):
+        # vehicle ids as interned integers
+        data = self.loops[det_id]
+        ids = tuple(map(self.index.intern, data[tc.LAST_STEP_VEHICLE_ID_LIST]))
+        alive = self.alive
+        for idx in ids:
+            if idx >= len(alive) or not alive[idx]:
+                # not in the network any more, the id is released with the ones that left
+                self.leaving.add(idx)
+        return ids, data[tc.LAST_STEP_VEHICLE_NUMBER], data[tc.VAR_INTERVAL_SPEED]
+
+    def getVehicle(self, veh_id):
+        # None when the vehicle has left the network
+        return self.vehicles.get(veh_id)
+
+    def getVehicleIDs(self):
+        return self.vehicles.keys()
+
+    def getVehicleValues(self, var):
+        # values by interned id, 0 for ids without a vehicle in this step
+        return self.values[var]
+
+    def getVehicleTotal(self, var):
+        total = self.totals.get(var)
+        if total is None:
+            if var in self.values:
+                total = float(self.values[var].sum())
+            else:
+                total = 0
+                for data in self.vehicles.values():
+                    total += data[var]
+            self.totals[var] = total
+        return total
+
+    def getTotalCO2(self):
+        # whole network CO2 of the current step (mg/s)
+        return self.getVehicleTotal(tc.VAR_CO2EMISSION)
+
+
+class IntervalCollector(SubscriptionCollector):
+    """SubscriptionCollector for runs advanced several seconds per simulationStep (Config_SUMO.fast_forward).
+
+    SUMO reports the subscribed values of the last step of a jump only. The
+    loops report the vehicles of their current aggregation interval instead
+    (VAR_INTERVAL_IDS) and the ones not counted before are the vehicles of the
+    jump, so a jump must not span more than one detector period. SUMO leaves
+    vehicles that change lanes on a loop out of the interval ids, a
+    step-by-step run counts them (the station volumes differ). Vehicles
+    departed during the jump are taken from the vehicle id list, CO2 values
+    are the emission of the whole jump (last step rate times its length).
+    """
+    LOOP_VARS = (tc.VAR_INTERVAL_IDS, tc.VAR_LAST_INTERVAL_IDS, tc.VAR_INTERVAL_SPEED)
+
+    def __init__(self, detector_ids, vehicle_vars=None, periods=None):
+        super().__init__(detector_ids, vehicle_vars)
+        # detector id -> aggregation period (s)
+        self.periods = dict(zip(self.detector_ids, periods)) if periods is not None else {}
+        # seconds since the previous update
+        self.dt = 1
+        # per detector: interval number and the vehicles of the interval counted so far
+        self.intervals = {}
+        self.counted = {}
+        self.passed = {}
+
+    def getMaxJump(self):
+        return min(self.periods.values(), default=math.inf)
+
+    def update(self):
+        sim = traci.simulation.getSubscriptionResults()
+        if not sim:
+            self.subscribe()
+            sim = traci.simulation.getSubscriptionResults()
+        else:
+            subscribed = traci.vehicle.getAllSubscriptionResults()
+            for veh in traci.vehicle.getIDList():
+                if veh not in subscribed:
+                    traci.vehicle.subscribe(veh, self.vehicle_vars)
+
+        self.dt = sim[tc.VAR_TIME] - self.time
+        self.time = sim[tc.VAR_TIME]
+        self.loops = traci.inductionloop.getAllSubscriptionResults()
+        self.vehicles = traci.vehicle.getAllSubscriptionResults()
+        self.indexVehicles()
+        self.countLoops()
+        if tc.VAR_CO2EMISSION in self.values:
+            self.values[tc.VAR_CO2EMISSION] *= self.dt
+
+    def countLoops(self):
+        # vehicles that passed each loop since the previous update, as interned ids
+        intern = self.index.intern
+        for det_id, data in self.loops.items():
+            interval = self.time // self.periods.get(det_id, math.inf)
+            counted = self.counted.get(det_id, ())
+            passed = []
+            if interval != self.intervals.get(det_id):
+                # the interval ended during the jump, its last vehicles are in the previous interval
+                passed = [veh for veh in data[tc.VAR_LAST_INTERVAL_IDS] if veh not in counted]
+                self.intervals[det_id] = interval
+                counted = self.counted[det_id] = set()
+            passed += [veh for veh in data[tc.VAR_INTERVAL_IDS] if veh not in counted]
+            counted.update(passed)
+            self.passed[det_id] = tuple(map(intern, passed))
+        # vehicles that left the network during the jump are counted, their ids are freed in the next update
+        alive = self.alive
+        self.leaving.update(idx for passed in self.passed.values() for idx in passed if idx >= len(alive) or not alive[idx])
+
+    def getLoopData(self, det_id):
+        passed = self.passed[det_id]
+        return passed, len(passed), self.loops[det_id][tc.VAR_INTERVAL_SPEED]
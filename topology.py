@@ -0,0 +1,320 @@
+"""
+Detector/station/section topology of a scenario, parsed once from the network files.
+
+    detector     -> lane -> edge -> (TLS, link indices) -> green phases, stop line
+    station      -> detectors, input role
+    section      -> stations, input station, TLS and green phase
+    intersection -> TLS id, sections, phases
+
+Detectors named Det_<aux><bound><station><detector> form the sections of
+the test junction (Direction bounds). Other detectors are grouped by the
+TLS approach their lane leads to: one section per approach edge
+('<tls>/<edge>') with an exit station (the loops nearest the stop line of
+the approach edge) and an input station (the loops upstream of them, on the
+approach edge or on edges leading to it).
+
+The additional file (induction loops) and the net file (lanes, TLS links and
+programs) are read with a streaming XML parser. The result is cached on disk
+next to the scenario, keyed by the hash of the files it was built from, and
+in memory per process, so the per-step code only reads precomputed fields.
+"""
+
+import hashlib
+import math
+import os
+import pickle
+import xml.etree.ElementTree as ET
+from typing import Dict, NamedTuple, Optional, Tuple
+
+import simlog
+from Infra import Direction, get_input_station_value, parse_detector_id
+
+log = simlog.getLogger(__name__)
+
+TOPOLOGY_VERSION = 5
+CACHE_DIR = '__pycache__'
+# how far upstream of a TLS approach a detector may be to count as its input detector
+MAX_UPSTREAM_EDGES = 8
+# loops on the approach edge up to this far (m) behind the one nearest the stop line are exit detectors
+EXIT_LOOP_RANGE = 15.0
+
+
+class DetectorInfo(NamedTuple):
+    id: str
+    lane: str
+    edge: str
+    pos: float
+    aux: str
+    bound: Direction
+    station_id: str
+    detector_id: str
+    is_exit: bool
+    tls: Optional[str]
+    links: Tuple[int, ...]
+    green_phases: Tuple[int, ...]
+    # end point of the lane shape (x, y)
+    stop_line: Optional[Tuple[float, float]]
+    # aggregation period of the interval values (s), inf without one
+    period: float
+
+
+class StationInfo(NamedTuple):
+    id: str
+    section_id: str
+    detectors: Tuple[str, ...]
+    is_input: bool
+
+
+class SectionInfo(NamedTuple):
+    id: str
+    direction: Direction
+    stations: Tuple[str, ...]
+    input_station: Optional[str]
+    tls: Optional[str]
+    phase: int
+
+
+class IntersectionInfo(NamedTuple):
+    id: str
+    sections: Tuple[str, ...]
+    phases: Tuple[str, ...]
+
+
+class Topology:
+    def __init__(self, detectors, stations, sections, programs, intersections):
+        # dicts keep the order of the additional file
+        self.detectors: Dict[str, DetectorInfo] = detectors
+        self.stations: Dict[str, StationInfo] = stations
+        self.sections: Dict[str, SectionInfo] = sections
+        # TLS id -> phase states of its program in the net file
+        self.programs: Dict[str, Tuple[str, ...]] = programs
+        # TLS id -> sections it controls, only TLS with detector sections
+        self.intersections: Dict[str, IntersectionInfo] = intersections
+
+    def getDetectorIDs(self):
+        return list(self.detectors)
+
+    def getDetector(self, det_id) -> DetectorInfo:
+        return self.detectors[det_id]
+
+    def getStation(self, station_id) -> StationInfo:
+        return self.stations[station_id]
+
+    def getSection(self, section_id) -> SectionInfo:
+        return self.sections[section_id]
+
+    def getIntersection(self, tls_id) -> IntersectionInfo:
+        return self.intersections[tls_id]
+
+    def getTLSIDs(self):
+        return list(self.intersections)
+
+
+def _read_config_files(sumocfg_path):
+    # net file and additional files named in the .sumocfg, relative to it
+    base = os.path.dirname(sumocfg_path)
+    net_file = None
+    additional_files = []
+    for _, elem in ET.iterparse(sumocfg_path):
+        if elem.tag == 'net-file':
+            net_file = os.path.join(base, elem.get('value'))
+        elif elem.tag == 'additional-files':
+            additional_files = [os.path.join(base, f) for f in elem.get('value').replace(',', ' ').split()]
+    return net_file, additional_files
+
+
+def _parse_loops(add_file):
+    loops = []
+    for _, elem in ET.iterparse(add_file):
+        if elem.tag == 'inductionLoop':
+            period = elem.get('period', elem.get('freq'))
+            loops.append((elem.get('id'), elem.get('lane'), float(elem.get('pos', 0)), math.inf if period is None else float(period)))
+        elem.clear()
+    return loops
+
+
+def _parse_net(net_file, lanes):
+    # lanes: lane ids of interest -> (edge, lane index, shape end point, length), TLS links, edge successors and all TLS programs
+    lane_edges = {}
+    links = {}
+    successors = {}
+    programs = {}
+    edge = None
+    phases = None
+    for event, elem in ET.iterparse(net_file, events=('start', 'end')):
+        tag = elem.tag
+        if event == 'start':
+            if tag == 'edge':
+                edge = elem.get('id')
+            elif tag == 'tlLogic':
+                phases = []
+            continue
+        if tag == 'lane':
+            if elem.get('id') in lanes:
+                stop_line = tuple(float(v) for v in elem.get('shape').split()[-1].split(',')[:2])
+                lane_edges[elem.get('id')] = (edge, int(elem.get('index')), stop_line, float(elem.get('length')))
+        elif tag == 'phase' and phases is not None:
+            phases.append(elem.get('state'))
+        elif tag == 'tlLogic':
+            programs[elem.get('id')] = tuple(phases)
+            phases = None
+        elif tag == 'connection' and not elem.get('from').startswith(':'):
+            if elem.get('tl') is not None:
+                links.setdefault((elem.get('from'), int(elem.get('fromLane'))), []).append((elem.get('tl'), int(elem.get('linkIndex'))))
+            else:
+                successors.setdefault(elem.get('from'), set()).add(elem.get('to'))
+        if tag != 'phase':
+            elem.clear()
+    return lane_edges, links, successors, programs
+
+
+def _approach(edge, tls_edges, successors):
+    # first TLS controlled edge downstream of edge (following uncontrolled connections), None if there is none
+    seen = {edge}
+    frontier = [edge]
+    for _ in range(MAX_UPSTREAM_EDGES + 1):
+        for candidate in frontier:
+            if candidate in tls_edges:
+                return candidate
+        frontier = [succ for candidate in frontier for succ in successors.get(candidate, ()) if succ not in seen]
+        seen.update(frontier)
+    return None
+
+
+def _green_phases(program, link_indices):
+    return tuple(phase for phase, state in enumerate(program) if any(state[link] in 'Gg' for link in link_indices))
+
+
+def build_topology(net_file, add_file) -> Topology:
+    loops = _parse_loops(add_file)
+    lane_edges, lane_links, successors, programs = _parse_net(net_file, {lane for _, lane, _, _ in loops})
+
+    # TLS controlled edges: edge -> (tls, link indices of all its lanes)
+    tls_edges = {}
+    for (edge, _), tls_links in lane_links.items():
+        tls, indices = tls_edges.setdefault(edge, (tls_links[0][0], []))
+        indices.extend(link for tl, link in tls_links if tl == tls)
+
+    detectors = {}
+    generic = {}
+    # (detector id, section id, distance to the stop line) of the detectors without naming scheme
+    approach_loops = []
+    for det_id, lane, pos, period in loops:
+        edge, index, stop_line, length = lane_edges.get(lane, (None, None, None, None))
+        tls_links = lane_links.get((edge, index), [])
+        tls = tls_links[0][0] if tls_links else None
+        link_indices = tuple(link for tl, link in tls_links if tl == tls)
+        green = _green_phases(programs.get(tls, ()), link_indices)
+        try:
+            aux, bound, station_id, detector_id = parse_detector_id(det_id)
+        except ValueError:
+            # no naming scheme: the section is the TLS approach the detector lane leads to,
+            # input or exit is decided by the position along the approach (below)
+            approach = _approach(edge, tls_edges, successors)
+            if approach is None:
+                log.debug('detector %s does not lead to a traffic light, ignored', det_id)
+                continue
+            section_id = '%s/%s' % (tls_edges[approach][0], approach)
+            aux, bound, detector_id = '0', None, det_id
+            station_id = section_id + '/in'
+            generic.setdefault(section_id, approach)
+            # loops on edges upstream of the approach edge are input detectors
+            distance = length - (pos if pos >= 0 else length + pos) if edge == approach else math.inf
+            approach_loops.append((det_id, section_id, distance))
+        detectors[det_id] = DetectorInfo(det_id, lane, edge, pos, aux, bound, station_id, detector_id,
+                                         aux == '1', tls, link_indices, green, stop_line, period)
+
+    # the loops nearest the stop line of an approach are its exit detectors, the ones upstream of them its input
+    nearest = {}
+    for det_id, section_id, distance in approach_loops:
+        nearest[section_id] = min(distance, nearest.get(section_id, math.inf))
+    for det_id, section_id, distance in approach_loops:
+        if distance < math.inf and distance <= nearest[section_id] + EXIT_LOOP_RANGE:
+            detectors[det_id] = detectors[det_id]._replace(aux='1', station_id=section_id + '/out', is_exit=True)
+
+    station_detectors = {}
+    for det in detectors.values():
+        station_detectors.setdefault(det.station_id, []).append(det)
+    stations = {}
+    for station_id, dets in station_detectors.items():
+        if dets[0].bound is None:
+            section_id, role = station_id.rsplit('/', 1)
+            stations[station_id] = StationInfo(station_id, section_id, tuple(det.id for det in dets), role == 'in')
+        else:
+            stations[station_id] = StationInfo(station_id, station_id[1], tuple(det.id for det in dets),
+                                               station_id == get_input_station_value(dets[0].bound))
+
+    section_stations = {}
+    for station in stations.values():
+        section_stations.setdefault(station.section_id, []).append(station)
+    sections = {}
+    for section_id, members in section_stations.items():
+        direction = detectors[members[0].detectors[0]].bound
+        # the first station counts the section volume, the input station comes first without naming scheme
+        members.sort(key=lambda station: direction is not None or not station.is_input)
+        inputs = [station.id for station in members if station.is_input]
+        if direction is None:
+            approach = generic[section_id]
+            tls, links = tls_edges[approach]
+            green = _green_phases(programs.get(tls, ()), links)
+            # phase serving most of the approach's links
+            phase = max(green, key=lambda p: sum(programs[tls][p][link] in 'Gg' for link in links)) if green else 0
+        else:
+            # green phase: the phase that serves the lanes the section is left through (exit detectors)
+            tls, phase = None, direction.value[1]
+            for det_id in (det_id for station in members for det_id in station.detectors):
+                det = detectors[det_id]
+                if det.is_exit and det.tls is not None and det.green_phases:
+                    tls, phase = det.tls, det.green_phases[0]
+                    break
+            if tls is None and len(programs) == 1:
+                tls = next(iter(programs))
+        sections[section_id] = SectionInfo(section_id, direction, tuple(station.id for station in members),
+                                           inputs[0] if inputs else None, tls, phase)
+
+    intersections = {}
+    for section in sections.values():
+        if section.tls is None:
+            log.warning('section %s is not controlled by a traffic light, it is not part of an intersection', section.id)
+            continue
+        intersections.setdefault(section.tls, []).append(section.id)
+    intersections = {tls: IntersectionInfo(tls, tuple(section_ids), programs.get(tls, ()))
+                     for tls, section_ids in intersections.items()}
+    return Topology(detectors, stations, sections, programs, intersections)
+
+
+def _file_hash(paths):
+    digest = hashlib.sha1(str(TOPOLOGY_VERSION).encode())
+    for path in paths:
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+_loaded: Dict[str, Topology] = {}
+
+
+def load_topology(config) -> Topology:
+    """Topology of config's scenario (Config_SUMO), from the memory or disk cache when the files are unchanged."""
+    net_file, _ = _read_config_files(config.sumocfg_path)
+    add_file = os.path.join(config.scenario_path, config.scenario_file)
+    key = _file_hash([net_file, add_file])
+    topology = _loaded.get(key)
+    if topology is not None:
+        return topology
+
+    cache_path = os.path.join(config.scenario_path, CACHE_DIR, 'topology-%s.pickle' % key)
+    try:
+        with open(cache_path, 'rb') as f:
+            topology = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+        topology = build_topology(net_file, add_file)
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            with open(cache_path, 'wb') as f:
+                pickle.dump(topology, f, protocol=pickle.HIGHEST_PROTOCOL)
+        except OSError:
+            log.warning('topology cache %s could not be written', cache_path)
+        log.debug('topology built from %s and %s', net_file, add_file)
+    _loaded[key] = topology
+    return topology
@@ -0,0 +1,273 @@
+"""
+Record a TraCI session once, replay it without SUMO.
+
+    with TraceRecorder('run.trace'):        # real SUMO, every TraCI response is stored
+        controller = SignalMode.Static.create(config)
+        controller.run_simulation()
+
+    with TraceReplayer('run.trace'):        # no SUMO process, same traci.* calls
+        controller = SignalMode.Static.create(config)
+        controller.run_simulation()
+
+Recording happens below the traci API: the connection socket is wrapped and
+the raw response of every request is written to a gzip compressed trace, so
+every traci.* function (including subscriptions and simulationStep) works
+unchanged on replay. Requests are not stored, only their CRC32: a strict
+replay stops at the first request that differs from the recording (e.g. a
+controller that decides differently), see TraceDivergence.
+
+Each traci.start opens a session (sumo-rl opens more than one); sessions are
+replayed in the order they were started. libsumo has no socket to record.
+"""
+
+import gzip
+import json
+import os
+import struct
+import threading
+import zlib
+
+import traci
+import traci.connection
+from traci.connection import Connection, StepManager
+from traci.domain import DOMAINS
+from traci.exceptions import FatalTraCIError
+
+import simlog
+
+log = simlog.getLogger(__name__)
+
+MAGIC = b'TRCI'
+VERSION = 1
+# record: kind, session, payload length
+RECORD = struct.Struct('<cHI')
+EXCHANGE = struct.Struct('<I')
+SESSION = b'S'
+RESPONSE = b'X'
+
+
+class TraceDivergence(FatalTraCIError):
+    """The replayed program sent a request that was not recorded at this position."""
+
+
+class _RecordingSocket:
+    def __init__(self, sock, writer, session):
+        self._sock = sock
+        self._writer = writer
+        self._session = session
+        self._crc = None
+        self._response = []
+
+    def _flush(self):
+        if self._crc is not None:
+            self._writer.writeResponse(self._session, self._crc, b''.join(self._response))
+            self._response = []
+            self._crc = None
+
+    def send(self, data):
+        # one request per send, the response of the previous one is complete
+        self._flush()
+        self._crc = zlib.crc32(data)
+        return self._sock.send(data)
+
+    def recv(self, size):
+        data = self._sock.recv(size)
+        self._response.append(data)
+        return data
+
+    def close(self):
+        self._flush()
+        self._sock.close()
+
+    def __getattr__(self, name):
+        return getattr(self._sock, name)
+
+
+class TraceRecorder:
+    """Writes every TraCI session started while active to one trace file."""
+    def __init__(self, path, compresslevel=6):
+        self.path = path
+        self.compresslevel = compresslevel
+        self.file = None
+        self.sessions = 0
+        self.exchanges = 0
+        self._lock = threading.Lock()
+        self._start = None
+        self._hook = None
+        self._pending = None
+
+    def writeSession(self, meta):
+        payload = json.dumps(meta).encode('utf8')
+        with self._lock:
+            session = self.sessions
+            self.sessions += 1
+            self.file.write(RECORD.pack(SESSION, session, len(payload)))
+            self.file.write(payload)
+        return session
+
+    def writeResponse(self, session, crc, response):
+        with self._lock:
+            self.file.write(RECORD.pack(RESPONSE, session, EXCHANGE.size + len(response)))
+            self.file.write(EXCHANGE.pack(crc))
+            self.file.write(response)
+            self.exchanges += 1
+
+    def _connected(self, conn):
+        if self._hook is not None:
+            self._hook(conn)
+        meta = self._pending or {}
+        meta['label'] = conn.getLabel()
+        conn._socket = _RecordingSocket(conn._socket, self, self.writeSession(meta))
+
+    def start(self):
+        if getattr(traci, 'isLibsumo', lambda: False)():
+            raise RuntimeError("libsumo runs have no TraCI socket to record")
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.file = gzip.open(self.path, 'wb', compresslevel=self.compresslevel)
+        self.file.write(MAGIC + struct.pack('<H', VERSION))
+        recorder = self
+        self._start = start = traci.start
+
+        def recording_start(cmd, *args, **kwargs):
+            recorder._pending = {'cmd': [str(arg) for arg in cmd]}
+            try:
+                return start(cmd, *args, **kwargs)
+            finally:
+                recorder._pending = None
+        traci.start = recording_start
+        self._hook = traci.connection._connectHook
+        traci.connection._connectHook = self._connected
+        return self
+
+    def stop(self):
+        traci.start = self._start
+        traci.connection._connectHook = self._hook
+        self.file.close()
+        log.info('recorded %d TraCI sessions, %d responses to %s', self.sessions, self.exchanges, self.path)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+
+def load_trace(path):
+    """Returns [(meta, [(crc, response), ...]), ...], responses are views into one buffer."""
+    with gzip.open(path, 'rb') as f:
+        data = memoryview(f.read())
+    if bytes(data[:4]) != MAGIC:
+        raise ValueError("%s is not a TraCI trace" % path)
+    version = struct.unpack_from('<H', data, 4)[0]
+    if version != VERSION:
+        raise ValueError("%s: unsupported trace version %d" % (path, version))
+
+    sessions = []
+    pos = 6
+    while pos < len(data):
+        kind, session, length = RECORD.unpack_from(data, pos)
+        pos += RECORD.size
+        if kind == SESSION:
+            sessions.append((json.loads(bytes(data[pos:pos + length])), []))
+        else:
+            crc = EXCHANGE.unpack_from(data, pos)[0]
+            sessions[session][1].append((crc, data[pos + EXCHANGE.size:pos + length]))
+        pos += length
+    return sessions
+
+
+class _ReplaySocket:
+    def __init__(self, exchanges, strict, label):
+        self._exchanges = exchanges
+        self._strict = strict
+        self._label = label
+        self._next = 0
+        self._response = None
+        self._pos = 0
+
+    def send(self, data):
+        if self._next >= len(self._exchanges):
+            raise TraceDivergence("session '%s': request %d was not recorded (trace ends)" % (self._label, self._next))
+        crc, self._response = self._exchanges[self._next]
+        if self._strict and zlib.crc32(data) != crc:
+            raise TraceDivergence("session '%s': request %d differs from the recording" % (self._label, self._next))
+        self._next += 1
+        self._pos = 0
+        return len(data)
+
+    def recv(self, size):
+        data = self._response[self._pos:self._pos + size]
+        self._pos += len(data)
+        return bytes(data)
+
+    def setsockopt(self, *args):
+        pass
+
+    def close(self):
+        pass
+
+
+class ReplayConnection(Connection):
+    """A traci Connection answered from a recorded session instead of a SUMO socket."""
+    def __init__(self, exchanges, label, strict=True):
+        StepManager.__init__(self)
+        if label in traci.connection._connections:
+            raise FatalTraCIError("Connection '%s' is already active." % label)
+        # same state as Connection.__init__, without connecting
+        self._socket = _ReplaySocket(exchanges, strict, label)
+        self._process = None
+        self._string = bytes()
+        self._queue = []
+        self._subscriptionMapping = {}
+        self._lock = threading.Lock()
+        for domain in DOMAINS:
+            domain._register(self, self._subscriptionMapping)
+        self._label = label
+        if label is not None:
+            traci.connection._connections[label] = self
+
+
+class TraceReplayer:
+    """Serves traci.start from a trace, no SUMO process is started while active."""
+    def __init__(self, path, strict=True):
+        self.path = path
+        self.strict = strict
+        self.sessions = load_trace(path)
+        self.next = 0
+        self._start = None
+
+    def _replay_start(self, cmd, port=None, numRetries=None, label="default", *args, doSwitch=True, **kwargs):
+        if self.next >= len(self.sessions):
+            raise FatalTraCIError("%s: no recorded session left for traci.start(label=%r)" % (self.path, label))
+        meta, exchanges = self.sessions[self.next]
+        self.next += 1
+        log.debug('replaying session %d (recorded label %s) as %s', self.next - 1, meta.get('label'), label)
+        conn = ReplayConnection(exchanges, label, self.strict)
+        if doSwitch:
+            traci.switch(label)
+        return conn.getVersion()
+
+    def start(self):
+        self._start = traci.start
+        traci.start = self._replay_start
+        return self
+
+    def stop(self):
+        traci.start = self._start
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+
+def session(config):
+    # recorder/replayer for Config_SUMO.traci_record / traci_replay, None when neither is set
+    if config.traci_replay is not None:
+        return TraceReplayer(config.traci_replay)
+    if config.traci_record is not None:
+        return TraceRecorder(config.traci_record)
+    return None
@@ -0,0 +1,145 @@
+import argparse
+import importlib
+import os
+
+import gymnasium as gym
+
+import simlog
+from Infra import Config_SUMO
+from RunSimulation import RunSimulation
+
+# controller module and the SumoEnvironment settings its policy is used with
+VARIANTS = {
+    'RLBased2': ('runrlbased2', dict(yellow_time=4, min_green=5, max_green=120), True),
+    'RLBased3': ('runrlbased3', dict(yellow_time=4, min_green=32, max_green=120), False),
+    'RLBased4': ('runrlbased4', dict(yellow_time=4, min_green=32, max_green=60), True),
+    'RLBased5': ('runrlbased5', dict(yellow_time=4, min_green=32, max_green=60), True),
+}
+
+
+class InfraBuilder(RunSimulation):
+    """Builds the section/station/detector Infra without starting SUMO (the environment starts it)."""
+    def __init__(self, config, name):
+        super().__init__(config, name, isExternalSignal=True)
+
+    def preinit(self):
+        pass
+
+
+class TrainingEnv(gym.Wrapper):
+    """One training worker: own TraCI label, own seed sequence and a fresh Infra per episode."""
+    def __init__(self, env, config, name, label, seed, seed_stride):
+        super().__init__(env)
+        self.config = config
+        self.name = name
+        self.seed = seed
+        self.seed_stride = seed_stride
+        self.episodes = 0
+        # connection label used by SumoEnvironment when it starts SUMO
+        self.env.unwrapped.label = label
+
+    def reset(self, seed=None, options=None):
+        # the results of one episode are not needed any more, start with empty columns
+        self.env.unwrapped._cust_infra = InfraBuilder(self.config, self.name).getInfra()
+        if seed is not None:
+            self.seed = seed
+        episode_seed = self.seed + self.episodes * self.seed_stride
+        self.episodes += 1
+        return self.env.reset(seed=episode_seed, options=options)
+
+
+def make_env(variant, rank, seed, seed_stride, route_file=None, max_step=None, label_prefix="train"):
+    # executed in the worker process
+    module_name, env_kwargs, custom_observation = VARIANTS[variant]
+    module = importlib.import_module(module_name)
+
+    config = Config_SUMO()
+    config.use_gui = False
+    if route_file is not None:
+        config.route_file = route_file
+        config.route_file_rl = os.path.join(config.scenario_path, route_file)
+    if max_step is not None:
+        config.max_step = max_step
+
+    kwargs = dict(env_kwargs)
+    if custom_observation:
+        kwargs['observation_class'] = module.CO2ObservationFunction
+    env = module.CustomSumoEnvironment(
+        net_file=config.scenario_file_rl,
+        single_agent=True,
+        route_file=config.route_file_rl,
+        use_gui=False,
+        num_seconds=config.max_step,
+        sumo_warnings=False,
+        additional_sumo_cmd="--no-step-log",
+        sumo_seed=seed + rank,
+        simInfra=InfraBuilder(config, 'RL_Train').getInfra(),
+        **kwargs
+    )
+    return TrainingEnv(env, config, 'RL_Train', "%s_%d" % (label_prefix, rank), seed + rank, seed_stride)
+
+
+def train(variant, n_envs=None, total_timesteps=100_000, seed=0, route_file=None, max_step=None,
+          output_dir="training", checkpoint_freq=10_000, eval_freq=20_000, eval_episodes=1, init_model=None):
+    """Train a DQN policy for a RunRLBased controller with n_envs SUMO workers.
+
+    checkpoint_freq and eval_freq are counted in total environment steps over all workers.
+    """
+    from stable_baselines3 import DQN
+    from stable_baselines3.common.callbacks import CallbackList, CheckpointCallback, EvalCallback
+    from stable_baselines3.common.vec_env import SubprocVecEnv, VecMonitor
+
+    n_envs = n_envs or os.cpu_count()
+    os.makedirs(output_dir, exist_ok=True)
+
+    env_fns = [lambda rank=rank: make_env(variant, rank, seed, n_envs, route_file, max_step) for rank in range(n_envs)]
+    vec_env = VecMonitor(SubprocVecEnv(env_fns, start_method="spawn"), os.path.join(output_dir, "train_monitor.csv"))
+    # evaluation runs in its own worker as well, the training process never talks to SUMO itself
+    eval_env = VecMonitor(SubprocVecEnv([lambda: make_env(variant, 0, seed + 1_000_000, 1, route_file, max_step, "eval")],
+                                        start_method="spawn"))
+
+    if init_model is not None:
+        model = DQN.load(init_model, env=vec_env)
+    else:
+        model = DQN("MlpPolicy", vec_env, seed=seed, verbose=1, tensorboard_log=None)
+
+    callbacks = CallbackList([
+        CheckpointCallback(save_freq=max(checkpoint_freq // n_envs, 1),
+                           save_path=os.path.join(output_dir, "checkpoints"), name_prefix="dqn_" + variant),
+        EvalCallback(eval_env, n_eval_episodes=eval_episodes, eval_freq=max(eval_freq // n_envs, 1),
+                     best_model_save_path=os.path.join(output_dir, "best"), log_path=os.path.join(output_dir, "eval"),
+                     deterministic=True),
+    ])
+    try:
+        model.learn(total_timesteps=total_timesteps, callback=callbacks)
+        path = os.path.join(output_dir, "dqn_%s_final.zip" % variant)
+        model.save(path)
+    finally:
+        vec_env.close()
+        eval_env.close()
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train the DQN policy of a RunRLBased controller with parallel SUMO workers")
+    parser.add_argument("variant", choices=sorted(VARIANTS), help="controller whose environment is trained")
+    parser.add_argument("--envs", type=int, default=None, help="SUMO worker processes (default: number of cores)")
+    parser.add_argument("--timesteps", type=int, default=100_000, help="total agent steps over all workers")
+    parser.add_argument("--seed", type=int, default=0, help="base seed, worker i uses seed + i")
+    parser.add_argument("--route", default=None, help="route file in the scenario directory")
+    parser.add_argument("--steps", type=int, default=None, help="simulated seconds per episode (default: Config_SUMO.max_step)")
+    parser.add_argument("--output-dir", default="training")
+    parser.add_argument("--checkpoint-freq", type=int, default=10_000)
+    parser.add_argument("--eval-freq", type=int, default=20_000)
+    parser.add_argument("--eval-episodes", type=int, default=1)
+    parser.add_argument("--init-model", default=None, help="continue training from a saved model")
+    args = parser.parse_args(argv)
+
+    simlog.configure()
+    path = train(args.variant, args.envs, args.timesteps, args.seed, args.route, args.steps, args.output_dir,
+                 args.checkpoint_freq, args.eval_freq, args.eval_episodes, args.init_model)
+    simlog.getLogger(__name__).info('model saved at %s', path)
+
+
+if __name__ == '__main__':
+    main()